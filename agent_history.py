@@ -0,0 +1,192 @@
+# agent_history.py
+"""
+Bounded in-memory history for the autonomous agent.
+
+Alert and action records are `__slots__` objects with float timestamps
+(no per-record dict, no ISO strings), held in fixed-capacity ring buffers:
+appends are O(1) and overwrite the oldest record once full, so the history
+can cover days of alerts at a bounded, small footprint. `to_dict()` gives
+the JSON shape the API has always returned.
+"""
+
+import sys
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+
+class RingBuffer:
+    """Fixed-capacity buffer that overwrites its oldest item; iterates oldest first"""
+
+    __slots__ = ("capacity", "_items", "_next", "_size", "total")
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._items = [None] * capacity
+        self._next = 0          # slot the next append writes to
+        self._size = 0
+        self.total = 0          # appends over the buffer's lifetime
+
+    def append(self, item):
+        """Add an item; returns the item it overwrote (None while not full)"""
+        evicted = self._items[self._next] if self._size == self.capacity else None
+        self._items[self._next] = item
+        self._next = (self._next + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+        self.total += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator:
+        start = (self._next - self._size) % self.capacity
+        for offset in range(self._size):
+            yield self._items[(start + offset) % self.capacity]
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ring buffer index out of range")
+        return self._items[(self._next - self._size + index) % self.capacity]
+
+    def recent(self, count: int) -> List:
+        """The newest `count` items, oldest first"""
+        count = min(max(count, 0), self._size)
+        return [self._items[(self._next - count + offset) % self.capacity] for offset in range(count)]
+
+    def since(self, timestamp: float) -> List:
+        """Items whose `timestamp` is at or after `timestamp`, oldest first (items are appended in time order)"""
+        items = []
+        for offset in range(1, self._size + 1):
+            item = self._items[(self._next - offset) % self.capacity]
+            if item.timestamp < timestamp:
+                break
+            items.append(item)
+        items.reverse()
+        return items
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+class AlertRecord:
+    """One processed alert (or alert group) in agent memory"""
+
+    __slots__ = ("alert_type", "service", "timestamp", "severity", "resolved", "solution_found",
+                 "response_quality", "count")
+
+    def __init__(self, alert_type: str, service: str, timestamp: float, severity: str = "medium",
+                 resolved: bool = False, solution_found: bool = False, response_quality: str = "n/a",
+                 count: int = 1):
+        # Interned: the same few names repeat across thousands of records
+        self.alert_type = sys.intern(str(alert_type))
+        self.service = sys.intern(str(service))
+        self.timestamp = timestamp
+        self.severity = sys.intern(str(severity))
+        self.resolved = resolved
+        self.solution_found = solution_found
+        self.response_quality = sys.intern(response_quality)
+        self.count = count
+
+    def to_row(self) -> list:
+        """Compact positional form for persistence"""
+        return [self.alert_type, self.service, self.timestamp, self.severity, self.resolved,
+                self.solution_found, self.response_quality, self.count]
+
+    @classmethod
+    def from_row(cls, row: list) -> "AlertRecord":
+        return cls(*row)
+
+    def to_dict(self) -> dict:
+        return {
+            "type": self.alert_type,
+            "service": self.service,
+            "timestamp": _iso(self.timestamp),
+            "severity": self.severity,
+            "resolved": self.resolved,
+            "solution_found": self.solution_found,
+            "response_quality": self.response_quality,
+            "count": self.count,
+        }
+
+
+class ActionRecord:
+    """One autonomous action taken by the agent"""
+
+    __slots__ = ("issue_type", "context", "timestamp", "action_id", "system", "severity", "result")
+
+    def __init__(self, issue_type: str, context: dict, timestamp: float, action_id: str,
+                 system: str = "unknown", severity: str = "medium", result: Optional[str] = None):
+        self.issue_type = sys.intern(issue_type)
+        self.context = context
+        self.timestamp = timestamp
+        self.action_id = action_id
+        self.system = sys.intern(str(system))
+        self.severity = sys.intern(str(severity))
+        self.result = result
+
+    @property
+    def succeeded(self) -> bool:
+        return bool(self.result) and self.result.startswith("Success")
+
+    def to_row(self) -> list:
+        """Compact positional form for persistence"""
+        return [self.issue_type, self.context, self.timestamp, self.action_id, self.system, self.severity, self.result]
+
+    @classmethod
+    def from_row(cls, row: list) -> "ActionRecord":
+        return cls(*row)
+
+    def to_dict(self) -> dict:
+        return {
+            "issue_type": self.issue_type,
+            "context": self.context,
+            "timestamp": _iso(self.timestamp),
+            "action_id": self.action_id,
+            "system": self.system,
+            "severity": self.severity,
+            "result": self.result,
+        }
+
+
+if __name__ == "__main__":
+    # Footprint of 100k alert records: old list of dicts vs. slotted records in a ring buffer
+    import time
+    import tracemalloc
+
+    count = 100_000
+    names = [f"HighCPU{i}" for i in range(20)]
+    services = [f"service-{i}" for i in range(10)]
+
+    tracemalloc.start()
+    history = []
+    for i in range(count):
+        history.append({"type": names[i % 20], "service": services[i % 10],
+                        "timestamp": datetime.now().isoformat(), "severity": "high", "resolved": True,
+                        "solution_found": True, "response_quality": "high", "count": 1})
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    del history
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    ring = RingBuffer(count)
+    for i in range(count):
+        ring.append(AlertRecord(names[i % 20], services[i % 10], time.time(), "high", True, True, "high"))
+    append_seconds = time.perf_counter() - started
+    ring_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"dict records: {dict_bytes / count:.0f} bytes/record")
+    print(f"slotted records in ring buffer: {ring_bytes / count:.0f} bytes/record "
+          f"({append_seconds / count * 1e6:.2f} µs/append)")
@@ -0,0 +1,230 @@
+# agent_leader.py
+"""
+Leader election for the agent's scheduled jobs when several uvicorn workers
+(or containers on one host) run the same app.
+
+Every worker polls an exclusive, non-blocking `flock` on a shared lock file.
+The worker that holds it is the leader and runs the AgentScheduler; the
+others only serve requests. The kernel drops the lock when the leader's
+process exits (crash, OOM kill, deploy), so another worker takes over on
+its next poll, within `poll_interval` seconds. No lease renewal, no clock
+skew: the lock lives exactly as long as the process holding it.
+
+Whether monitoring should run at all is a separate, shared flag
+(`should_run`), so a start/stop request handled by any worker reaches the
+leader.
+"""
+
+import asyncio
+import os
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; every process is its own leader there
+    fcntl = None
+
+
+class FileLeaderElection:
+    """Leadership = holding an exclusive flock on `path`"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Take leadership if nobody holds it; never blocks"""
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = True
+            return True
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            self._file.truncate(0)
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+        self._file = None
+
+    def holder(self) -> Optional[int]:
+        """PID of the current leader, if any"""
+        try:
+            with open(self.path) as lock_file:
+                content = lock_file.read().strip()
+        except OSError:
+            return None
+        return int(content) if content.isdigit() else None
+
+
+class LeaderElectedScheduler:
+    """
+    Runs `scheduler` (and any `companions`, components with async start() /
+    stop() that must also run once per deployment) only in the leader process
+    and only while `should_run()` is true. `reconcile()` applies a change
+    immediately; the poll loop picks up leadership changes and flags set by
+    other workers.
+    """
+
+    def __init__(self, scheduler, election: FileLeaderElection, should_run: Callable[[], bool],
+                 poll_interval: float = 2.0, companions=()):
+        self.scheduler = scheduler
+        self.companions = list(companions)
+        self.election = election
+        self.should_run = should_run
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._reconcile_lock: Optional[asyncio.Lock] = None
+        self.elections_won = 0
+
+    @property
+    def is_leader(self) -> bool:
+        return self.election.is_leader
+
+    async def reconcile(self) -> bool:
+        """Start or stop the scheduler to match leadership and the shared flag; returns is_leader"""
+        if self._reconcile_lock is None:
+            self._reconcile_lock = asyncio.Lock()
+        async with self._reconcile_lock:
+            try:
+                wanted = await asyncio.to_thread(self.should_run)
+            except Exception as e:
+                print(f"⚠️ Leader election: could not read the monitoring flag: {e}")
+                return self.is_leader
+            if wanted:
+                if not self.election.is_leader and self.election.try_acquire():
+                    self.elections_won += 1
+                    print(f"👑 Leader election: process {os.getpid()} is now the scheduler leader")
+                if self.election.is_leader and not self.scheduler.running:
+                    try:
+                        await self._start_all()
+                    except Exception as e:
+                        # Hand the lock over rather than hold it with nothing running
+                        print(f"❌ Leader election: starting the scheduler failed, stepping down: {e}")
+                        await self._stop_all()
+                        self.election.release()
+            else:
+                if self.scheduler.running:
+                    await self._stop_all()
+                if self.election.is_leader:
+                    self.election.release()
+                    print(f"👑 Leader election: process {os.getpid()} stepped down (monitoring disabled)")
+            return self.is_leader
+
+    async def _start_all(self):
+        await self.scheduler.start()
+        for companion in self.companions:
+            await companion.start()
+
+    async def _stop_all(self):
+        for companion in reversed(self.companions):
+            try:
+                await companion.stop()
+            except Exception as e:
+                print(f"⚠️ Leader election: failed to stop {type(companion).__name__}: {e}")
+        try:
+            await self.scheduler.stop()
+        except Exception as e:
+            print(f"⚠️ Leader election: failed to stop the scheduler: {e}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                print(f"⚠️ Leader election: reconcile failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="agent-leader-election")
+
+    async def stop(self):
+        """Stop polling, stop the scheduler and hand leadership to another worker"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._stop_all()
+        self.election.release()
+
+    def stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "leader_pid": self.election.holder(),
+            "lock_path": self.election.path,
+            "poll_interval_seconds": self.poll_interval,
+            "elections_won": self.elections_won,
+        }
+
+
+if __name__ == "__main__":
+    # Failover check: three "workers" in one process, the leader steps down, another takes over
+    import tempfile
+
+    class _Scheduler:
+        def __init__(self):
+            self.running = False
+
+        async def start(self):
+            self.running = True
+
+        async def stop(self):
+            self.running = False
+
+    async def _demo():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "leader.lock")
+            workers = [LeaderElectedScheduler(_Scheduler(), FileLeaderElection(path), lambda: True, 0.05)
+                       for _ in range(3)]
+            for worker in workers:
+                await worker.start()
+            await asyncio.sleep(0.2)
+            running = [worker.scheduler.running for worker in workers]
+            assert running.count(True) == 1, running
+            leader = running.index(True)
+            await workers[leader].stop()
+            await asyncio.sleep(0.2)
+            running = [worker.scheduler.running for worker in workers]
+            assert running.count(True) == 1 and not running[leader], running
+            print(f"leader {leader} stopped, worker {running.index(True)} took over; one scheduler at a time")
+            for worker in workers:
+                await worker.stop()
+
+            # A leader whose start fails steps down and a healthy worker takes over
+            class _Broken(_Scheduler):
+                async def start(self):
+                    raise RuntimeError("start failed")
+
+            broken = LeaderElectedScheduler(_Broken(), FileLeaderElection(path), lambda: True, 0.05)
+            await broken.start()
+            await asyncio.sleep(0.02)
+            healthy = LeaderElectedScheduler(_Scheduler(), FileLeaderElection(path), lambda: True, 0.05)
+            await healthy.start()
+            await asyncio.sleep(0.3)
+            assert healthy.scheduler.running and broken._task is not None and not broken._task.done()
+            print("a leader that failed to start stepped down; another worker runs the scheduler")
+            await broken.stop()
+            await healthy.stop()
+
+    asyncio.run(_demo())
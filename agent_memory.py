@@ -0,0 +1,847 @@
+# agent_memory.py
+"""
+Persistent agent memory on SQLite (WAL mode).
+
+Everything the agent learns is written to an append-only event log before it
+is applied in memory, so a deploy or OOM restart no longer forgets learned
+patterns or notification throttling (and does not re-notify patterns it had
+already throttled):
+
+- `alert` / `action` events are the history itself; compaction keeps the
+  newest ring-buffer-capacity of each, so the log never grows past the
+  in-memory history
+- `notified` events (and `pattern` events from older logs) update small
+  aggregates; every `snapshot_every` events the aggregates are written as
+  one snapshot and the events it covers are deleted
+- learned patterns are folded from the `action` events themselves
+  (agent_patterns.py), each action id counted once
+
+Recovery loads the latest snapshot, the history tail and the aggregate
+events after the snapshot. Snapshots stay small because the history is
+never copied into them.
+
+Events are group-committed: a writer thread flushes the pending batch every
+`flush_interval` seconds (or at `max_batch` events) in one transaction, so a
+crash loses at most that window, and a 100-byte event no longer costs a
+full WAL page write. `flush_interval=0` writes every event synchronously.
+
+Several processes (uvicorn workers, `python main.py worker`) can share one
+store: every event carries its writer's `origin`, each process tails the
+others' events (`AgentState.sync()`), patterns are derived from actions
+so concurrent learning is never lost or double counted, and checkpoints
+run in one write transaction that folds in every committed event. Aggregate
+events are only compacted after `compaction_grace` seconds, so a worker that
+syncs every second never misses one; one that fell further behind reloads
+the aggregates from the snapshot.
+
+Run `python agent_memory.py bench [count]` for recovery time and write
+amplification on the local disk, and `python agent_memory.py stress` for a
+concurrent writers / readers consistency check; `python agent_memory.py
+multiprocess` runs several processes against one store.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional
+
+from agent_history import ActionRecord, AlertRecord, RingBuffer
+from agent_patterns import DEFAULT_HALF_LIFE, fold_outcome, upgrade_pattern
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,                -- alert | action | pattern | notified
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL,                -- compact JSON row
+    origin TEXT NOT NULL DEFAULT ''    -- writing process
+);
+CREATE INDEX IF NOT EXISTS idx_events_kind ON events (kind, seq);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    seq INTEGER PRIMARY KEY,           -- last event folded into the snapshot
+    created_at REAL NOT NULL,
+    state TEXT NOT NULL,
+    compacted_through INTEGER NOT NULL DEFAULT 0  -- aggregate events up to here are deleted
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release of the schema
+MIGRATIONS = (
+    ("events", "origin", "ALTER TABLE events ADD COLUMN origin TEXT NOT NULL DEFAULT ''"),
+    ("snapshots", "compacted_through", "ALTER TABLE snapshots ADD COLUMN compacted_through INTEGER NOT NULL DEFAULT 0"),
+)
+
+AGGREGATE_KINDS = ("pattern", "notified")
+# Events after the snapshot that change the aggregates (patterns are folded from actions)
+FOLDED_KINDS = AGGREGATE_KINDS + ("action",)
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
+class AgentMemoryStore:
+    """Append-only event log plus compacted snapshots, safe across threads and processes"""
+
+    def __init__(self, path: str, flush_interval: float = 0.05, max_batch: int = 1000,
+                 compaction_grace: float = 60.0):
+        self.path = path
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.compaction_grace = compaction_grace
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._local = threading.local()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._running = False
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for table, column, statement in MIGRATIONS:
+            if column not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError:
+                    pass  # another process migrated it first
+        self.bytes_logged = 0        # this process: event payload bytes
+        self.bytes_snapshotted = 0   # this process: snapshot payload bytes
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable across process crashes; WAL fsyncs at checkpoint
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # --- log ---
+    def append(self, kind: str, data):
+        """Queue one event for the next group commit (written immediately with flush_interval=0)"""
+        event = (kind, time.time(), _dumps(data), self.origin)
+        with self._pending_lock:
+            self._pending.append(event)
+            self.bytes_logged += len(event[2])
+            backlog = len(self._pending)
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        self._start_writer()
+        if backlog >= self.max_batch:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write pending events in one transaction; returns the last sequence number in the log"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            conn = self._conn()
+            if batch:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._insert(conn, batch)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    with self._pending_lock:
+                        self._pending[:0] = batch  # retried on the next flush
+                    raise
+            return self.last_seq()
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, batch: list):
+        conn.executemany("INSERT INTO events (kind, created_at, data, origin) VALUES (?, ?, ?, ?)", batch)
+
+    def _start_writer(self):
+        if self._running:
+            return
+        with self._flush_lock:
+            if self._running:
+                return
+            self._running = True
+            self._writer = threading.Thread(target=self._write_loop, name="agent-memory-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Agent memory: flush failed: {e}")
+
+    def last_seq(self) -> int:
+        row = self._conn().execute("SELECT MAX(seq) FROM events").fetchone()
+        return row[0] or 0
+
+    def _foreign_events(self, conn: sqlite3.Connection, after_seq: int) -> list:
+        rows = conn.execute("SELECT seq, kind, data FROM events WHERE seq > ? AND origin != ? ORDER BY seq",
+                            (after_seq, self.origin)).fetchall()
+        return [(seq, kind, json.loads(data)) for seq, kind, data in rows]
+
+    def load(self, capacities: Dict[str, int]) -> dict:
+        """
+        Everything recovery needs, read in one transaction: the latest snapshot,
+        the newest `capacities[kind]` history events, the events after the
+        snapshot that change the aggregates and the last sequence number. Pending events are flushed first.
+        """
+        self.flush()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT seq, state FROM snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+            snapshot_seq, state = (row[0], json.loads(row[1])) if row else (0, {})
+            history = {}
+            for kind, limit in capacities.items():
+                rows = conn.execute("SELECT data FROM events WHERE kind = ? ORDER BY seq DESC LIMIT ?",
+                                    (kind, limit)).fetchall()
+                history[kind] = [json.loads(data) for (data,) in reversed(rows)]
+            aggregates = conn.execute(
+                f"SELECT kind, data FROM events WHERE seq > ? AND kind IN ({','.join('?' * len(FOLDED_KINDS))}) "
+                f"ORDER BY seq", (snapshot_seq, *FOLDED_KINDS)).fetchall()
+            last_seq = conn.execute("SELECT MAX(seq) FROM events").fetchone()[0] or 0
+        finally:
+            conn.execute("COMMIT")
+        return {
+            "snapshot_seq": snapshot_seq,
+            "state": state,
+            "history": history,
+            "aggregates": [(kind, json.loads(data)) for kind, data in aggregates],
+            "last_seq": last_seq,
+        }
+
+    def read_since(self, after_seq: int) -> tuple:
+        """(other processes' events after `after_seq`, last sequence number, compaction horizon)"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            events = self._foreign_events(conn, after_seq)
+            last_seq = conn.execute("SELECT MAX(seq) FROM events").fetchone()[0] or 0
+            horizon = conn.execute("SELECT MAX(compacted_through) FROM snapshots").fetchone()[0] or 0
+        finally:
+            conn.execute("COMMIT")
+        return events, last_seq, horizon
+
+    # --- snapshots ---
+    def checkpoint(self, after_seq: int, build_state: Callable[[list], dict], keep: Dict[str, int]) -> tuple:
+        """
+        Snapshot and compact in one write transaction: this process's pending
+        events are written, `build_state(foreign_events)` returns the aggregates
+        including other processes' events after `after_seq`, and the snapshot is
+        stored as of the newest event. Aggregate events older than the grace
+        period are deleted; history kinds keep their newest `keep[kind]`.
+        Returns (seq, foreign_events) for the caller to apply.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._insert(conn, batch)
+                foreign = self._foreign_events(conn, after_seq)
+                seq = conn.execute("SELECT MAX(seq) FROM events").fetchone()[0] or 0
+                payload = _dumps(build_state(foreign))
+                kinds = f"kind IN ({','.join('?' * len(AGGREGATE_KINDS))})"
+                compacted = conn.execute(f"SELECT MAX(seq) FROM events WHERE seq <= ? AND created_at < ? AND {kinds}",
+                                         (seq, time.time() - self.compaction_grace, *AGGREGATE_KINDS)).fetchone()[0]
+                previous = conn.execute("SELECT MAX(compacted_through) FROM snapshots").fetchone()[0]
+                compacted_through = max(compacted or 0, previous or 0)
+                conn.execute("INSERT OR REPLACE INTO snapshots (seq, created_at, state, compacted_through) "
+                             "VALUES (?, ?, ?, ?)", (seq, time.time(), payload, compacted_through))
+                conn.execute("DELETE FROM snapshots WHERE seq < ?", (seq,))
+                if compacted:
+                    conn.execute(f"DELETE FROM events WHERE seq <= ? AND {kinds}", (compacted, *AGGREGATE_KINDS))
+                for kind, limit in keep.items():
+                    row = conn.execute("SELECT seq FROM events WHERE kind = ? ORDER BY seq DESC LIMIT 1 OFFSET ?",
+                                       (kind, limit)).fetchone()
+                    if row is not None:
+                        conn.execute("DELETE FROM events WHERE kind = ? AND seq <= ?", (kind, row[0]))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                with self._pending_lock:
+                    self._pending[:0] = batch
+                raise
+        self.bytes_snapshotted += len(payload)
+        return seq, foreign
+
+    # --- shared settings ---
+    def get_setting(self, key: str, default=None):
+        row = self._conn().execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key: str, value):
+        self._conn().execute("INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, ?)",
+                             (key, _dumps(value), time.time()))
+
+    def stats(self) -> dict:
+        self.flush()
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT kind, COUNT(*) FROM events GROUP BY kind").fetchall())
+        snapshot = conn.execute("SELECT seq, created_at FROM snapshots ORDER BY seq DESC LIMIT 1").fetchone()
+        size = sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal") if os.path.exists(self.path + suffix))
+        return {
+            "path": self.path,
+            "origin": self.origin,
+            "events": counts,
+            "last_seq": self.last_seq(),
+            "snapshot_seq": snapshot[0] if snapshot else None,
+            "snapshot_at": snapshot[1] if snapshot else None,
+            "size_bytes": size,
+            "bytes_logged": self.bytes_logged,
+            "bytes_snapshotted": self.bytes_snapshotted,
+        }
+
+    def close(self):
+        """Stop the writer and write whatever is pending"""
+        self._running = False
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5.0)
+            self._writer = None
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class AgentSnapshot:
+    """
+    Immutable view of AgentState at one version. Published by the writer after
+    every change, so readers get a consistent picture without taking a lock.
+    """
+
+    __slots__ = ("version", "learned_patterns", "last_slack_notification", "alerts_recorded", "alerts_held",
+                 "actions_recorded", "actions_held", "successful_actions", "recent_alerts", "recent_actions")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AgentSnapshot is immutable")
+
+
+class AgentState:
+    """
+    What the agent knows, safe to share between request handlers, workers and
+    the scheduler.
+
+    Writes (record_* / mark_notified) are serialized by one lock, log their
+    event to the attached store and replace the pattern and throttling dicts
+    copy-on-write. Every recorded action updates its issue type's pattern in
+    O(1); an action id that was already recorded is ignored. After each write a new AgentSnapshot is
+    published; `snapshot()` just returns it, so status endpoints never block
+    writers and never see a half-applied change.
+
+    With a shared store, `sync()` (or the `start_sync()` thread) applies the
+    events other processes logged, so every worker converges on the same
+    patterns, throttling and history.
+    """
+
+    RECENT = 10  # records carried in each snapshot
+
+    def __init__(self, alert_capacity: int = 100000, action_capacity: int = 10000,
+                 store: Optional[AgentMemoryStore] = None, snapshot_every: int = 1000, observers=(),
+                 pattern_half_life: float = DEFAULT_HALF_LIFE):
+        self.monitoring_active = False
+        self.last_health_check = None
+        self.recent_predictions = {}  # Track recent predictions to prevent spam
+        # Bounded ring buffers of slotted records (see agent_history.py); only touched under _lock
+        self._alerts = RingBuffer(alert_capacity)
+        self._actions = RingBuffer(action_capacity)
+        self._patterns = MappingProxyType({})       # replaced, never mutated
+        self._action_ids = set()                    # ids of the actions in _actions (idempotency)
+        self.pattern_half_life = pattern_half_life
+        self._notified = MappingProxyType({})       # pattern key -> last notification time
+        self._successful_actions = 0
+        self._version = 0
+        self.store = store
+        self.observers = list(observers)  # observe_record(AlertRecord) for every alert, including recovered ones
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._events_since_checkpoint = 0
+        self._synced_seq = 0          # every foreign event up to here is applied
+        self._sync_thread = None
+        self._sync_stop = threading.Event()
+        self._snapshot = None
+        self._publish()
+
+    # --- readers (lock-free) ---
+    def snapshot(self) -> AgentSnapshot:
+        return self._snapshot
+
+    @property
+    def learned_patterns(self) -> Mapping[str, dict]:
+        return self._patterns
+
+    @property
+    def last_slack_notification(self) -> Mapping[str, float]:
+        return self._notified
+
+    @property
+    def capacity(self) -> dict:
+        return {"alerts": self._alerts.capacity, "actions": self._actions.capacity}
+
+    def recent_alerts(self, count: int) -> List[AlertRecord]:
+        """Newest `count` alerts, oldest first (a short copy under the lock)"""
+        with self._lock:
+            return self._alerts.recent(count)
+
+    def recent_actions(self, count: int) -> List[ActionRecord]:
+        with self._lock:
+            return self._actions.recent(count)
+
+    # --- writers ---
+    def record_alert(self, record: AlertRecord):
+        with self._lock:
+            self._log("alert", record.to_row())
+            self._alerts.append(record)
+            checkpoint = self._publish()
+        self._notify(record)
+        self._maybe_checkpoint(checkpoint)
+
+    def record_action(self, record: ActionRecord) -> bool:
+        """Record an action and count it in its pattern; False if its action id was already recorded"""
+        with self._lock:
+            if record.action_id in self._action_ids:
+                return False
+            self._log("action", record.to_row())
+            self._append_action(record)
+            checkpoint = self._publish()
+        self._maybe_checkpoint(checkpoint)
+        return True
+
+    def mark_notified(self, key: str, timestamp: float):
+        with self._lock:
+            self._log("notified", [key, timestamp])
+            self._notified = MappingProxyType({**self._notified, key: max(timestamp, self._notified.get(key, 0))})
+            checkpoint = self._publish()
+        self._maybe_checkpoint(checkpoint)
+
+    def _append_action(self, record: ActionRecord, learn: bool = True) -> bool:
+        if record.action_id in self._action_ids:
+            return False
+        evicted = self._actions.append(record)
+        self._action_ids.add(record.action_id)
+        if evicted is not None:
+            self._action_ids.discard(evicted.action_id)
+        self._successful_actions += record.succeeded - (evicted is not None and evicted.succeeded)
+        if learn:
+            pattern = fold_outcome(self._patterns.get(record.issue_type), record.succeeded, record.result,
+                                   record.timestamp, self.pattern_half_life)
+            self._patterns = MappingProxyType({**self._patterns, record.issue_type: MappingProxyType(pattern)})
+        return True
+
+    def _publish(self) -> bool:
+        """Build the next snapshot (caller holds _lock); returns True when a checkpoint is due"""
+        self._version += 1
+        self._snapshot = AgentSnapshot(
+            version=self._version,
+            learned_patterns=self._patterns,
+            last_slack_notification=self._notified,
+            alerts_recorded=self._alerts.total,
+            alerts_held=len(self._alerts),
+            actions_recorded=self._actions.total,
+            actions_held=len(self._actions),
+            successful_actions=self._successful_actions,
+            recent_alerts=tuple(self._alerts.recent(self.RECENT)),
+            recent_actions=tuple(self._actions.recent(self.RECENT)),
+        )
+        if self.store is None:
+            return False
+        self._events_since_checkpoint += 1
+        if self._events_since_checkpoint < self.snapshot_every:
+            return False
+        self._events_since_checkpoint = 0
+        return True
+
+    def _notify(self, record: AlertRecord):
+        for observer in self.observers:
+            try:
+                observer.observe_record(record)
+            except Exception as e:
+                print(f"⚠️ Agent memory: alert observer {type(observer).__name__} failed: {e}")
+
+    # --- persistence ---
+    def _log(self, kind: str, data):
+        """Queue the event under _lock, so the log order is the order changes were applied"""
+        if self.store is None:
+            return
+        try:
+            self.store.append(kind, data)
+        except Exception as e:
+            print(f"⚠️ Agent memory: failed to persist {kind} event: {e}")
+
+    def _maybe_checkpoint(self, due: bool):
+        if due:
+            self.checkpoint()
+
+    def _aggregates(self, events) -> tuple:
+        """Current patterns and notification times with `events` folded in, as plain dicts"""
+        patterns = {key: dict(value) for key, value in self._patterns.items()}
+        notified = dict(self._notified)
+        _fold_aggregates(patterns, notified, ((kind, data) for _, kind, data in events),
+                         self.pattern_half_life, known_actions=self._action_ids)
+        return patterns, notified
+
+    def _apply(self, events, learn: bool = True) -> list:
+        """Apply other processes' events (caller holds _lock); returns their alerts for the observers"""
+        alerts = []
+        aggregates = []
+        for _, kind, data in events:
+            if kind == "alert":
+                record = AlertRecord.from_row(data)
+                self._alerts.append(record)
+                alerts.append(record)
+            elif kind == "action":
+                self._append_action(ActionRecord.from_row(data), learn)
+            elif kind in AGGREGATE_KINDS:
+                aggregates.append((kind, data))
+        if aggregates:
+            patterns = dict(self._patterns)
+            notified = dict(self._notified)
+            _fold_aggregates(patterns, notified, aggregates, self.pattern_half_life)
+            self._patterns = MappingProxyType({key: value if isinstance(value, MappingProxyType)
+                                               else MappingProxyType(value) for key, value in patterns.items()})
+            self._notified = MappingProxyType(notified)
+        return alerts
+
+    def checkpoint(self):
+        """Write the aggregates as a store snapshot and compact the log"""
+        if self.store is None:
+            return
+        keep = {"alert": self._alerts.capacity, "action": self._actions.capacity}
+
+        def build_state(foreign):
+            patterns, notified = self._aggregates(foreign)
+            return {"learned_patterns": patterns, "last_slack_notification": notified}
+
+        try:
+            with self._lock:
+                # Held across the write transaction: the snapshot is exactly memory + the foreign events
+                seq, foreign = self.store.checkpoint(self._synced_seq, build_state, keep)
+                alerts = self._apply(foreign)
+                self._synced_seq = max(self._synced_seq, seq)
+                self._publish()
+        except Exception as e:
+            print(f"⚠️ Agent memory: checkpoint failed: {e}")
+            return
+        for record in alerts:
+            self._notify(record)
+
+    def sync(self) -> int:
+        """Apply events other processes logged since the last sync; returns how many were applied"""
+        if self.store is None:
+            return 0
+        events, last_seq, horizon = self.store.read_since(self._synced_seq)
+        with self._lock:
+            learn = True
+            if horizon > self._synced_seq:
+                # Aggregate events we never saw were compacted away; reload them from the snapshot
+                loaded = self.store.load({})
+                patterns, notified = _load_aggregates(loaded, self.pattern_half_life)
+                self._patterns = MappingProxyType(patterns)
+                self._notified = MappingProxyType(notified)
+                events = [event for event in events if event[1] not in AGGREGATE_KINDS]
+                last_seq = max(last_seq, loaded["last_seq"])
+                learn = False  # the reloaded patterns already count these actions
+            alerts = self._apply((event for event in events if event[0] > self._synced_seq), learn)
+            self._synced_seq = max(self._synced_seq, last_seq)
+            if events:
+                self._publish()
+        for record in alerts:
+            self._notify(record)
+        return len(events)
+
+    def start_sync(self, interval: float = 1.0):
+        """Run sync() every `interval` seconds in a daemon thread"""
+        if self.store is None or interval <= 0 or self._sync_thread is not None:
+            return
+        self._sync_stop.clear()
+
+        def loop():
+            while not self._sync_stop.wait(interval):
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"⚠️ Agent memory: sync failed: {e}")
+
+        self._sync_thread = threading.Thread(target=loop, name="agent-state-sync", daemon=True)
+        self._sync_thread.start()
+
+    def stop_sync(self):
+        if self._sync_thread is None:
+            return
+        self._sync_stop.set()
+        self._sync_thread.join(timeout=5.0)
+        self._sync_thread = None
+
+    def recover(self) -> dict:
+        """Rebuild memory from the latest snapshot plus the log; returns recovery stats"""
+        if self.store is None:
+            return {}
+        started = time.perf_counter()
+        loaded = self.store.load({"alert": self._alerts.capacity, "action": self._actions.capacity})
+        patterns, notified = _load_aggregates(loaded, self.pattern_half_life)
+        alerts = []
+        with self._lock:
+            for data in loaded["history"]["alert"]:
+                record = AlertRecord.from_row(data)
+                self._alerts.append(record)
+                alerts.append(record)
+            for data in loaded["history"]["action"]:
+                self._append_action(ActionRecord.from_row(data), learn=False)  # counted in the aggregates
+            replayed = len(alerts) + len(loaded["history"]["action"]) + len(loaded["aggregates"])
+            self._patterns = MappingProxyType({**self._patterns, **patterns})
+            self._notified = MappingProxyType({**self._notified, **notified})
+            self._synced_seq = loaded["last_seq"]
+            self._events_since_checkpoint = 0
+            self._publish()
+        for record in alerts:
+            self._notify(record)
+        view = self._snapshot
+        stats = {
+            "snapshot_seq": loaded["snapshot_seq"],
+            "events_replayed": replayed,
+            "alerts": view.alerts_held,
+            "actions": view.actions_held,
+            "patterns": len(view.learned_patterns),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        print(f"🧠 Agent memory: recovered {stats['alerts']} alerts, {stats['actions']} actions, "
+              f"{stats['patterns']} patterns in {stats['seconds']}s")
+        return stats
+
+
+def _fold_aggregates(patterns: dict, notified: dict, events, half_life: float, known_actions=frozenset()):
+    """Apply events in log order to plain dicts; actions whose id is in `known_actions` are skipped"""
+    counted = set()
+    for kind, data in events:
+        if kind == "action":
+            record = ActionRecord.from_row(data)
+            if record.action_id in known_actions or record.action_id in counted:
+                continue
+            counted.add(record.action_id)
+            patterns[record.issue_type] = fold_outcome(patterns.get(record.issue_type), record.succeeded,
+                                                       record.result, record.timestamp, half_life)
+        elif kind == "pattern":  # logs written before patterns were folded from actions
+            if isinstance(data[1], dict):
+                patterns[data[0]] = upgrade_pattern(data[1])
+            else:
+                patterns[data[0]] = fold_outcome(patterns.get(data[0]), True, data[1], time.time(), half_life)
+        elif kind == "notified":
+            notified[data[0]] = max(data[1], notified.get(data[0], 0))
+
+
+def _load_aggregates(loaded: dict, half_life: float) -> tuple:
+    """Aggregates from AgentMemoryStore.load(): the snapshot with the later events folded in"""
+    state = loaded["state"]
+    patterns = {key: upgrade_pattern(value) for key, value in (state.get("learned_patterns") or {}).items()}
+    notified = dict(state.get("last_slack_notification") or {})
+    _fold_aggregates(patterns, notified, loaded["aggregates"], half_life)
+    return ({key: MappingProxyType(value) for key, value in patterns.items()}, notified)
+
+
+def _process_bytes_written() -> Optional[int]:
+    """Bytes this process has handed to write() (Linux only)"""
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _benchmark(count: int = 100000):
+    """Event append rate, write amplification and recovery time on local disk"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        store = AgentMemoryStore(path)
+        state = AgentState(alert_capacity=count, action_capacity=10000, store=store, snapshot_every=1000)
+        written_before = _process_bytes_written()
+        started = time.perf_counter()
+        for i in range(count):
+            now = time.time()
+            if i % 10 == 0:
+                action = ActionRecord("grafana_alert_processed", {"alert_name": f"Alert{i % 50}", "system": "grafana"},
+                                      now, f"agent_{i}", system="grafana", severity="info",
+                                      result=f"Success: Learned from Alert{i % 50}")
+                state.record_action(action)
+            elif i % 97 == 0:
+                state.mark_notified(f"pattern_Alert{i % 50}", now)
+            else:
+                state.record_alert(AlertRecord(f"Alert{i % 50}", f"service-{i % 7}", now, "high", True, True, "high"))
+        append_seconds = time.perf_counter() - started
+        written_after = _process_bytes_written()
+        stats = store.stats()
+        store.close()
+
+        recovered = AgentState(alert_capacity=count, action_capacity=10000, store=AgentMemoryStore(path))
+        started = time.perf_counter()
+        recovery = recovered.recover()
+        recovery_seconds = time.perf_counter() - started
+
+        logical = stats["bytes_logged"]
+        print(f"events:              {count:,} in {append_seconds:.2f}s ({count / append_seconds:,.0f} events/s)")
+        print(f"event payload:       {logical / 1e6:.1f} MB, snapshots {stats['bytes_snapshotted'] / 1e6:.2f} MB")
+        print(f"database on disk:    {stats['size_bytes'] / 1e6:.1f} MB ({stats['events']})")
+        if written_before is not None and written_after is not None:
+            print(f"write amplification: {(written_after - written_before) / logical:.1f}x "
+                  f"(bytes written to the OS / event payload bytes)")
+        print(f"recovery:            {recovery_seconds:.2f}s "
+              f"({recovery['events_replayed']:,} events replayed after snapshot {recovery['snapshot_seq']})")
+        assert dict(recovered.learned_patterns) == dict(state.learned_patterns)
+        assert dict(recovered.last_slack_notification) == dict(state.last_slack_notification)
+        assert recovered.snapshot().alerts_held == state.snapshot().alerts_held
+
+
+def _stress(seconds: float = 5.0, writers: int = 8, readers: int = 4):
+    """Concurrent writers and lock-free readers; checks that no snapshot is torn and no update is lost"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state = AgentState(alert_capacity=5000, action_capacity=1000,
+                           store=AgentMemoryStore(os.path.join(tmp, "stress.db")), snapshot_every=500)
+        stop = threading.Event()
+        written = [0] * writers
+        reads = [0] * readers
+        errors = []
+
+        def writer(index: int):
+            i = 0
+            while not stop.is_set():
+                now = time.time()
+                state.record_alert(AlertRecord(f"Alert{i % 7}", f"service-{index}", now))
+                action = ActionRecord(f"issue{i % 5}", {}, now, f"w{index}-{i}",
+                                      result="Success: ok" if i % 3 else "Failed: no")
+                state.record_action(action)
+                state.record_action(action)  # a retried action is counted once
+                state.mark_notified(f"pattern_{i % 11}", now)
+                i += 1
+            written[index] = i
+
+        def reader(index: int):
+            last_version = 0
+            while not stop.is_set():
+                view = state.snapshot()
+                try:
+                    assert view.version >= last_version, "version went backwards"
+                    assert view.alerts_held <= view.alerts_recorded
+                    assert view.successful_actions <= view.actions_held <= view.actions_recorded
+                    assert len(view.recent_actions) == min(AgentState.RECENT, view.actions_held)
+                    for pattern in view.learned_patterns.values():
+                        assert pattern["success_count"] <= pattern["total_attempts"]
+                    dict(view.learned_patterns), dict(view.last_slack_notification)
+                except AssertionError as e:
+                    errors.append(str(e))
+                last_version = view.version
+                reads[index] += 1
+                time.sleep(0.0005)  # status polling, not a spin loop hogging the GIL
+
+        threads = ([threading.Thread(target=writer, args=(i,)) for i in range(writers)] +
+                   [threading.Thread(target=reader, args=(i,)) for i in range(readers)])
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        view = state.snapshot()
+        total = sum(written)
+        successes = sum(sum(1 for i in range(count) if i % 3) for count in written)
+        learned = sum(pattern["success_count"] for pattern in view.learned_patterns.values())
+        attempts = sum(pattern["total_attempts"] for pattern in view.learned_patterns.values())
+        in_buffer = sum(1 for action in state.recent_actions(state.capacity["actions"]) if action.succeeded)
+        assert view.alerts_recorded == total and view.actions_recorded == total, "lost record updates"
+        assert learned == successes, f"lost pattern updates: {learned} != {successes}"
+        assert attempts == total, f"pattern attempts {attempts} != {total} actions"
+        assert view.successful_actions == in_buffer, "successful action counter drifted"
+        assert not errors, f"torn snapshots: {errors[:5]}"
+        state.store.close()
+        print(f"{writers} writers: {total * 4 / seconds:,.0f} updates/s; "
+              f"{readers} readers: {sum(reads) / seconds:,.0f} consistent snapshots/s; no torn reads, no lost updates")
+
+
+def _worker_process(path: str, index: int, seconds: float, results):
+    state = AgentState(alert_capacity=100000, action_capacity=10000, store=AgentMemoryStore(path), snapshot_every=500)
+    state.recover()
+    state.start_sync(0.2)
+    learned = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        now = time.time()
+        state.record_alert(AlertRecord(f"Alert{learned % 7}", f"worker-{index}", now))
+        state.record_action(ActionRecord(f"issue{learned % 5}", {}, now, f"w{index}-{learned}",
+                                         result="Success: ok" if learned % 4 else "Failed: no"))
+        state.mark_notified(f"pattern_{learned % 11}", now)
+        learned += 1
+    state.stop_sync()
+    state.checkpoint()
+    state.store.close()
+    results.put((index, learned))
+
+
+def _multiprocess(workers: int = 4, seconds: float = 3.0):
+    """Several processes sharing one store, like uvicorn workers; checks that no pattern update is lost"""
+    import multiprocessing
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "shared.db")
+        AgentMemoryStore(path).close()  # create the schema once
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_worker_process, args=(path, i, seconds, results))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        learned = dict(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+
+        state = AgentState(alert_capacity=100000, store=AgentMemoryStore(path))
+        state.recover()
+        total = sum(learned.values())
+        counted = sum(pattern["total_attempts"] for pattern in state.learned_patterns.values())
+        assert counted == total, f"lost pattern updates across processes: {counted} != {total}"
+        assert state.snapshot().alerts_recorded == total, "lost alerts across processes"
+        state.store.close()
+        print(f"{workers} processes: {total * 3 / seconds:,.0f} updates/s into one store; "
+              f"{counted:,} pattern updates recovered, none lost")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        _benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    elif len(sys.argv) > 1 and sys.argv[1] == "stress":
+        _stress(float(sys.argv[2]) if len(sys.argv) > 2 else 5.0)
+    elif len(sys.argv) > 1 and sys.argv[1] == "multiprocess":
+        _multiprocess(int(sys.argv[2]) if len(sys.argv) > 2 else 4)
+    else:
+        print("usage: python agent_memory.py bench [count] | stress [seconds] | multiprocess [workers]")
@@ -0,0 +1,105 @@
+# agent_patterns.py
+"""
+Incremental pattern statistics for the autonomous agent.
+
+A pattern (one per issue type) is folded from the stream of recorded
+actions, one O(1) update per action:
+
+- `success_count` / `total_attempts` count every action exactly once,
+  failed ones included, so the success rate can actually drop below 1
+- `weighted_successes` / `weighted_attempts` decay with `half_life`
+  seconds, and `success_rate` is their ratio, so recent outcomes count
+  more than last month's
+- `best_action` is the result of the newest successful action
+
+Weights are decayed relative to the newest event seen, so folding the same
+events in any order (e.g. two workers' logs interleaved differently) gives
+the same pattern. Idempotency (each action id counted once) is the caller's
+job; AgentState checks ids against the action history.
+"""
+
+import math
+from typing import Mapping, Optional
+
+DEFAULT_HALF_LIFE = 7 * 86400.0
+
+
+def empty_pattern() -> dict:
+    return {"success_count": 0, "total_attempts": 0, "weighted_successes": 0.0, "weighted_attempts": 0.0,
+            "success_rate": 0.0, "best_action": None, "updated_at": None, "last_success_at": None}
+
+
+def upgrade_pattern(pattern: Mapping) -> dict:
+    """Fill the decayed fields of a pattern stored before they existed (raw counts as weights)"""
+    upgraded = empty_pattern()
+    upgraded.update(pattern)
+    if "weighted_attempts" not in pattern:
+        upgraded["weighted_successes"] = float(upgraded["success_count"])
+        upgraded["weighted_attempts"] = float(upgraded["total_attempts"])
+        upgraded["success_rate"] = success_rate(upgraded)
+    return upgraded
+
+
+def success_rate(pattern: Mapping) -> float:
+    attempts = pattern.get("weighted_attempts") or 0.0
+    return round(pattern.get("weighted_successes", 0.0) / attempts, 4) if attempts > 0 else 0.0
+
+
+def fold_outcome(pattern: Optional[Mapping], succeeded: bool, result: Optional[str], timestamp: float,
+                 half_life: float = DEFAULT_HALF_LIFE) -> dict:
+    """A new pattern dict with one more action outcome counted"""
+    pattern = upgrade_pattern(pattern) if pattern else empty_pattern()
+    decay = math.log(2) / half_life if half_life > 0 else 0.0
+    updated_at = pattern["updated_at"]
+    if updated_at is None or timestamp >= updated_at:
+        if updated_at is not None:
+            factor = math.exp(-decay * (timestamp - updated_at))
+            pattern["weighted_successes"] *= factor
+            pattern["weighted_attempts"] *= factor
+        pattern["updated_at"] = timestamp
+        weight = 1.0
+    else:
+        weight = math.exp(-decay * (updated_at - timestamp))  # late event: decayed to the newest one
+    pattern["total_attempts"] += 1
+    pattern["weighted_attempts"] += weight
+    if succeeded:
+        pattern["success_count"] += 1
+        pattern["weighted_successes"] += weight
+        if pattern["last_success_at"] is None or timestamp >= pattern["last_success_at"]:
+            pattern["last_success_at"] = timestamp
+            pattern["best_action"] = result
+    pattern["success_rate"] = success_rate(pattern)
+    return pattern
+
+
+def decayed_attempts(pattern: Mapping, now: float, half_life: float = DEFAULT_HALF_LIFE) -> float:
+    """How much recent evidence backs the success rate, as of `now`"""
+    updated_at = pattern.get("updated_at")
+    attempts = pattern.get("weighted_attempts", pattern.get("total_attempts", 0))
+    if updated_at is None or half_life <= 0 or now <= updated_at:
+        return attempts
+    return attempts * math.exp(-math.log(2) / half_life * (now - updated_at))
+
+
+if __name__ == "__main__":
+    # Order independence and cost per update
+    import random
+    import time
+
+    events = [(random.random() < 0.8, f"result {i}", 1_700_000_000 + i * 60.0) for i in range(100_000)]
+    started = time.perf_counter()
+    forward = None
+    for succeeded, result, timestamp in events:
+        forward = fold_outcome(forward, succeeded, result, timestamp, half_life=86400)
+    fold_seconds = time.perf_counter() - started
+    random.shuffle(events)
+    shuffled = None
+    for succeeded, result, timestamp in events:
+        shuffled = fold_outcome(shuffled, succeeded, result, timestamp, half_life=86400)
+    assert forward["success_count"] == shuffled["success_count"]
+    assert forward["best_action"] == shuffled["best_action"]
+    assert abs(forward["success_rate"] - shuffled["success_rate"]) < 1e-3
+    print(f"fold: {fold_seconds / len(events) * 1e6:.2f} µs/event; "
+          f"raw rate {forward['success_count'] / forward['total_attempts']:.3f}, "
+          f"decayed rate {forward['success_rate']:.3f} over {forward['weighted_attempts']:.0f} weighted attempts; "
+          f"same result in shuffled order")
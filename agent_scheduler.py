@@ -0,0 +1,198 @@
+# agent_scheduler.py
+"""
+Asyncio scheduler for the agent's periodic jobs.
+
+One task per job sleeps on a stop event until the job is due, so nothing
+wakes up between runs and stopping is immediate. A job never overlaps with
+itself: the next run is scheduled only after the previous one finished, and
+a manual `run_now` is skipped while the job is running. Blocking jobs run in
+a worker thread. Each interval gets a random jitter so jobs started together
+do not stay in lockstep.
+"""
+
+import asyncio
+import inspect
+import random
+import time
+from typing import Callable, Dict, Optional
+
+from metrics import Histogram
+
+# Run duration buckets in seconds (fast checks up to slow DB / LLM jobs)
+JOB_DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class ScheduledJob:
+    __slots__ = ("name", "func", "interval", "jitter", "run_on_start", "running", "runs", "failures",
+                 "skipped", "last_started_at", "last_finished_at", "last_duration", "last_error",
+                 "next_run_at", "durations")
+
+    def __init__(self, name: str, func: Callable, interval: float, jitter: float, run_on_start: bool):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.run_on_start = run_on_start
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.last_duration = None
+        self.last_error = None
+        self.next_run_at = None
+        self.durations = Histogram(f"agent_job_{name}", JOB_DURATION_BUCKETS)
+
+    def next_delay(self) -> float:
+        """Interval with +/- jitter (a fraction of the interval)"""
+        spread = self.interval * self.jitter
+        return max(self.interval + random.uniform(-spread, spread), 0.0)
+
+    def to_dict(self) -> dict:
+        durations = self.durations.snapshot()
+        return {
+            "interval_seconds": self.interval,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overlaps": self.skipped,
+            "last_started_at": self.last_started_at,
+            "last_finished_at": self.last_finished_at,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at,
+            "duration_seconds": {key: durations[key] for key in ("count", "mean", "p50", "p99")},
+        }
+
+
+class AgentScheduler:
+    """
+    Periodic jobs on the running event loop.
+
+    `start()` / `stop()` are idempotent coroutines, so the app lifespan and
+    the start/stop endpoints can call them freely without spawning a second
+    set of loops.
+    """
+
+    def __init__(self, name: str = "agent-scheduler", jitter: float = 0.1):
+        self.name = name
+        self.jitter = jitter
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stop_event: Optional[asyncio.Event] = None
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def add_job(self, name: str, func: Callable, interval: float, jitter: Optional[float] = None,
+                run_on_start: bool = False):
+        """Register a job; takes effect on the next start()"""
+        if interval <= 0:
+            raise ValueError(f"interval for {name} must be positive")
+        self._jobs[name] = ScheduledJob(name, func, interval, self.jitter if jitter is None else jitter, run_on_start)
+
+    # --- lifecycle ---
+    async def start(self) -> bool:
+        """Start one loop per job; returns False when already running"""
+        if self._tasks:
+            return False
+        self._stop_event = asyncio.Event()
+        self.started_at = time.time()
+        for job in self._jobs.values():
+            self._tasks[job.name] = asyncio.create_task(self._loop(job), name=f"{self.name}-{job.name}")
+        print(f"⏰ {self.name}: started {len(self._tasks)} jobs "
+              f"({', '.join(f'{job.name} every {job.interval:g}s' for job in self._jobs.values())})")
+        return True
+
+    async def stop(self, timeout: float = 10.0) -> bool:
+        """Stop all loops, letting a job that is mid-run finish; returns False when not running"""
+        if not self._tasks:
+            return False
+        tasks = list(self._tasks.values())
+        self._tasks = {}
+        self._stop_event.set()
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        for job in self._jobs.values():
+            job.next_run_at = None
+        self.started_at = None
+        print(f"⏰ {self.name}: stopped" + (f" ({len(pending)} jobs cancelled mid-run)" if pending else ""))
+        return True
+
+    # --- running jobs ---
+    async def run_now(self, name: str) -> bool:
+        """Run a job immediately; skipped (False) if it is already running"""
+        return await self._run(self._jobs[name])
+
+    async def _loop(self, job: ScheduledJob):
+        delay = 0.0 if job.run_on_start else job.next_delay()
+        while True:
+            job.next_run_at = time.time() + delay
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                return  # stop requested
+            except asyncio.TimeoutError:
+                pass
+            await self._run(job)
+            delay = job.next_delay()
+
+    async def _run(self, job: ScheduledJob) -> bool:
+        if job.running:
+            job.skipped += 1
+            print(f"⏭️ {self.name}: {job.name} still running, skipped")
+            return False
+        job.running = True
+        job.last_started_at = time.time()
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                await job.func()
+            else:
+                await asyncio.to_thread(job.func)
+            job.last_error = None
+        except asyncio.CancelledError:
+            job.last_error = "cancelled"
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            print(f"❌ {self.name}: {job.name} failed: {e}")
+        finally:
+            job.last_duration = round(time.perf_counter() - started, 4)
+            job.last_finished_at = time.time()
+            job.durations.observe(job.last_duration)
+            job.runs += 1
+            job.running = False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "jitter": self.jitter,
+            "jobs": {name: job.to_dict() for name, job in self._jobs.items()},
+        }
+
+
+if __name__ == "__main__":
+    # Quick check: overlap prevention, jitter and idempotent start/stop
+    async def _demo():
+        scheduler = AgentScheduler("demo", jitter=0.2)
+        scheduler.add_job("fast", lambda: time.sleep(0.05), interval=0.2, run_on_start=True)
+        scheduler.add_job("slow", lambda: time.sleep(0.5), interval=0.1)
+        assert await scheduler.start() and not await scheduler.start()
+        results = await asyncio.gather(asyncio.sleep(0.15), scheduler.run_now("slow"), scheduler.run_now("slow"))
+        await asyncio.sleep(1.5)
+        assert await scheduler.stop() and not await scheduler.stop()
+        for name, job in scheduler.stats()["jobs"].items():
+            print(f"{name}: runs={job['runs']} skipped={job['skipped_overlaps']} "
+                  f"mean={job['duration_seconds']['mean']}s")
+        print(f"manual run_now results: {results[1:]}")
+
+    asyncio.run(_demo())
@@ -0,0 +1,259 @@
+# alert_analytics.py
+"""
+Streaming alert-rate analytics for the autonomous agent.
+
+Every alert updates a few fixed-size aggregates in O(1):
+
+- a bucketed sliding-window counter (e.g. the last hour in 1-minute buckets),
+  overall and per alert type
+- two exponentially decaying rates per alert type (short and long horizon)
+
+Storm detection reads the overall window counter, pattern detection reads the
+per-type window counts, and trend detection compares the short rate with the
+long one. None of them scan the alert history, so the cost per check depends
+on the number of alert types, not on how many hours of alerts were seen.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class SlidingWindowCounter:
+    """Event count over the last `window_seconds`, kept in `buckets` fixed-width buckets"""
+
+    __slots__ = ("bucket_seconds", "buckets", "_counts", "_head", "_total")
+
+    def __init__(self, window_seconds: float, buckets: int = 60):
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self._counts = [0] * buckets
+        self._head = None       # absolute index of the newest bucket
+        self._total = 0
+
+    def _advance(self, index: int):
+        if self._head is None:
+            self._head = index
+            return
+        if index <= self._head:
+            return
+        # Clear the buckets that fell out of the window (at most `buckets` of them)
+        for expired in range(self._head + 1, min(index, self._head + self.buckets) + 1):
+            slot = expired % self.buckets
+            self._total -= self._counts[slot]
+            self._counts[slot] = 0
+        self._head = index
+
+    def add(self, timestamp: float, count: int = 1):
+        index = int(timestamp // self.bucket_seconds)
+        self._advance(index)
+        if index <= self._head - self.buckets:
+            return  # older than the window
+        self._counts[index % self.buckets] += count
+        self._total += count
+
+    def total(self, now: float) -> int:
+        self._advance(int(now // self.bucket_seconds))
+        return self._total
+
+    def recent(self, now: float, seconds: float) -> int:
+        """Count over the newest `seconds` of the window (rounded up to whole buckets)"""
+        self._advance(int(now // self.bucket_seconds))
+        if self._head is None:
+            return 0
+        span = min(max(int(math.ceil(seconds / self.bucket_seconds)), 1), self.buckets)
+        return sum(self._counts[(self._head - offset) % self.buckets] for offset in range(span))
+
+
+class DecayingRate:
+    """Exponentially weighted event rate (events/second) with time constant `tau` seconds"""
+
+    __slots__ = ("tau", "_value", "_updated")
+
+    def __init__(self, tau: float):
+        self.tau = tau
+        self._value = 0.0
+        self._updated = None
+
+    def _decay_to(self, now: float):
+        if self._updated is not None and now > self._updated:
+            self._value *= math.exp(-(now - self._updated) / self.tau)
+            self._updated = now
+        elif self._updated is None:
+            self._updated = now
+
+    def add(self, timestamp: float, count: int = 1):
+        self._decay_to(timestamp)
+        self._value += count
+
+    def rate(self, now: float) -> float:
+        self._decay_to(now)
+        return self._value / self.tau
+
+
+class AlertTypeStats:
+    __slots__ = ("alert_type", "window", "short_rate", "long_rate", "total", "last_seen")
+
+    def __init__(self, alert_type: str, window_seconds: float, buckets: int, short_tau: float, long_tau: float):
+        self.alert_type = alert_type
+        self.window = SlidingWindowCounter(window_seconds, buckets)
+        self.short_rate = DecayingRate(short_tau)
+        self.long_rate = DecayingRate(long_tau)
+        self.total = 0
+        self.last_seen = None
+
+
+class AlertRateAnalytics:
+    """
+    Per-alert-type sliding windows and decaying rates with storm, pattern and
+    trend detection. Thread-safe; `observe()` is O(1).
+    """
+
+    def __init__(self, window_seconds: float = 3600.0, buckets: int = 60, storm_window_seconds: float = 300.0,
+                 storm_threshold: int = 5, short_tau: float = 300.0, long_tau: float = 3600.0,
+                 trend_ratio: float = 3.0, trend_min_events: int = 3, max_types: int = 5000):
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.storm_window_seconds = storm_window_seconds
+        self.storm_threshold = storm_threshold
+        self.short_tau = short_tau
+        self.long_tau = long_tau
+        self.trend_ratio = trend_ratio
+        self.trend_min_events = trend_min_events
+        self.max_types = max_types
+        self._overall = SlidingWindowCounter(window_seconds, buckets)
+        # Least recently seen type first, so evicting one at `max_types` is O(1)
+        self._types: "OrderedDict[str, AlertTypeStats]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.observed = 0
+
+    def observe(self, alert_type: str, timestamp: Optional[float] = None, count: int = 1):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            stats = self._types.get(alert_type)
+            if stats is None:
+                if len(self._types) >= self.max_types:
+                    self._evict_oldest()
+                stats = self._types[alert_type] = AlertTypeStats(
+                    alert_type, self.window_seconds, self.buckets, self.short_tau, self.long_tau)
+            else:
+                self._types.move_to_end(alert_type)
+            stats.window.add(timestamp, count)
+            stats.short_rate.add(timestamp, count)
+            stats.long_rate.add(timestamp, count)
+            stats.total += count
+            stats.last_seen = max(stats.last_seen or timestamp, timestamp)
+            self._overall.add(timestamp, count)
+            self.observed += count
+
+    def observe_record(self, record):
+        """AgentState observer hook (AlertRecord)"""
+        self.observe(record.alert_type, record.timestamp, record.count)
+
+    def _evict_oldest(self):
+        self._types.popitem(last=False)
+
+    # --- detection ---
+    def storm(self, now: Optional[float] = None) -> Optional[dict]:
+        """Alert storm: at least `storm_threshold` alerts within the storm window"""
+        now = time.time() if now is None else now
+        with self._lock:
+            count = self._overall.recent(now, self.storm_window_seconds)
+        if count < self.storm_threshold:
+            return None
+        return {"alert_count": count, "window_minutes": self.storm_window_seconds / 60}
+
+    def dominant(self, now: Optional[float] = None, min_count: int = 3) -> Optional[dict]:
+        """Most frequent alert type over the window, if it fired at least `min_count` times"""
+        now = time.time() if now is None else now
+        with self._lock:
+            total = self._overall.total(now)
+            best, best_count = None, 0
+            for stats in self._types.values():
+                count = stats.window.total(now)
+                if count > best_count:
+                    best, best_count = stats.alert_type, count
+        if best is None or best_count < min_count:
+            return None
+        return {"alert_type": best, "count": best_count, "share": best_count / total if total else 0.0,
+                "window_minutes": self.window_seconds / 60}
+
+    def trending(self, now: Optional[float] = None) -> List[dict]:
+        """Alert types whose short-horizon rate is `trend_ratio` times their long-horizon rate"""
+        now = time.time() if now is None else now
+        rising = []
+        with self._lock:
+            for stats in self._types.values():
+                recent = stats.window.recent(now, self.short_tau)
+                if recent < self.trend_min_events:
+                    continue
+                short, long = stats.short_rate.rate(now), stats.long_rate.rate(now)
+                if long > 0 and short / long >= self.trend_ratio:
+                    rising.append({"alert_type": stats.alert_type, "recent_count": recent,
+                                   "rate_per_hour": round(short * 3600, 2),
+                                   "baseline_per_hour": round(long * 3600, 2),
+                                   "ratio": round(short / long, 2)})
+        return sorted(rising, key=lambda item: item["ratio"], reverse=True)
+
+    def stats(self, now: Optional[float] = None, top: int = 10) -> dict:
+        now = time.time() if now is None else now
+        with self._lock:
+            types = sorted(((stats.window.total(now), stats) for stats in self._types.values()),
+                           key=lambda item: item[0], reverse=True)[:top]
+            summary = {
+                "observed": self.observed,
+                "tracked_types": len(self._types),
+                "window_minutes": self.window_seconds / 60,
+                "alerts_in_window": self._overall.total(now),
+                "alerts_in_storm_window": self._overall.recent(now, self.storm_window_seconds),
+                "top_types": [{"alert_type": stats.alert_type, "count": count,
+                               "rate_per_hour": round(stats.short_rate.rate(now) * 3600, 2),
+                               "baseline_per_hour": round(stats.long_rate.rate(now) * 3600, 2)}
+                              for count, stats in types if count],
+            }
+        summary["storm"] = self.storm(now)
+        summary["trending"] = self.trending(now)
+        return summary
+
+
+if __name__ == "__main__":
+    # Constant cost per alert: 1M alerts spread over 24 hours of simulated time
+    import random
+
+    analytics = AlertRateAnalytics()
+    types = [f"Alert{i}" for i in range(200)]
+    start = time.time() - 86400
+    count = 1_000_000
+    started = time.perf_counter()
+    for i in range(count):
+        analytics.observe(random.choice(types), start + i * 86400 / count)
+    observe_seconds = time.perf_counter() - started
+    now = start + 86400
+    for i in range(30):  # a burst of one type in the last 5 minutes
+        analytics.observe("DiskFull", now - 300 + i * 10)
+
+    started = time.perf_counter()
+    storm, dominant, trending = analytics.storm(now), analytics.dominant(now), analytics.trending(now)
+    detect_seconds = time.perf_counter() - started
+    print(f"observe: {observe_seconds / count * 1e6:.2f} µs/alert over {count:,} alerts")
+    print(f"detect:  {detect_seconds * 1e3:.2f} ms for storm + dominant + trending ({len(types) + 1} types)")
+    print(f"storm={storm}")
+    print(f"dominant={dominant}")
+    print(f"trending={trending[:1]}")
+
+    # Past max_types, each new type evicts the least recently seen one in O(1)
+    capped = AlertRateAnalytics(max_types=1000)
+    for i in range(1000):
+        capped.observe(f"Type{i}", start + i)
+    capped.observe("Type0", start + 1000)
+    capped.observe("New", start + 1000)
+    assert "Type0" in capped._types and "Type1" not in capped._types, "the least recently seen type goes first"
+    count = 100_000
+    started = time.perf_counter()
+    for i in range(count):
+        capped.observe(f"New{i}", start + 1001 + i)
+    evict_seconds = time.perf_counter() - started
+    assert len(capped._types) == 1000 and "New99999" in capped._types
+    print(f"evict:   {evict_seconds / count * 1e6:.2f} µs/alert for new types at max_types=1000")
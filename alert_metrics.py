@@ -0,0 +1,213 @@
+# alert_metrics.py
+"""
+In-process time-series store of alert counts.
+
+Each alert increments one counter per resolution tier, keyed by
+(alert_type, service, severity):
+
+- minute buckets, kept for `minute_retention` (default 48 hours)
+- hour buckets, kept for `hour_retention` (default 30 days)
+- day buckets, kept for `day_retention` (default 1 year)
+
+Writing all tiers on ingest is the rollup: older periods are answered from
+coarser buckets without ever keeping raw records. Memory is bounded by
+retention / bucket width per tier times the number of series, and the number
+of series is capped (extra series are counted under "other").
+
+Range queries ("DiskFull on service X over the last 6 hours, per hour")
+read only the buckets in range. A range starting before the longest
+retention is clamped to it, and a query that would return more than
+`max_points` buckets at the chosen resolution is refused (ValueError).
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Sequence
+
+DIMENSIONS = ("alert_type", "service", "severity")
+OTHER_SERIES = "other"
+
+
+class _Tier:
+    __slots__ = ("name", "step", "retention", "buckets", "_oldest")
+
+    def __init__(self, name: str, step: int, retention: float):
+        self.name = name
+        self.step = step
+        self.retention = retention
+        self.buckets: Dict[int, Dict[tuple, int]] = {}   # bucket start -> series key -> count
+        self._oldest = None
+
+    def add(self, timestamp: float, key: tuple, count: int, now: float):
+        start = int(timestamp // self.step) * self.step
+        if start < now - self.retention:
+            return
+        bucket = self.buckets.get(start)
+        if bucket is None:
+            bucket = self.buckets[start] = {}
+            self._prune(now)
+        bucket[key] = bucket.get(key, 0) + count
+
+    def _prune(self, now: float):
+        """Drop expired buckets; runs once per new bucket, so amortized O(1) per alert"""
+        cutoff = now - self.retention
+        if self._oldest is not None and self._oldest >= cutoff:
+            return
+        for start in [start for start in self.buckets if start < cutoff]:
+            del self.buckets[start]
+        self._oldest = min(self.buckets) if self.buckets else None
+
+    def covers(self, start: float, now: float) -> bool:
+        return start >= now - self.retention
+
+
+class AlertMetricsStore:
+    """Bucketed alert counters with minute / hour / day rollups and range + group-by queries"""
+
+    def __init__(self, minute_retention: float = 48 * 3600, hour_retention: float = 30 * 86400,
+                 day_retention: float = 365 * 86400, max_series: int = 10000, max_points: int = 500):
+        self._tiers = (
+            _Tier("minute", 60, minute_retention),
+            _Tier("hour", 3600, hour_retention),
+            _Tier("day", 86400, day_retention),
+        )
+        self.max_series = max_series
+        self.max_points = max_points
+        self._series = set()
+        self._lock = threading.Lock()
+        self.observed = 0
+        self.overflowed = 0
+
+    def observe(self, alert_type: str, service: str, severity: str, timestamp: Optional[float] = None,
+                count: int = 1):
+        now = time.time()
+        timestamp = now if timestamp is None else timestamp
+        key = (alert_type, service, severity)
+        with self._lock:
+            if key not in self._series:
+                if len(self._series) >= self.max_series:
+                    key = (OTHER_SERIES, OTHER_SERIES, severity)
+                    self.overflowed += count
+                self._series.add(key)
+            for tier in self._tiers:
+                tier.add(timestamp, key, count, now)
+            self.observed += count
+
+    def observe_record(self, record):
+        """AgentState observer hook (AlertRecord)"""
+        self.observe(record.alert_type, record.service, record.severity, record.timestamp, record.count)
+
+    # --- queries ---
+    def _pick_tier(self, start: float, end: float, resolution: str, now: float) -> _Tier:
+        if resolution != "auto":
+            for tier in self._tiers:
+                if tier.name == resolution:
+                    return tier
+            raise ValueError(f"unknown resolution '{resolution}' (use auto, minute, hour or day)")
+        for tier in self._tiers:
+            if tier.covers(start, now) and (end - start) / tier.step <= self.max_points:
+                return tier
+        return self._tiers[-1]
+
+    def query(self, start: float, end: Optional[float] = None, group_by: Sequence[str] = (),
+              filters: Optional[Dict[str, str]] = None, resolution: str = "auto") -> dict:
+        """
+        Counts between `start` and `end` (epoch seconds) at one resolution, one
+        dense series per combination of the `group_by` dimensions.
+        """
+        now = time.time()
+        end = now if end is None else end
+        requested_start = start
+        start = max(start, now - self._tiers[-1].retention)  # nothing older is kept in any tier
+        for dimension in list(group_by) + list(filters or {}):
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"unknown dimension '{dimension}' (use {', '.join(DIMENSIONS)})")
+        if end <= requested_start:
+            raise ValueError("end must be after start")
+        if end <= start:
+            raise ValueError(f"range ends before the oldest retained data "
+                             f"({self._tiers[-1].retention / 86400:g} days ago)")
+        group_index = [DIMENSIONS.index(dimension) for dimension in group_by]
+        filter_index = [(DIMENSIONS.index(dimension), value) for dimension, value in (filters or {}).items()
+                        if value is not None]
+
+        tier = self._pick_tier(start, end, resolution, now)
+        first = int(start // tier.step) * tier.step
+        points = (int(end) - first) // tier.step + 1
+        if points > self.max_points:
+            raise ValueError(f"{points} {tier.name} buckets requested, at most {self.max_points} per query "
+                             f"(narrow the range or use a coarser resolution)")
+        timestamps = list(range(first, int(end) + 1, tier.step))
+        series = {}
+        with self._lock:
+            for position, bucket_start in enumerate(timestamps):
+                bucket = tier.buckets.get(bucket_start)
+                if not bucket:
+                    continue
+                for key, count in bucket.items():
+                    if any(key[index] != value for index, value in filter_index):
+                        continue
+                    group = tuple(key[index] for index in group_index)
+                    counts = series.get(group)
+                    if counts is None:
+                        counts = series[group] = [0] * len(timestamps)
+                    counts[position] += count
+
+        result_series = sorted(
+            ({"group": dict(zip(group_by, group)), "total": sum(counts), "counts": counts}
+             for group, counts in series.items()),
+            key=lambda item: item["total"], reverse=True)
+        return {
+            "resolution": tier.name,
+            "step_seconds": tier.step,
+            "start": first,
+            "end": end,
+            # False when the range starts before this tier's retention
+            "complete": requested_start == start and tier.covers(start, now),
+            "timestamps": timestamps,
+            "total": sum(item["total"] for item in result_series),
+            "series": result_series,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "observed": self.observed,
+                "series": len(self._series),
+                "max_series": self.max_series,
+                "overflowed": self.overflowed,
+                "buckets": {tier.name: len(tier.buckets) for tier in self._tiers},
+                "retention_hours": {tier.name: tier.retention / 3600 for tier in self._tiers},
+            }
+
+
+if __name__ == "__main__":
+    # 30 days of alerts (500k) across 20 types x 10 services, then a few typical queries
+    import random
+
+    store = AlertMetricsStore()
+    now = time.time()
+    count = 500_000
+    started = time.perf_counter()
+    for i in range(count):
+        store.observe(f"Alert{random.randrange(20)}", f"service-{random.randrange(10)}",
+                      random.choice(("critical", "high", "medium", "low")), now - 30 * 86400 + i * 30 * 86400 / count)
+    observe_seconds = time.perf_counter() - started
+
+    for label, args in (("6h DiskFull-like type for one service, per minute",
+                         dict(start=now - 6 * 3600, filters={"alert_type": "Alert3", "service": "service-1"})),
+                        ("7d by service", dict(start=now - 7 * 86400, group_by=("service",))),
+                        ("30d by type x severity", dict(start=now - 30 * 86400, group_by=("alert_type", "severity")))):
+        started = time.perf_counter()
+        result = store.query(**args)
+        print(f"{label}: {result['resolution']} x {len(result['timestamps'])} points, "
+              f"{len(result['series'])} series, total {result['total']} in {(time.perf_counter() - started) * 1e3:.1f} ms")
+    print(f"observe: {observe_seconds / count * 1e6:.2f} µs/alert; {store.stats()['buckets']}")
+
+    # Unbounded ranges are clamped to retention; over-dense ones are refused
+    assert store.query(start=now - 2000 * 86400)["resolution"] == "day"
+    try:
+        store.query(start=now - 2000 * 86400, resolution="minute")
+        raise AssertionError("a 2000 day per-minute query must be refused")
+    except ValueError as e:
+        print(f"refused: {e}")
@@ -0,0 +1,341 @@
+# alerts.py
+"""
+Parsing of grouped Grafana / Alertmanager notifications.
+
+A single webhook can carry dozens of alerts. They are deduplicated by
+fingerprint and grouped by (alertname, service), so a notification with 40
+firing instances of the same alert costs one retrieval and one LLM call.
+Resolved alerts are split out; they need no answer, only a notice.
+
+In front of the queue, repeat firings of the same fingerprint are suppressed
+for a dedup window, and the remaining alerts are split per service (or per
+correlated incident, see alert_correlation.py) so that everything arriving
+for it within the group wait becomes one job and one notification.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+
+from singleflight import alert_fingerprint
+
+# --- SEVERITY ---
+# Queue priority per normalized severity (higher is claimed first)
+SEVERITY_PRIORITY = {"critical": 3, "high": 2, "medium": 1, "low": 0}
+PRIORITY_SEVERITY = {priority: severity for severity, priority in SEVERITY_PRIORITY.items()}
+DEFAULT_SEVERITY = "medium"
+
+_SEVERITY_ALIASES = {
+    "critical": "critical", "crit": "critical", "page": "critical", "emergency": "critical",
+    "fatal": "critical", "disaster": "critical", "p1": "critical", "sev1": "critical",
+    "high": "high", "error": "high", "major": "high", "p2": "high", "sev2": "high",
+    "medium": "medium", "warning": "medium", "warn": "medium", "average": "medium", "p3": "medium", "sev3": "medium",
+    "low": "low", "info": "low", "informational": "low", "minor": "low", "none": "low",
+    "p4": "low", "p5": "low", "sev4": "low",
+}
+
+
+def normalize_severity(value) -> str:
+    """Map Grafana/Alertmanager/PagerDuty style severities onto critical/high/medium/low"""
+    if value is None:
+        return DEFAULT_SEVERITY
+    return _SEVERITY_ALIASES.get(str(value).strip().lower(), DEFAULT_SEVERITY)
+
+
+def alert_severity(alert: dict) -> str:
+    """Severity from the `severity` (or `priority`) label, falling back to annotations / top-level fields"""
+    labels = alert.get("labels") or {}
+    annotations = alert.get("annotations") or {}
+    for source in (labels, annotations, alert):
+        for field in ("severity", "priority"):
+            if source.get(field):
+                return normalize_severity(source[field])
+    return DEFAULT_SEVERITY
+
+
+def alert_service(alert: dict) -> str:
+    """Service from the `service` label, falling back to annotations / top-level field ("" when absent)"""
+    for source in (alert.get("labels") or {}, alert.get("annotations") or {}, alert):
+        if source.get("service"):
+            return str(source["service"])
+    return ""
+
+
+def payload_priority(payload: dict) -> int:
+    """Queue priority of a grouped payload: its most severe firing alert"""
+    priorities = [SEVERITY_PRIORITY[alert_severity(alert)] for alert in payload.get("alerts") or []
+                  if isinstance(alert, dict) and alert.get("status") != "resolved"]
+    return max(priorities) if priorities else SEVERITY_PRIORITY["low"]
+
+
+class ParsedAlert:
+    __slots__ = ("fingerprint", "status", "alert_name", "service_name", "instance",
+                 "summary", "severity", "labels", "annotations", "starts_at", "raw")
+
+    def __init__(self, alert: dict, default_status: str = "firing"):
+        labels = alert.get("labels") or {}
+        annotations = alert.get("annotations") or {}
+        self.fingerprint = alert_fingerprint(alert)
+        self.status = str(alert.get("status") or default_status).lower()
+        self.alert_name = labels.get("alertname", "Unknown Alert")
+        self.service_name = labels.get("service", "an unknown service")
+        self.instance = labels.get("instance", "unknown instance")
+        self.summary = annotations.get("summary", "No summary available")
+        self.severity = alert_severity(alert)
+        self.labels = labels
+        self.annotations = annotations
+        self.starts_at = alert.get("startsAt")
+        self.raw = alert
+
+    @property
+    def group_key(self) -> tuple:
+        return (self.alert_name, self.service_name)
+
+
+class AlertGroup:
+    """Firing alerts sharing an alertname and service; answered once"""
+
+    __slots__ = ("alert_name", "service_name", "alerts")
+
+    def __init__(self, alert_name: str, service_name: str):
+        self.alert_name = alert_name
+        self.service_name = service_name
+        self.alerts: List[ParsedAlert] = []
+
+    @property
+    def instances(self) -> List[str]:
+        instances = []
+        for alert in self.alerts:
+            if alert.instance not in instances:
+                instances.append(alert.instance)
+        return instances
+
+    @property
+    def severity(self) -> str:
+        """Most severe alert in the group"""
+        return max((alert.severity for alert in self.alerts), key=SEVERITY_PRIORITY.get, default=DEFAULT_SEVERITY)
+
+    @property
+    def question(self) -> str:
+        """The retrieval / LLM question for the whole group"""
+        instances = self.instances
+        if len(instances) == 1:
+            where = f"on instance '{instances[0]}'"
+        else:
+            shown = ", ".join(instances[:5]) + (f" and {len(instances) - 5} more" if len(instances) > 5 else "")
+            where = f"on {len(instances)} instances ({shown})"
+        summaries = []
+        for alert in self.alerts:
+            if alert.summary not in summaries:
+                summaries.append(alert.summary)
+        details = "; ".join(summaries[:3])
+        return (f"What are the steps to resolve the '{self.alert_name}' alert for "
+                f"'{self.service_name}' {where}? Alert details: {details}")
+
+
+class IncidentGroup:
+    """Correlated alert groups (possibly across services) answered with one retrieval and one generation"""
+
+    __slots__ = ("incident_id", "groups")
+
+    MAX_LISTED = 8  # alert groups spelled out in the question
+
+    def __init__(self, incident_id: str, groups: List[AlertGroup]):
+        self.incident_id = incident_id
+        self.groups = groups
+
+    @property
+    def alerts(self) -> List[ParsedAlert]:
+        return [alert for group in self.groups for alert in group.alerts]
+
+    @property
+    def alert_name(self) -> str:
+        first = self.groups[0].alert_name
+        return first if len(self.groups) == 1 else f"{first} + {len(self.groups) - 1} related"
+
+    @property
+    def service_name(self) -> str:
+        services = []
+        for group in self.groups:
+            if group.service_name not in services:
+                services.append(group.service_name)
+        return ", ".join(services)
+
+    @property
+    def instances(self) -> List[str]:
+        instances = []
+        for group in self.groups:
+            instances.extend(instance for instance in group.instances if instance not in instances)
+        return instances
+
+    @property
+    def severity(self) -> str:
+        return max((group.severity for group in self.groups), key=SEVERITY_PRIORITY.get, default=DEFAULT_SEVERITY)
+
+    @property
+    def question(self) -> str:
+        listed = []
+        for group in self.groups[:self.MAX_LISTED]:
+            summary = group.alerts[0].summary
+            listed.append(f"'{group.alert_name}' on '{group.service_name}' "
+                          f"({len(group.alerts)} alert(s); {summary})")
+        more = f"; and {len(self.groups) - self.MAX_LISTED} more" if len(self.groups) > self.MAX_LISTED else ""
+        return (f"These alerts fired together and are likely one incident: {'; '.join(listed)}{more}. "
+                f"What is the most likely root cause, and what are the steps to resolve it?")
+
+
+class ParsedNotification:
+    __slots__ = ("firing", "resolved", "duplicates", "invalid")
+
+    def __init__(self):
+        self.firing: List[ParsedAlert] = []
+        self.resolved: List[ParsedAlert] = []
+        self.duplicates = 0
+        self.invalid = 0
+
+    def groups(self) -> List[AlertGroup]:
+        """Firing alerts grouped by (alertname, service), most severe first"""
+        groups = OrderedDict()
+        for alert in self.firing:
+            group = groups.get(alert.group_key)
+            if group is None:
+                group = groups[alert.group_key] = AlertGroup(alert.alert_name, alert.service_name)
+            group.alerts.append(alert)
+        return sorted(groups.values(), key=lambda group: SEVERITY_PRIORITY[group.severity], reverse=True)
+
+
+def parse_notification(request_data: dict) -> ParsedNotification:
+    """Split a webhook payload into unique firing and resolved alerts"""
+    parsed = ParsedNotification()
+    default_status = request_data.get("status") or "firing"
+    seen = set()
+    for alert in request_data.get("alerts") or []:
+        if not isinstance(alert, dict) or not isinstance(alert.get("labels"), dict):
+            parsed.invalid += 1
+            continue
+        item = ParsedAlert(alert, default_status)
+        if item.fingerprint in seen:
+            parsed.duplicates += 1
+            continue
+        seen.add(item.fingerprint)
+        if item.status == "resolved":
+            parsed.resolved.append(item)
+        else:
+            parsed.firing.append(item)
+    return parsed
+
+
+# --- DEDUPLICATION AND GROUPING WINDOWS ---
+class AlertDedupWindow:
+    """
+    Suppresses repeat firings of a fingerprint for `window_seconds` after it was
+    last let through. A resolved alert clears its fingerprint, so a re-fire is
+    reported again. Bounded by entry count (oldest first).
+
+    Checking and committing are separate: `filter()` only drops firings that
+    are already admitted, and the caller `admit()`s fingerprints once their
+    job is queued, so an alert rejected by a full queue is not suppressed
+    when the sender retries it.
+    """
+
+    def __init__(self, window_seconds: float = 300.0, max_entries: int = 50000):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._admitted = OrderedDict()   # fingerprint -> time last let through
+        self.passed = 0
+        self.suppressed = 0
+
+    def filter(self, notification: ParsedNotification) -> int:
+        """Drop repeat firings from the notification in place; returns how many were suppressed"""
+        if self.window_seconds <= 0:
+            return 0
+        now = time.time()
+        kept = []
+        with self._lock:
+            for alert in notification.resolved:
+                self._admitted.pop(alert.fingerprint, None)
+            for alert in notification.firing:
+                admitted_at = self._admitted.get(alert.fingerprint)
+                if admitted_at is not None and now - admitted_at < self.window_seconds:
+                    continue
+                kept.append(alert)
+            suppressed = len(notification.firing) - len(kept)
+            self.suppressed += suppressed
+        notification.firing = kept
+        return suppressed
+
+    def admit(self, fingerprints):
+        """Start the window for firings whose job was queued"""
+        if self.window_seconds <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            for fingerprint in fingerprints:
+                self._admitted[fingerprint] = now
+                self._admitted.move_to_end(fingerprint)
+                self.passed += 1
+            while len(self._admitted) > self.max_entries:
+                self._admitted.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "window_seconds": self.window_seconds,
+                "tracked_fingerprints": len(self._admitted),
+                "passed": self.passed,
+                "suppressed": self.suppressed,
+            }
+
+
+def split_by_group(notification: ParsedNotification, group_by: str = "service") -> Dict[str, dict]:
+    """One webhook-shaped payload per value of the `group_by` label"""
+    grouped = OrderedDict()
+    for alert in notification.firing + notification.resolved:
+        value = str(alert.labels.get(group_by, "unknown"))
+        payload = grouped.setdefault(value, {"status": "resolved", "alerts": []})
+        payload["alerts"].append(dict(alert.raw, status=alert.status, fingerprint=alert.fingerprint))
+        if alert.status != "resolved":
+            payload["status"] = "firing"
+    return grouped
+
+
+def split_by_incident(notification: ParsedNotification, correlator, group_by: str = "service") -> Dict[str, dict]:
+    """
+    One webhook-shaped payload per correlated incident, keyed "incident:<id>".
+    Resolved alerts follow the incident they fired in, or their `group_by`
+    label value ("group:<label>=<value>") when it is no longer known.
+    """
+    grouped = OrderedDict()
+    for alert in notification.firing + notification.resolved:
+        if alert.status == "resolved":
+            incident_id = correlator.incident_for(alert.fingerprint)
+        else:
+            incident_id = correlator.assign(alert)
+        if incident_id is not None:
+            key = f"incident:{incident_id}"
+            payload = grouped.setdefault(key, {"status": "resolved", "incident_id": incident_id, "alerts": []})
+        else:
+            key = f"group:{group_by}={alert.labels.get(group_by, 'unknown')}"
+            payload = grouped.setdefault(key, {"status": "resolved", "alerts": []})
+        payload["alerts"].append(dict(alert.raw, status=alert.status, fingerprint=alert.fingerprint))
+        if alert.status != "resolved":
+            payload["status"] = "firing"
+    return grouped
+
+
+def firing_fingerprints(payload: dict) -> List[str]:
+    """Fingerprints of the firing alerts in a grouped payload"""
+    return [alert_fingerprint(alert) for alert in payload.get("alerts") or [] if alert.get("status") != "resolved"]
+
+
+def merge_alert_payloads(existing: dict, incoming: dict) -> dict:
+    """Combine two grouped payloads; a later state of the same fingerprint wins"""
+    alerts = OrderedDict()
+    for alert in (existing.get("alerts") or []) + (incoming.get("alerts") or []):
+        alerts[alert_fingerprint(alert)] = alert
+    merged = dict(existing)
+    merged["alerts"] = list(alerts.values())
+    merged["status"] = "firing" if any(a.get("status") != "resolved" for a in merged["alerts"]) else "resolved"
+    return merged
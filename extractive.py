@@ -0,0 +1,152 @@
+# extractive.py
+"""
+Fast extractive answers built locally from retrieved runbook chunks.
+
+Used when the LLM misses the per-request deadline or fails: the step lists
+(numbered / bulleted lines and commands) under each runbook heading are pulled
+out, ranked by chunk similarity and word overlap with the question, and
+rendered as a short checklist. No network calls, so it is effectively instant.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+from prompt_builder import ContextChunk, dedupe_chunks
+
+_HEADING = re.compile(r"^\s*#{1,6}\s+(.*\S)\s*$")
+_STEP = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s+(.*\S)\s*$")
+_COMMAND = re.compile(r"^\s*(?:\$\s*)?(?:kubectl|docker|systemctl|helm|telnet|nc|curl|sudo|ps|top|free|df)\b.*$")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "a", "an", "to", "of", "for", "and", "or", "on", "in", "is", "are", "what",
+    "how", "do", "i", "should", "about", "with", "my", "be", "it", "this", "that", "steps",
+    "resolve", "alert", "instance", "details",
+}
+
+
+class ExtractedStep:
+    __slots__ = ("text", "heading", "source", "score")
+
+    def __init__(self, text: str, heading: str, source: str, score: float):
+        self.text = text
+        self.heading = heading
+        self.source = source
+        self.score = score
+
+
+def _keywords(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS and len(word) > 1}
+
+
+def extract_steps(question: str, chunks: List[ContextChunk]) -> List[ExtractedStep]:
+    """All step-like lines from the chunks, best first"""
+    question_words = _keywords(question)
+    steps: List[ExtractedStep] = []
+    seen = set()
+
+    for chunk in dedupe_chunks(chunks):
+        heading = ""
+        for line in chunk.content.splitlines():
+            heading_match = _HEADING.match(line)
+            if heading_match:
+                heading = heading_match.group(1).strip("*# ")
+                continue
+            step_match = _STEP.match(line)
+            if step_match:
+                text = step_match.group(1)
+            elif _COMMAND.match(line):
+                text = f"`{line.strip().lstrip('$ ')}`"
+            else:
+                continue
+            key = text.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+
+            # Similarity of the chunk, boosted by how much of the question the step/heading covers
+            overlap = len(question_words & _keywords(f"{heading} {text}"))
+            coverage = overlap / len(question_words) if question_words else 0.0
+            steps.append(ExtractedStep(text, heading, chunk.source, chunk.score * (1.0 + coverage)))
+
+    steps.sort(key=lambda step: step.score, reverse=True)
+    return steps
+
+
+def build_extractive_answer(question: str, chunks: List[ContextChunk], max_steps: int = 6,
+                            reason: str = "the AI answer is still being generated") -> str:
+    """Render a short checklist answer from the retrieved runbook chunks"""
+    header = f"⚡ Quick answer from the runbooks ({reason}):"
+    steps = extract_steps(question, chunks)[:max_steps]
+
+    if not steps:
+        # No step lists in the context: fall back to the opening of the best chunk
+        best = dedupe_chunks(chunks)[:1]
+        if not best:
+            return f"{header}\n\nNo relevant runbook steps were found."
+        excerpt = " ".join(best[0].content.split())[:400]
+        return f"{header}\n\n{excerpt}\n\n📚 Source: {best[0].source}"
+
+    lines = [header, ""]
+    for i, step in enumerate(steps, 1):
+        context = f" _({step.heading})_" if step.heading else ""
+        lines.append(f"{i}. {step.text}{context}")
+    sources = []
+    for step in steps:
+        if step.source not in sources:
+            sources.append(step.source)
+    lines.append("")
+    lines.append(f"📚 Sources: {', '.join(sources)}")
+    return "\n".join(lines)
+
+
+# --- ASYNCHRONOUS UPGRADES ---
+class AnswerUpgradeStore:
+    """
+    Holds LLM answers that landed after the deadline, keyed by answer id.
+
+    Bounded by entry count and age, so abandoned upgrades don't pile up.
+    """
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def create(self, **fields) -> str:
+        answer_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._entries[answer_id] = {"status": "pending", "created_at": time.time(), **fields}
+            self._evict()
+        return answer_id
+
+    def complete(self, answer_id: str, answer: Optional[str], error: Optional[str] = None):
+        with self._lock:
+            entry = self._entries.get(answer_id)
+            if entry is None:
+                return
+            entry["status"] = "ready" if error is None else "failed"
+            entry["completed_at"] = time.time()
+            if answer is not None:
+                entry["answer"] = answer
+            if error is not None:
+                entry["error"] = error
+
+    def get(self, answer_id: str) -> Optional[dict]:
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(answer_id)
+            return dict(entry) if entry is not None else None
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        while self._entries:
+            oldest_id, oldest = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_entries or oldest["created_at"] < cutoff:
+                self._entries.popitem(last=False)
+            else:
+                break
@@ -0,0 +1,193 @@
+# health_monitor.py
+"""
+Service health served from memory.
+
+Component checks (database, LLM providers, embedding model, vector index,
+queues) run in a background task every `interval` seconds, concurrently and
+each in a worker thread with its own timeout. Health endpoints only read the
+last results, so a load balancer or orchestrator polling them costs no
+database round trip on the request path:
+
+- liveness: the process is up and its event loop answers (no checks at all)
+- readiness: every critical component passed its last check and the results
+  are fresh (a stalled refresh loop makes the worker unready)
+
+A check is a plain callable returning a detail dict. It raises to report the
+component down, or sets "status" in the dict ("degraded", "not_configured",
+"idle", "down").
+"""
+
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Optional
+
+OK = "ok"
+DEGRADED = "degraded"        # working, but impaired (fallbacks in use, queue nearly full, ...)
+IDLE = "idle"                # healthy, not initialized yet (e.g. a lazily loaded model)
+DOWN = "down"
+NOT_CONFIGURED = "not_configured"
+
+# Statuses a critical component may have while the service is ready
+READY_STATUSES = (OK, DEGRADED, IDLE)
+
+
+class ComponentCheck:
+    __slots__ = ("name", "check", "critical", "timeout", "result", "pending")
+
+    def __init__(self, name: str, check: Callable[[], Optional[dict]], critical: bool = True, timeout: float = 5.0):
+        self.name = name
+        self.check = check
+        self.critical = critical
+        self.timeout = timeout
+        self.result = {"status": "unknown", "critical": critical, "checked_at": None}
+        self.pending: Optional[asyncio.Future] = None  # a check still running in its thread
+
+
+class HealthMonitor:
+    """Runs component checks in the background; health reads are O(1) and never block"""
+
+    def __init__(self, interval: float = 30.0, timeout: float = 5.0, stale_after: Optional[float] = None):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after or 3 * interval + timeout
+        self.started_at = time.time()
+        self._checks: Dict[str, ComponentCheck] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._snapshot: Optional[dict] = None   # replaced whole after each refresh, never mutated
+        self.refreshes = 0
+        self.last_refresh_seconds = None
+
+    def register(self, name: str, check: Callable[[], Optional[dict]], critical: bool = True,
+                 timeout: Optional[float] = None):
+        self._checks[name] = ComponentCheck(name, check, critical, timeout or self.timeout)
+
+    # --- background refresh ---
+    async def _run(self, component: ComponentCheck):
+        started = time.perf_counter()
+        error = None
+        detail = {}
+        if component.pending is not None and not component.pending.done():
+            # A hung check keeps its thread; don't pile another one on top of it
+            status, error = DOWN, "previous check still running"
+        else:
+            if component.pending is not None and not component.pending.cancelled():
+                component.pending.exception()  # a late failure of a timed-out check; already reported
+            component.pending = asyncio.ensure_future(asyncio.to_thread(component.check))
+            try:
+                detail = dict(await asyncio.wait_for(asyncio.shield(component.pending), component.timeout) or {})
+                status = detail.pop("status", OK)
+            except asyncio.TimeoutError:
+                status, error = DOWN, f"check timed out after {component.timeout:g}s"
+            except Exception as e:
+                status, error = DOWN, str(e)[:200]
+        result = {"status": status, "critical": component.critical,
+                  "latency_seconds": round(time.perf_counter() - started, 4), "checked_at": time.time(), **detail}
+        if error:
+            result["error"] = error
+        component.result = result
+
+    async def refresh(self) -> dict:
+        """Run every check now and publish the results"""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run(component) for component in list(self._checks.values())))
+        self.refreshes += 1
+        self.last_refresh_seconds = round(time.perf_counter() - started, 4)
+        components = {name: component.result for name, component in self._checks.items()}
+        self._snapshot = {"status": self._overall(components), "checked_at": time.time(), "components": components}
+        return self._snapshot
+
+    @staticmethod
+    def _overall(components: Dict[str, dict]) -> str:
+        if any(result["critical"] and result["status"] not in READY_STATUSES for result in components.values()):
+            return "unhealthy"
+        if any(result["status"] not in (OK, IDLE, NOT_CONFIGURED) for result in components.values()):
+            return "degraded"
+        return "healthy"
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"⚠️ Health monitor: refresh failed: {e}")
+
+    async def start(self):
+        """Refresh once (so the first probe sees real results), then keep refreshing in the background"""
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._loop(), name="health-monitor")
+            print(f"🩺 Health monitor: {len(self._checks)} components checked every {self.interval:g}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # --- reads (request path) ---
+    def snapshot(self) -> dict:
+        """Last published results, with their age; "starting" before the first refresh"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"status": "starting", "checked_at": None, "age_seconds": None, "stale": True, "components": {}}
+        age = time.time() - snapshot["checked_at"]
+        stale = age > self.stale_after
+        return {**snapshot, "status": "unhealthy" if stale else snapshot["status"],
+                "age_seconds": round(age, 3), "stale": stale}
+
+    def live(self) -> dict:
+        return {"status": "alive", "pid": os.getpid(), "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    def ready(self):
+        """(ready, snapshot): fresh results and every critical component in a ready state"""
+        snapshot = self.snapshot()
+        return snapshot["status"] in ("healthy", "degraded"), snapshot
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval,
+            "stale_after_seconds": self.stale_after,
+            "refreshes": self.refreshes,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "components": {name: {"critical": component.critical, "timeout_seconds": component.timeout}
+                           for name, component in self._checks.items()},
+        }
+
+
+if __name__ == "__main__":
+    # A slow, a hung and a failing component; reads stay O(1) while checks run in the background
+    import threading
+
+    hang = threading.Event()
+
+    def _slow():
+        time.sleep(0.05)
+        return {"rows": 1}
+
+    def _failing():
+        raise ConnectionError("connection refused")
+
+    async def _demo():
+        monitor = HealthMonitor(interval=0.2, timeout=0.1)
+        monitor.register("database", _slow)
+        monitor.register("llm", _failing, critical=False)
+        monitor.register("queue", lambda: hang.wait() and {}, critical=False)
+        await monitor.start()
+        snapshot = monitor.snapshot()
+        assert snapshot["status"] == "degraded", snapshot
+        assert snapshot["components"]["queue"]["error"].startswith("check timed out")
+        await asyncio.sleep(0.5)
+        assert monitor.snapshot()["components"]["queue"]["error"] == "previous check still running"
+        started = time.perf_counter()
+        reads = 100_000
+        for _ in range(reads):
+            monitor.ready()
+        read_seconds = time.perf_counter() - started
+        print(f"{monitor.refreshes} refreshes, status {monitor.snapshot()['status']}; "
+              f"ready() {read_seconds / reads * 1e6:.2f} µs per read")
+        hang.set()
+        await monitor.stop()
+
+    asyncio.run(_demo())
@@ -0,0 +1,425 @@
+# health_probes.py
+"""
+Concurrent health probes for the external systems the agent watches.
+
+Each probe (HTTP, TCP, DNS or SQL) runs in its own asyncio loop at its own
+interval with its own timeout; a shared semaphore caps how many checks are
+in flight, and HTTP probes share one pooled httpx client, so hundreds of
+targets are checked from one process without a thread per target. Every
+check feeds a latency histogram; `failure_threshold` consecutive failures
+mark a probe down and `recovery_threshold` successes mark it up again, and
+each transition is reported to `on_change` (the agent turns these into
+autonomous actions).
+
+Configuration is JSON, from HEALTH_PROBES (inline) or HEALTH_PROBES_FILE
+(path):
+
+    {
+      "defaults": {"interval": 30, "timeout": 5, "failure_threshold": 3},
+      "probes": [
+        {"name": "grafana", "type": "http", "url": "https://grafana.example.com/api/health"},
+        {"name": "payments-api", "type": "http", "url": "https://pay.example.com/healthz",
+         "expect_status": [200, 204], "severity": "critical", "interval": 10},
+        {"name": "redis", "type": "tcp", "host": "redis.internal", "port": 6379},
+        {"name": "registry-dns", "type": "dns", "host": "registry.example.com"},
+        {"name": "reporting-db", "type": "sql", "url_env": "REPORTING_DATABASE_URL", "query": "SELECT 1"}
+      ]
+    }
+
+Run `python health_probes.py` for a local check of 300 targets.
+"""
+
+import asyncio
+import json
+import os
+import random
+import socket
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from metrics import Histogram
+
+try:
+    import httpx
+except ImportError:  # only needed for HTTP probes
+    httpx = None
+
+# Probe latency buckets in seconds (LAN round trips up to the longest timeout)
+PROBE_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ProbeError(Exception):
+    """A check that completed but found the target unhealthy"""
+
+
+# --- PROBES ---
+class Probe:
+    """One target; subclasses implement `check()` and raise on failure"""
+
+    kind = "probe"
+
+    def __init__(self, name: str, interval: float = 30.0, timeout: float = 5.0, failure_threshold: int = 3,
+                 recovery_threshold: int = 1, severity: str = "high", system: Optional[str] = None):
+        if interval <= 0 or timeout <= 0:
+            raise ValueError(f"probe {name}: interval and timeout must be positive")
+        self.name = name
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.recovery_threshold = recovery_threshold
+        self.severity = severity
+        self.system = system or name
+        # Health state, only touched by the probe's own loop
+        self.up: Optional[bool] = None      # None until the first verdict
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.checks = 0
+        self.failures = 0
+        self.last_checked_at = None
+        self.last_latency = None
+        self.last_error = None
+        self.changed_at = None
+        self.latency = Histogram(f"probe_{name}", PROBE_LATENCY_BUCKETS)
+
+    @property
+    def target(self) -> str:
+        return self.name
+
+    async def check(self, engine: "ProbeEngine"):
+        raise NotImplementedError
+
+    def record(self, ok: bool, latency: float, error: Optional[str]) -> Optional[str]:
+        """Count one check; returns "down" / "up" when the probe changes state"""
+        self.checks += 1
+        self.last_checked_at = time.time()
+        self.last_latency = round(latency, 4)
+        self.latency.observe(latency)
+        if ok:
+            self.consecutive_successes += 1
+            self.consecutive_failures = 0
+            self.last_error = None
+            if self.up is not True and (self.up is None or self.consecutive_successes >= self.recovery_threshold):
+                transition = "up" if self.up is False else None
+                self.up, self.changed_at = True, self.last_checked_at
+                return transition
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.consecutive_successes = 0
+            self.last_error = error
+            if self.up is not False and self.consecutive_failures >= self.failure_threshold:
+                self.up, self.changed_at = False, self.last_checked_at
+                return "down"
+        return None
+
+    def to_dict(self) -> dict:
+        latency = self.latency.snapshot()
+        return {
+            "type": self.kind,
+            "target": self.target,
+            "up": self.up,
+            "severity": self.severity,
+            "interval_seconds": self.interval,
+            "timeout_seconds": self.timeout,
+            "checks": self.checks,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_checked_at": self.last_checked_at,
+            "last_latency_seconds": self.last_latency,
+            "last_error": self.last_error,
+            "changed_at": self.changed_at,
+            "latency_seconds": {key: latency[key] for key in ("count", "mean", "p50", "p99")},
+        }
+
+
+class HttpProbe(Probe):
+    kind = "http"
+
+    def __init__(self, name: str, url: str, method: str = "GET", expect_status: Sequence[int] = (),
+                 headers: Optional[dict] = None, **options):
+        super().__init__(name, **options)
+        self.url = url
+        self.method = method.upper()
+        self.expect_status = tuple(expect_status)
+        self.headers = headers or {}
+
+    @property
+    def target(self) -> str:
+        return self.url
+
+    async def check(self, engine: "ProbeEngine"):
+        response = await engine.http_client().request(self.method, self.url, headers=self.headers,
+                                                       timeout=self.timeout)
+        healthy = (response.status_code in self.expect_status if self.expect_status
+                   else response.status_code < 400)
+        if not healthy:
+            raise ProbeError(f"HTTP {response.status_code}")
+
+
+class TcpProbe(Probe):
+    kind = "tcp"
+
+    def __init__(self, name: str, host: str, port: int, **options):
+        super().__init__(name, **options)
+        self.host = host
+        self.port = int(port)
+
+    @property
+    def target(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def check(self, engine: "ProbeEngine"):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+class DnsProbe(Probe):
+    kind = "dns"
+
+    def __init__(self, name: str, host: str, **options):
+        super().__init__(name, **options)
+        self.host = host
+
+    @property
+    def target(self) -> str:
+        return self.host
+
+    async def check(self, engine: "ProbeEngine"):
+        addresses = await asyncio.get_running_loop().getaddrinfo(self.host, None, type=socket.SOCK_STREAM)
+        if not addresses:
+            raise ProbeError("no addresses")
+
+
+class SqlProbe(Probe):
+    """Runs `query` on a SQLAlchemy engine in a worker thread (drivers are blocking)"""
+
+    kind = "sql"
+
+    def __init__(self, name: str, engine=None, url: Optional[str] = None, url_env: Optional[str] = None,
+                 query: str = "SELECT 1", **options):
+        super().__init__(name, **options)
+        self.query = query
+        self._engine = engine
+        self._url = url
+        self.url_env = url_env
+
+    @property
+    def target(self) -> str:
+        return f"{self.kind}:{self.url_env or self.name}"
+
+    def _get_engine(self):
+        if self._engine is None:
+            from sqlalchemy import create_engine
+
+            url = self._url or (os.getenv(self.url_env) if self.url_env else None)
+            if not url:
+                raise ProbeError("no database URL configured")
+            self._engine = create_engine(url, pool_pre_ping=True, pool_size=1, max_overflow=0)
+        return self._engine
+
+    def _run_query(self):
+        from sqlalchemy import text
+
+        with self._get_engine().connect() as conn:
+            conn.execute(text(self.query)).fetchall()
+
+    async def check(self, engine: "ProbeEngine"):
+        await asyncio.to_thread(self._run_query)
+
+
+PROBE_TYPES = {cls.kind: cls for cls in (HttpProbe, TcpProbe, DnsProbe, SqlProbe)}
+
+
+# --- ENGINE ---
+class ProbeEngine:
+    """
+    Runs every probe on its own interval until stopped. `on_change(probe,
+    transition)` is called in a worker thread for each up / down transition.
+    """
+
+    def __init__(self, probes: Sequence[Probe], on_change: Optional[Callable] = None, max_concurrency: int = 100):
+        names = [probe.name for probe in probes]
+        if len(set(names)) != len(names):
+            raise ValueError("probe names must be unique")
+        self.probes: Dict[str, Probe] = {probe.name: probe for probe in probes}
+        self.on_change = on_change
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client = None
+        self._tasks: List[asyncio.Task] = []
+        self._stop_event: Optional[asyncio.Event] = None
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def http_client(self):
+        if self._client is None:
+            if httpx is None:
+                raise ProbeError("httpx is not installed")
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency))
+        return self._client
+
+    # --- lifecycle ---
+    async def start(self) -> bool:
+        if self._tasks or not self.probes:
+            return False
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._stop_event = asyncio.Event()
+        self.started_at = time.time()
+        self._tasks = [asyncio.create_task(self._loop(probe), name=f"probe-{probe.name}")
+                       for probe in self.probes.values()]
+        print(f"🩺 Health probes: watching {len(self.probes)} targets "
+              f"({', '.join(sorted({probe.kind for probe in self.probes.values()}))})")
+        return True
+
+    async def stop(self, timeout: float = 10.0) -> bool:
+        if not self._tasks:
+            return False
+        tasks, self._tasks = self._tasks, []
+        self._stop_event.set()
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.started_at = None
+        print("🩺 Health probes: stopped")
+        return True
+
+    # --- checks ---
+    async def _loop(self, probe: Probe):
+        delay = random.uniform(0, min(probe.interval, 5.0))  # spread the first round
+        while True:
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            started = time.monotonic()
+            await self.check(probe)
+            delay = max(probe.interval - (time.monotonic() - started), 0.0)
+
+    async def check(self, probe: Probe) -> bool:
+        """Run one check now; returns whether it passed"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            started = time.perf_counter()
+            error = None
+            try:
+                await asyncio.wait_for(probe.check(self), timeout=probe.timeout)
+            except asyncio.TimeoutError:
+                error = f"timed out after {probe.timeout:g}s"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            latency = time.perf_counter() - started
+        transition = probe.record(error is None, latency, error)
+        if transition:
+            print(f"{'🟢' if transition == 'up' else '🔴'} Health probes: {probe.name} ({probe.target}) is "
+                  f"{transition}" + (f": {error}" if error else ""))
+            if self.on_change is not None:
+                try:
+                    await asyncio.to_thread(self.on_change, probe, transition)
+                except Exception as e:
+                    print(f"⚠️ Health probes: on_change failed for {probe.name}: {e}")
+        return error is None
+
+    async def check_all(self) -> Dict[str, bool]:
+        """Check every probe once, concurrently"""
+        probes = list(self.probes.values())
+        results = await asyncio.gather(*(self.check(probe) for probe in probes))
+        return dict(zip((probe.name for probe in probes), results))
+
+    def summary(self) -> dict:
+        probes = list(self.probes.values())
+        return {
+            "running": self.running,
+            "probes": len(probes),
+            "up": sum(1 for probe in probes if probe.up is True),
+            "down": sorted(probe.name for probe in probes if probe.up is False),
+            "unknown": sum(1 for probe in probes if probe.up is None),
+        }
+
+    def stats(self) -> dict:
+        return dict(self.summary(), max_concurrency=self.max_concurrency, started_at=self.started_at,
+                    targets={name: probe.to_dict() for name, probe in self.probes.items()})
+
+
+def build_probe_engine(on_change: Optional[Callable] = None, extra_probes: Sequence[Probe] = ()) -> ProbeEngine:
+    """Engine from HEALTH_PROBES / HEALTH_PROBES_FILE plus `extra_probes` (e.g. the app's own database)"""
+    raw = os.getenv("HEALTH_PROBES")
+    path = os.getenv("HEALTH_PROBES_FILE")
+    if not raw and path:
+        with open(path, encoding="utf-8") as handle:
+            raw = handle.read()
+    config = json.loads(raw) if raw else {}
+    defaults = config.get("defaults", {})
+    probes = list(extra_probes)
+    for spec in config.get("probes", []):
+        spec = dict(defaults, **spec)
+        name, probe_type = spec.pop("name"), spec.pop("type")
+        probe_class = PROBE_TYPES.get(probe_type)
+        if probe_class is None:
+            raise ValueError(f"Unknown health probe type '{probe_type}' for probe '{name}'")
+        probes.append(probe_class(name, **spec))
+    return ProbeEngine(probes, on_change=on_change,
+                       max_concurrency=int(os.getenv("HEALTH_PROBE_MAX_CONCURRENCY", "100")))
+
+
+if __name__ == "__main__":
+    # 300 local targets: 150 HTTP endpoints (a third of them failing), 100 TCP ports, 50 DNS names
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import threading
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(503 if self.path.endswith("/down") else 200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    class _Server(ThreadingHTTPServer):
+        request_queue_size = 1024  # the default backlog of 5 drops concurrent connects
+
+    server = _Server(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    async def _demo():
+        transitions = []
+        probes = ([HttpProbe(f"http-{i}", f"http://127.0.0.1:{port}/{'down' if i % 3 == 0 else 'ok'}",
+                             interval=1, timeout=2, failure_threshold=1) for i in range(150)] +
+                  [TcpProbe(f"tcp-{i}", "127.0.0.1", port if i % 2 else 1, interval=1, timeout=1, failure_threshold=1)
+                   for i in range(100)] +
+                  [DnsProbe(f"dns-{i}", "localhost", interval=1, timeout=2) for i in range(50)])
+        engine = ProbeEngine(probes, on_change=lambda probe, change: transitions.append((probe.name, change)))
+        started = time.perf_counter()
+        await engine.check_all()
+        round_seconds = time.perf_counter() - started
+        await engine.start()
+        await asyncio.sleep(2.5)
+        await engine.stop()
+        summary = engine.summary()
+        checks = sum(probe.checks for probe in probes)
+        print(f"one round of {len(probes)} probes: {round_seconds * 1e3:.0f} ms; {checks} checks in total")
+        print(f"up={summary['up']} down={len(summary['down'])} unknown={summary['unknown']}; "
+              f"{len(transitions)} down transitions reported")
+        print(f"http-1 latency: {probes[1].to_dict()['latency_seconds']}")
+
+    asyncio.run(_demo())
+    server.shutdown()
@@ -0,0 +1,401 @@
+# job_queue.py
+"""
+Durable local job queue on SQLite (WAL mode).
+
+Alerts accepted by the API survive a container restart: every job is written
+to disk before the webhook is acknowledged. Delivery is at-least-once:
+
+- `claim()` leases a job for `visibility_timeout` seconds; if the worker dies
+  the lease expires and the job becomes claimable again (expired leases are
+  reclaimed before queued jobs, so they are recovered under load too)
+- `ack()` marks it done, `nack()` schedules a retry with exponential backoff;
+  both need the job's `lease_id`, so a worker whose lease expired cannot
+  finish a job another worker has re-claimed
+- after `max_attempts` failed deliveries (including expired leases) the job
+  is copied to `dead_letter`
+- higher `priority` jobs are claimed first; with `aging_seconds`, every
+  `aging_seconds` a job has been waiting counts as one extra priority level,
+  so low priority work is delayed under load but never starved
+
+Run `python job_queue.py bench [count]` for a local throughput benchmark.
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    dedupe_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,              -- queued | running | done | dead
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,        -- not claimable before this (retry backoff)
+    lease_expires_at REAL,             -- running jobs are redelivered after this
+    lease_id TEXT,                     -- token of the current lease; ack / nack must present it
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (queue, status, priority DESC, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (queue, status, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, finished_at);
+
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id TEXT PRIMARY KEY,
+    queue TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+# Columns added after the first release of the schema
+MIGRATIONS = (
+    "ALTER TABLE jobs ADD COLUMN lease_id TEXT",
+)
+
+
+class SQLiteJobQueue:
+    """Persistent multi-producer / multi-consumer queue, safe across threads and processes"""
+
+    def __init__(self, path: str, queue: str = "default", visibility_timeout: float = 300.0,
+                 max_attempts: int = 5, backoff_base: float = 5.0, backoff_max: float = 600.0,
+                 aging_seconds: float = 0.0):
+        self.path = path
+        self.aging_seconds = aging_seconds
+        self.queue = queue
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for statement in MIGRATIONS:
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError:
+                pass  # already applied
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable across process crashes; WAL fsyncs at checkpoint
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # --- producers ---
+    def enqueue(self, payload: dict, dedupe_key: Optional[str] = None, priority: int = 0,
+                delay: float = 0.0) -> tuple:
+        """
+        Persist a job; returns (job_id, created). With a dedupe_key matching a
+        queued or running job, nothing is written and (existing_id, False) is returned.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') LIMIT 1",
+                    (dedupe_key,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return row["id"], False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, queue, dedupe_key, payload, status, priority, attempts, max_attempts, "
+                "created_at, available_at) VALUES (?, ?, ?, ?, 'queued', ?, 0, ?, ?, ?)",
+                (job_id, self.queue, dedupe_key, json.dumps(payload), priority, self.max_attempts, now, now + delay),
+            )
+            conn.execute("COMMIT")
+            return job_id, True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enqueue_or_merge(self, payload: dict, group_key: str, merge: Callable[[dict, dict], dict],
+                         delay: float = 0.0, priority: int = 0) -> tuple:
+        """
+        Fold a payload into the queued (not yet claimed) job for `group_key`, or
+        enqueue a new one that becomes claimable after `delay` seconds. A merge
+        never makes the job wait longer than `delay`, so an urgent payload
+        (delay 0) folded into a delayed job makes it claimable right away.
+        Returns (job_id, created).
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE dedupe_key = ? AND status = 'queued' AND attempts = 0 LIMIT 1",
+                (group_key,),
+            ).fetchone()
+            if row is not None:
+                merged = merge(json.loads(row["payload"]), payload)
+                conn.execute("UPDATE jobs SET payload = ?, priority = MAX(priority, ?), "
+                             "available_at = MIN(available_at, ?) WHERE id = ?",
+                             (json.dumps(merged), priority, now + delay, row["id"]))
+                conn.execute("COMMIT")
+                return row["id"], False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, queue, dedupe_key, payload, status, priority, attempts, max_attempts, "
+                "created_at, available_at) VALUES (?, ?, ?, ?, 'queued', ?, 0, ?, ?, ?)",
+                (job_id, self.queue, group_key, json.dumps(payload), priority, self.max_attempts, now, now + delay),
+            )
+            conn.execute("COMMIT")
+            return job_id, True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- consumers ---
+    def claim(self, min_priority: Optional[int] = None) -> Optional[dict]:
+        """
+        Lease the next available job (or one whose lease expired); None when idle.
+        With `min_priority`, only jobs at or above that base priority are considered.
+        """
+        conn = self._conn()
+        now = time.time()
+        if self.aging_seconds > 0:
+            # priority + waited / aging_seconds, ranked without depending on `now`
+            order = "ORDER BY priority * ? - available_at DESC"
+            order_args = (self.aging_seconds,)
+        else:
+            order = "ORDER BY priority DESC, available_at"
+            order_args = ()
+        floor = min_priority if min_priority is not None else -(2 ** 31)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A worker that keeps dying mid-job exhausts the attempts like any other failure
+            for job in conn.execute(
+                    "SELECT * FROM jobs WHERE queue = ? AND status = 'running' AND lease_expires_at <= ? "
+                    "AND attempts >= max_attempts", (self.queue, now)).fetchall():
+                self._bury(conn, job, job["last_error"] or "lease expired (worker died or timed out)", now)
+                print(f"💀 job_queue: job {job['id']} dead-lettered after {job['attempts']} expired attempts")
+            # Expired leases first: they have waited longest and must not starve behind new work
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE queue = ? AND status = 'running' AND lease_expires_at <= ? "
+                "AND priority >= ? LIMIT 1",
+                (self.queue, now, floor),
+            ).fetchone()
+            if row is not None:
+                print(f"♻️ job_queue: lease expired, redelivering job {row['id']}")
+            else:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE queue = ? AND status = 'queued' AND available_at <= ? AND priority >= ? "
+                    + order + " LIMIT 1",
+                    (self.queue, now, floor) + order_args,
+                ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires_at = ?, lease_id = ?, "
+                "started_at = ? WHERE id = ?",
+                (now + self.visibility_timeout, uuid.uuid4().hex, now, row["id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(job)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def ack(self, job_id: str, lease_id: str, result=None) -> bool:
+        """Mark a job done; False when the lease is no longer held (expired and re-claimed)"""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, lease_expires_at = NULL, result = ? "
+            "WHERE id = ? AND status = 'running' AND lease_id = ?",
+            (time.time(), json.dumps(result, default=str) if result is not None else None, job_id, lease_id),
+        )
+        return cursor.rowcount == 1
+
+    def _bury(self, conn: sqlite3.Connection, job, error: str, now: float):
+        """Move a job to dead_letter (caller holds the write transaction)"""
+        conn.execute(
+            "UPDATE jobs SET status = 'dead', finished_at = ?, lease_expires_at = NULL, last_error = ? WHERE id = ?",
+            (now, error, job["id"]),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO dead_letter (id, queue, payload, attempts, last_error, created_at, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job["id"], job["queue"], job["payload"], job["attempts"], error, job["created_at"], now),
+        )
+
+    def nack(self, job_id: str, lease_id: str, error: str, retry: bool = True) -> str:
+        """
+        Record a failed delivery; returns the job's new status ('queued' or
+        'dead'), or its current one when the lease is no longer held.
+        With `retry=False` the job goes straight to dead_letter.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None or job["status"] != "running" or job["lease_id"] != lease_id:
+                conn.execute("COMMIT")
+                return job["status"] if job is not None else "missing"
+            if not retry or job["attempts"] >= job["max_attempts"]:
+                self._bury(conn, job, error, now)
+                status = "dead"
+            else:
+                backoff = min(self.backoff_max, self.backoff_base * (2 ** (job["attempts"] - 1)))
+                backoff *= random.uniform(0.8, 1.2)
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, lease_expires_at = NULL, last_error = ? WHERE id = ?",
+                    (now + backoff, error, job_id),
+                )
+                status = "queued"
+            conn.execute("COMMIT")
+            return status
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- inspection / maintenance ---
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def depth(self) -> int:
+        """Jobs waiting to be claimed (including ones in retry backoff)"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = 'queued'", (self.queue,)
+        ).fetchone()[0]
+
+    def depth_by_priority(self) -> dict:
+        """Waiting jobs per base priority"""
+        rows = self._conn().execute(
+            "SELECT priority, COUNT(*) AS n FROM jobs WHERE queue = ? AND status = 'queued' GROUP BY priority",
+            (self.queue,),
+        ).fetchall()
+        return {row["priority"]: row["n"] for row in rows}
+
+    def counts(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE queue = ? GROUP BY status", (self.queue,)
+        ).fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "dead": 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        counts["dead_letter"] = self._conn().execute(
+            "SELECT COUNT(*) FROM dead_letter WHERE queue = ?", (self.queue,)
+        ).fetchone()[0]
+        return counts
+
+    def dead_letters(self, limit: int = 50) -> list:
+        rows = self._conn().execute(
+            "SELECT * FROM dead_letter WHERE queue = ? ORDER BY failed_at DESC LIMIT ?", (self.queue, limit)
+        ).fetchall()
+        return [dict(row, payload=json.loads(row["payload"])) for row in rows]
+
+    def purge_finished(self, older_than_seconds: float = 86400.0) -> int:
+        """Delete done/dead jobs older than the retention (dead letters are kept)"""
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'dead') AND finished_at < ?",
+            (time.time() - older_than_seconds,),
+        )
+        return cursor.rowcount
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _benchmark(count: int = 5000):
+    """Enqueue / claim+ack throughput on local disk"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        job_queue = SQLiteJobQueue(os.path.join(tmp, "bench.db"), queue="bench")
+        payload = {"status": "firing", "alerts": [{"labels": {"alertname": "DiskFull", "service": "api"}}]}
+
+        started = time.perf_counter()
+        for _ in range(count):
+            job_queue.enqueue(payload)
+        enqueue_rate = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for i in range(count):
+            job_queue.enqueue(payload, dedupe_key=f"key-{i % 100}")
+        dedupe_rate = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        processed = 0
+        while True:
+            job = job_queue.claim()
+            if job is None:
+                break
+            job_queue.ack(job["id"], job["lease_id"], {"ok": True})
+            processed += 1
+        drain_rate = processed / (time.perf_counter() - started)
+
+        print(f"enqueue:          {enqueue_rate:,.0f} jobs/s ({count} jobs)")
+        print(f"enqueue (dedupe): {dedupe_rate:,.0f} jobs/s")
+        print(f"claim + ack:      {drain_rate:,.0f} jobs/s ({processed} jobs)")
+        job_queue.close()
+
+
+def _check_merge():
+    """An urgent payload merged into a delayed group job makes it claimable at once"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        job_queue = SQLiteJobQueue(os.path.join(tmp, "check.db"), queue="check")
+        merge = lambda queued, new: {"alerts": queued["alerts"] + new["alerts"]}
+        job_id, created = job_queue.enqueue_or_merge({"alerts": ["warning"]}, "group:api", merge, delay=30, priority=1)
+        assert created and job_queue.claim() is None, "a delayed job must not be claimable yet"
+        merged_id, created = job_queue.enqueue_or_merge({"alerts": ["critical"]}, "group:api", merge,
+                                                        delay=0, priority=3)
+        assert merged_id == job_id and not created
+        job = job_queue.claim()
+        assert job is not None and job["id"] == job_id, "a critical merge must make the job claimable"
+        assert job["priority"] == 3 and job["payload"]["alerts"] == ["warning", "critical"], job
+        job_queue.close()
+    print("✅ merge check passed")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        _benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 5000)
+    elif len(sys.argv) > 1 and sys.argv[1] == "check":
+        _check_merge()
+    else:
+        print("usage: python job_queue.py bench [count] | check")
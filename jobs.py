@@ -0,0 +1,251 @@
+# jobs.py
+"""
+Background job processing for alert payloads.
+
+Webhook handlers only validate and enqueue the payload, then answer 202
+Accepted with a job id; a bounded pool of worker threads runs the slow
+embed + search + LLM + Slack pipeline. Jobs are stored in a durable SQLite
+queue (see job_queue.py), so accepted alerts survive a restart and can be
+processed by workers inside the API or by a separate `python main.py worker`.
+Job status can be polled by id.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+from job_queue import SQLiteJobQueue
+from metrics import Histogram
+
+# Queue wait buckets in seconds (sub-second pickup up to long backlogs)
+QUEUE_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+class JobQueueFull(Exception):
+    """The intake queue is at capacity; the caller should retry later"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """False for client errors (an HTTPException-style `status_code` below 500): a retry would fail the same way"""
+    status_code = getattr(error, "status_code", None)
+    return not (isinstance(status_code, int) and status_code < 500)
+
+
+def job_to_dict(job: dict) -> dict:
+    """Public view of a queue row"""
+    info = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "attempts": job["attempts"],
+        "priority": job["priority"],
+    }
+    if job["started_at"]:
+        info["queue_wait_seconds"] = round(job["started_at"] - job["created_at"], 3)
+    if job["finished_at"] and job["started_at"]:
+        info["processing_seconds"] = round(job["finished_at"] - job["started_at"], 3)
+    if job["status"] == "queued" and job["attempts"]:
+        info["retry_at"] = job["available_at"]
+    if job.get("result") is not None:
+        info["result"] = job["result"]
+    if job.get("last_error") is not None:
+        info["error"] = job["last_error"]
+    return info
+
+
+class JobManager:
+    """
+    Durable queue plus a fixed pool of worker threads.
+
+    Jobs submitted with a `key` that matches a queued or running job are
+    coalesced onto that job instead of being processed twice. Failed jobs are
+    retried with backoff and dead-lettered after the queue's max_attempts.
+
+    Higher priority jobs are claimed first (with aging, see SQLiteJobQueue);
+    `reserved_workers` of the pool only take jobs at `reserved_min_priority`
+    or above, so urgent jobs never wait behind a pool busy with noise.
+    """
+
+    def __init__(self, name: str, handler: Callable[[dict], dict], job_queue: SQLiteJobQueue,
+                 workers: int = 4, max_queue: int = 1000, poll_interval: float = 1.0,
+                 retention_seconds: float = 86400.0, autostart: bool = True,
+                 reserved_workers: int = 0, reserved_min_priority: Optional[int] = None,
+                 priority_names: Optional[dict] = None):
+        self.name = name
+        self.reserved_workers = min(reserved_workers, max(workers - 1, 0)) if reserved_min_priority is not None else 0
+        self.reserved_min_priority = reserved_min_priority
+        self.priority_names = priority_names or {}
+        self._wait_histograms = {}          # priority -> Histogram of queue wait
+        self.handler = handler
+        self.queue = job_queue
+        self.workers = workers
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.autostart = autostart
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = False
+        self._last_purge = 0.0
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.coalesced = 0
+
+    # --- lifecycle ---
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._worker, name=f"{self.name}-worker-{i}", daemon=True,
+                                 args=(self.reserved_min_priority if i < self.reserved_workers else None,))
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        counts = self.queue.counts()
+        print(f"👷 {self.name}: started {self.workers} workers "
+              f"({counts['queued']} queued, {counts['running']} in flight from before)")
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads = list(self._threads)
+        self._wakeup.set()
+        for thread in threads:
+            thread.join(timeout=timeout)
+        print(f"👷 {self.name}: workers stopped")
+
+    def run_forever(self):
+        """Standalone worker process: run the pool until interrupted"""
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    # --- intake ---
+    def submit(self, payload: dict, key: Optional[str] = None, merge: Optional[Callable[[dict, dict], dict]] = None,
+               delay: float = 0.0, priority: int = 0) -> dict:
+        """
+        Persist a payload and return the job's public view; raises JobQueueFull.
+
+        With `merge`, `key` is a grouping key: the payload is folded into the
+        group's job while it is still waiting (for up to `delay` seconds).
+        """
+        if self.autostart:
+            self.start()
+        if self.queue.depth() >= self.max_queue:
+            raise JobQueueFull(f"{self.name} queue is full ({self.max_queue} jobs)")
+        if merge is not None:
+            job_id, created = self.queue.enqueue_or_merge(payload, key, merge, delay=delay, priority=priority)
+        else:
+            job_id, created = self.queue.enqueue(payload, dedupe_key=key, delay=delay, priority=priority)
+        if created:
+            self._wakeup.set()
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        job = self.queue.get(job_id)
+        return job_to_dict(job) if job is not None else None
+
+    def stats(self) -> dict:
+        counts = self.queue.counts()
+        depth_by_priority = self.queue.depth_by_priority()
+        with self._lock:
+            histograms = dict(self._wait_histograms)
+        priorities = {}
+        for priority in sorted(set(depth_by_priority) | set(histograms), reverse=True):
+            wait = histograms[priority].snapshot() if priority in histograms else None
+            priorities[self.priority_names.get(priority, str(priority))] = {
+                "priority": priority,
+                "queue_depth": depth_by_priority.get(priority, 0),
+                "wait_seconds": {key: wait[key] for key in ("count", "mean", "p50", "p99")} if wait else None,
+            }
+        return {
+            "workers": self.workers,
+            "reserved_workers": self.reserved_workers,
+            "priorities": priorities,
+            "workers_running": self._running,
+            "queue_path": self.queue.path,
+            "queue_depth": counts["queued"],
+            "queue_capacity": self.max_queue,
+            "running": counts["running"],
+            "done": counts["done"],
+            "dead_letter": counts["dead_letter"],
+            # Counters below are for this process only
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "coalesced": self.coalesced,
+        }
+
+    # --- workers ---
+    def _worker(self, min_priority: Optional[int] = None):
+        while self._running:
+            try:
+                job = self.queue.claim(min_priority=min_priority)
+            except Exception as e:
+                print(f"❌ {self.name}: claim failed: {e}")
+                job = None
+            if job is None:
+                self._maybe_purge()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _run(self, job: dict):
+        # Wait since the job became claimable (excludes grouping delays and retry backoff)
+        self._wait_histogram(job["priority"]).observe(max(job["started_at"] - job["available_at"], 0.0))
+        try:
+            result = self.handler(job["payload"])
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e)
+            status = self.queue.nack(job["id"], job["lease_id"], error, retry=is_retryable(e))
+            with self._lock:
+                if status == "dead":
+                    self.dead_lettered += 1
+                elif status == "queued":
+                    self.retried += 1
+            print(f"❌ {self.name}: job {job['id']} attempt {job['attempts']} failed ({status}): {error}")
+            return
+        if not self.queue.ack(job["id"], job["lease_id"], result):
+            print(f"⚠️ {self.name}: job {job['id']} finished after its lease expired; the redelivery owns it now")
+            return
+        with self._lock:
+            self.completed += 1
+
+    def _wait_histogram(self, priority: int) -> Histogram:
+        with self._lock:
+            histogram = self._wait_histograms.get(priority)
+            if histogram is None:
+                name = self.priority_names.get(priority, str(priority))
+                histogram = self._wait_histograms[priority] = Histogram(f"{self.name}_wait_{name}", QUEUE_WAIT_BUCKETS)
+            return histogram
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < 600:
+                return
+            self._last_purge = now
+        try:
+            purged = self.queue.purge_finished(self.retention_seconds)
+            if purged:
+                print(f"🧹 {self.name}: purged {purged} finished jobs")
+        except Exception as e:
+            print(f"⚠️ {self.name}: purge failed: {e}")
@@ -0,0 +1,418 @@
+# llm_provider.py
+"""
+LLM provider abstraction for answer generation.
+
+Endpoints call `LLMClient.generate(prompt)` instead of a module level Gemini
+model. The client walks a fallback chain of providers, each guarded by a
+circuit breaker: after N consecutive failures the breaker opens and the
+provider is skipped outright until a half-open probe succeeds. When every
+provider is unavailable `LLMUnavailableError` is raised immediately, so the
+endpoints fall back to the runbook context without burning a retry budget.
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+from metrics import Histogram
+
+
+class LLMError(Exception):
+    """A provider failed to generate an answer"""
+
+
+class LLMUnavailableError(LLMError):
+    """No provider in the chain could take the request (failed or breaker open)"""
+
+
+class LLMResponse:
+    """Generated answer; `.text` mirrors the google.generativeai response object"""
+    __slots__ = ("text", "provider", "latency")
+
+    def __init__(self, text: str, provider: str, latency: float = 0.0):
+        self.text = text
+        self.provider = provider
+        self.latency = latency
+
+
+# --- CIRCUIT BREAKER ---
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    closed:    calls go through, consecutive failures are counted
+    open:      calls are rejected until reset_timeout has elapsed
+    half_open: up to half_open_max_calls probe calls are let through; a
+               success closes the breaker, a failure re-opens it
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0,
+                 half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        with self._lock:
+            self._maybe_half_open()
+            status = {"state": self._state, "consecutive_failures": self._failures}
+            if self._state == self.OPEN:
+                status["retry_in_seconds"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return status
+
+
+# --- PROVIDERS ---
+class LLMProvider:
+    """Interface every generation backend implements"""
+    name = "base"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google.generativeai, with backoff on rate limiting (429)"""
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", max_retries: int = 3):
+        import google.generativeai as genai
+        self.name = f"gemini:{model_name}"
+        self.model_name = model_name
+        self.max_retries = max_retries
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str) -> str:
+        for attempt in range(self.max_retries):
+            try:
+                return self._model.generate_content(prompt).text
+            except Exception as retry_error:
+                if "429" in str(retry_error) or "quota" in str(retry_error).lower():
+                    if attempt < self.max_retries - 1:
+                        # Wait with exponential backoff
+                        wait_time = (2 ** attempt) + random.uniform(0, 1)
+                        print(f"DEBUG: Rate limited, waiting {wait_time:.1f} seconds before retry {attempt + 1}/{self.max_retries}")
+                        time.sleep(wait_time)
+                        continue
+                raise LLMError(f"{self.name}: {retry_error}") from retry_error
+        raise LLMError(f"{self.name}: retries exhausted")
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic local backend for tests and benchmarks.
+
+    The answer only depends on the prompt: it echoes the step-like lines of
+    the context (numbered/bulleted lines and commands) with a short digest of
+    the prompt. STUB_LLM_LATENCY_MS simulates a slow provider and
+    STUB_LLM_FAILURE_RATE makes a deterministic share of prompts fail.
+    """
+    name = "stub"
+    _STEP_LINE = re.compile(r"^\s*(?:\d+[.)]|[-*•]|\$|kubectl|docker|systemctl)\s*")
+
+    def __init__(self, latency_ms: float = 0.0, failure_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+
+    def generate(self, prompt: str) -> str:
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.failure_rate and int(digest[:8], 16) / 0xFFFFFFFF < self.failure_rate:
+            raise LLMError("stub: simulated failure")
+        context = prompt.split("Instructions:", 1)[0]
+        steps = [line.strip() for line in context.splitlines() if self._STEP_LINE.match(line)]
+        body = "\n".join(steps[:8]) if steps else "No step-by-step procedure found in the provided context."
+        return f"[stub answer {digest[:8]}]\n{body}"
+
+
+# --- FALLBACK CHAIN ---
+class LLMClient:
+    """Tries providers in order, skipping any whose circuit breaker is open"""
+
+    def __init__(self, providers: List[LLMProvider], failure_threshold: int = 3,
+                 reset_timeout: float = 60.0):
+        if not providers:
+            raise ValueError("LLMClient needs at least one provider")
+        self.providers = providers
+        self.breakers = {
+            provider.name: CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+            for provider in providers
+        }
+
+    @property
+    def primary_name(self) -> str:
+        return self.providers[0].name
+
+    def generate(self, prompt: str) -> LLMResponse:
+        errors = []
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            if not breaker.allow_request():
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            started = time.perf_counter()
+            try:
+                text = provider.generate(prompt)
+            except Exception as e:
+                breaker.record_failure()
+                errors.append(f"{provider.name}: {e}")
+                print(f"⚠️ LLM provider {provider.name} failed ({breaker.state}): {e}")
+                continue
+            breaker.record_success()
+            return LLMResponse(text, provider.name, time.perf_counter() - started)
+        raise LLMUnavailableError("; ".join(errors))
+
+    def status(self) -> list:
+        return [{"provider": provider.name, **self.breakers[provider.name].status()}
+                for provider in self.providers]
+
+
+def build_llm_client(providers: Optional[str] = None) -> LLMClient:
+    """
+    Build the provider chain from LLM_PROVIDERS (comma separated, in fallback
+    order; "gemini" and "stub" are known). Breaker tuning comes from
+    LLM_BREAKER_FAILURE_THRESHOLD and LLM_BREAKER_RESET_SECONDS.
+    """
+    names = [name.strip().lower() for name in (providers or os.getenv("LLM_PROVIDERS", "gemini")).split(",") if name.strip()]
+    chain: List[LLMProvider] = []
+    for name in names:
+        if name == "gemini":
+            chain.append(GeminiProvider(model_name=os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+                                        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3"))))
+        elif name == "stub":
+            chain.append(StubProvider(latency_ms=float(os.getenv("STUB_LLM_LATENCY_MS", "0")),
+                                      failure_rate=float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))))
+        else:
+            print(f"⚠️ Unknown LLM provider '{name}' ignored")
+    if not chain:
+        print("⚠️ No valid LLM_PROVIDERS configured, defaulting to gemini")
+        chain.append(GeminiProvider())
+
+    return LLMClient(
+        chain,
+        failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "3")),
+        reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "60")),
+    )
+
+
+# --- REQUEST HEDGING ---
+class LatencyTracker:
+    """Recent successful generation latencies, for adaptive hedge delays"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class HedgedLLMClient:
+    """
+    Wraps an LLMClient with request hedging to cut tail latency.
+
+    If the first call hasn't returned after the `hedge_percentile` of recent
+    latencies, a second identical call is sent and whichever finishes first
+    wins. The loser is cancelled if it hasn't started yet; a Gemini call that
+    is already on the wire can't be interrupted, so its result is discarded.
+    At most `max_hedge_ratio` of the last `ratio_window` requests may be
+    hedged, which caps the extra quota spend.
+    """
+
+    def __init__(self, client: LLMClient, hedge_percentile: float = 95.0,
+                 min_delay: float = 0.5, max_hedge_ratio: float = 0.1,
+                 min_samples: int = 20, ratio_window: int = 200, max_workers: int = 16):
+        self.client = client
+        self.hedge_percentile = hedge_percentile
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.hedged_latency = Histogram("llm_hedged_latency_seconds")
+        self.unhedged_latency = Histogram("llm_unhedged_latency_seconds")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._recent = deque(maxlen=ratio_window)  # True for hedged requests
+        self._recent_hedged = 0
+        self._lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.hedges_denied = 0
+
+    # Keep the LLMClient surface so callers don't care whether hedging is on
+    @property
+    def providers(self):
+        return self.client.providers
+
+    @property
+    def primary_name(self) -> str:
+        return self.client.primary_name
+
+    def hedge_delay(self) -> Optional[float]:
+        """Adaptive delay before hedging, or None until enough latencies are known"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        observed = self.latencies.percentile(self.hedge_percentile)
+        return max(self.min_delay, observed) if observed is not None else None
+
+    def _remember(self, hedged: bool):
+        """Add a request to the ratio window (caller holds _lock)"""
+        if len(self._recent) == self._recent.maxlen and self._recent[0]:
+            self._recent_hedged -= 1
+        self._recent.append(hedged)
+        if hedged:
+            self._recent_hedged += 1
+
+    def _hedge_allowed(self) -> bool:
+        """Check the cap and reserve the hedge in the same critical section, so a burst can't overshoot it"""
+        with self._lock:
+            allowed = (self._recent_hedged + 1) / (len(self._recent) + 1) <= self.max_hedge_ratio
+            if allowed:
+                self._remember(True)
+                self.hedges_sent += 1
+            else:
+                self.hedges_denied += 1
+        return allowed
+
+    def generate(self, prompt: str) -> LLMResponse:
+        started = time.perf_counter()
+        delay = self.hedge_delay()
+        primary = self._executor.submit(self.client.generate, prompt)
+
+        if delay is not None:
+            done, _ = wait([primary], timeout=delay)
+            if not done and self._hedge_allowed():
+                return self._race(primary, prompt, delay, started)
+
+        try:
+            response = primary.result()
+        except Exception:
+            self._finish(started, hedged=False)
+            raise
+        self._finish(started, hedged=False, response=response)
+        return response
+
+    def _race(self, primary, prompt: str, delay: float, started: float) -> LLMResponse:
+        """Send the hedge and return whichever call succeeds first"""
+        print(f"🔀 LLM call exceeded {delay:.2f}s (p{self.hedge_percentile:g}), sending hedged request")
+        hedge = self._executor.submit(self.client.generate, prompt)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                if future is hedge:
+                    with self._lock:
+                        self.hedges_won += 1
+                self._finish(started, hedged=True, response=response)
+                return response
+        self._finish(started, hedged=True)
+        raise last_error
+
+    def _finish(self, started: float, hedged: bool, response: Optional[LLMResponse] = None):
+        elapsed = time.perf_counter() - started
+        if not hedged:  # hedged requests were counted when the hedge was reserved
+            with self._lock:
+                self._remember(False)
+        if response is not None:
+            # Single-call latency feeds the adaptive delay; end-to-end goes to the histograms
+            self.latencies.record(response.latency)
+        (self.hedged_latency if hedged else self.unhedged_latency).observe(elapsed)
+
+    def status(self) -> list:
+        return self.client.status()
+
+    def hedging_stats(self) -> dict:
+        with self._lock:
+            recent_total = len(self._recent)
+            recent_hedged = self._recent_hedged
+            hedges_sent, hedges_won, hedges_denied = self.hedges_sent, self.hedges_won, self.hedges_denied
+        delay = self.hedge_delay()
+        return {
+            "enabled": True,
+            "hedge_percentile": self.hedge_percentile,
+            "current_hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+            "max_hedge_ratio": self.max_hedge_ratio,
+            "recent_hedge_ratio": round(recent_hedged / recent_total, 3) if recent_total else 0.0,
+            "hedges_sent": hedges_sent,
+            "hedges_won": hedges_won,
+            "hedges_denied_by_cap": hedges_denied,
+            "latency_hedged": self.hedged_latency.snapshot(),
+            "latency_unhedged": self.unhedged_latency.snapshot(),
+        }
+
+
+def build_hedged_client(client: LLMClient) -> HedgedLLMClient:
+    """Wrap a client with hedging configured from LLM_HEDGE_* environment variables"""
+    return HedgedLLMClient(
+        client,
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+        min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5")),
+        max_hedge_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+        min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+    )
@@ -43,6 +43,7 @@ print(f"✅ Using API key: {google_api_key[:10]}...{google_api_key[-4:]}")
 print("=== END ENVIRONMENT DEBUG ===")
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import requests
@@ -56,12 +57,66 @@ import certifi
 import ssl
 #----------------
 import asyncio
-import schedule
 import threading
 from datetime import datetime, timedelta
 import json
+import functools
+import inspect
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from extractive import AnswerUpgradeStore, build_extractive_answer
+from prompt_builder import (
+    CANDIDATE_CHUNKS,
+    ContextChunk,
+    build_prompt,
+    format_source_context,
+)
+from agent_history import ActionRecord, AlertRecord
+from agent_memory import AgentMemoryStore, AgentState
+from alert_analytics import AlertRateAnalytics
+from alert_metrics import AlertMetricsStore
+from agent_scheduler import AgentScheduler
+from agent_leader import FileLeaderElection, LeaderElectedScheduler
+from health_probes import SqlProbe, build_probe_engine
+from health_monitor import DEGRADED, DOWN, IDLE, NOT_CONFIGURED, HealthMonitor
+from alerts import (
+    PRIORITY_SEVERITY, SEVERITY_PRIORITY, AlertDedupWindow, IncidentGroup, alert_service, alert_severity,
+    firing_fingerprints, merge_alert_payloads, parse_notification, payload_priority, split_by_group,
+    split_by_incident,
+)
+from alert_correlation import build_alert_correlator
+from jobs import JobManager, JobQueueFull
+from notifier import NotificationQueueFull, build_digest_aggregator, build_slack_dispatcher
+from sinks import build_notification_router
+from job_queue import SQLiteJobQueue
+from llm_provider import LLMUnavailableError, build_hedged_client, build_llm_client
+from singleflight import AsyncSingleFlight, SingleFlight, normalize_question, payload_key
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, RequestMetricsMiddleware
+# --- APP LIFECYCLE ---
+# Background components (worker pools, schedulers, ...) register start/stop
+# callbacks here; they run inside the FastAPI lifespan.
+startup_hooks = []
+shutdown_hooks = []
+
+@asynccontextmanager
+async def lifespan(app):
+    for hook in startup_hooks:
+        result = hook()
+        if inspect.isawaitable(result):
+            await result
+    yield
+    for hook in reversed(shutdown_hooks):
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"⚠️ Shutdown hook {getattr(hook, '__name__', hook)} failed: {e}")
+
 # --- INITIALIZATION ---
-app = FastAPI(title="DevOps Sentinel Query Agent", version="1.0.0")
+app = FastAPI(title="DevOps Sentinel Query Agent", version="1.0.0", lifespan=lifespan)
 
 # --- NEW: Add CORS Middleware ---
 origins = [
@@ -83,6 +138,35 @@ app.add_middleware(
 
 print("--- CORS middleware configured for Streamlit integration ---")
 
+# --- METRICS ---
+# Prometheus families behind GET /metrics: request counts and latency per
+# route, latency per pipeline stage; gauges are read at scrape time (see the
+# PROMETHEUS METRICS section). Every sample carries a worker label (the pid):
+# with `uvicorn --workers N` each worker answers scrapes with its own numbers.
+metrics_registry = MetricsRegistry(const_labels={"worker": str(os.getpid())})
+HTTP_REQUESTS = metrics_registry.counter(
+    "sentinel_http_requests_total", "HTTP requests by method, route and status", ("method", "endpoint", "status"))
+HTTP_REQUEST_SECONDS = metrics_registry.histogram(
+    "sentinel_http_request_duration_seconds", "HTTP request latency by method and route", ("method", "endpoint"))
+PIPELINE_STAGE_SECONDS = metrics_registry.histogram(
+    "sentinel_pipeline_stage_duration_seconds",
+    "Latency of each answer pipeline stage (encode, vector_search, prompt_build, llm, slack, model_load)", ("stage",))
+app.add_middleware(RequestMetricsMiddleware, requests=HTTP_REQUESTS, latency=HTTP_REQUEST_SECONDS)
+
+def pipeline_stage(stage: str):
+    """Decorator timing every call in sentinel_pipeline_stage_duration_seconds{stage=...}"""
+    histogram = PIPELINE_STAGE_SECONDS.labels(stage)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+build_prompt = pipeline_stage("prompt_build")(build_prompt)
+
 # --- GEMINI CONFIGURATION ---
 genai.configure(api_key=google_api_key)
 
@@ -158,9 +242,21 @@ print("Initializing application...")
 
 # Don't load the model during startup - load it when needed
 sentence_model = None
+sentence_model_lock = threading.Lock()  # Pipelines run in worker threads; load the model once
 
 def get_sentence_model():
     """Lazy load the sentence transformer model with memory optimization"""
+    global sentence_model
+    if sentence_model is not None:
+        return sentence_model
+    with sentence_model_lock:
+        if sentence_model is None:
+            # Timed only when this call actually loads; waiters on the lock record nothing
+            with PIPELINE_STAGE_SECONDS.labels("model_load").time():
+                _load_sentence_model()
+        return sentence_model
+
+def _load_sentence_model():
     global sentence_model
     if sentence_model is None:
         print("Loading lightweight embedding model...")
@@ -206,11 +302,148 @@ def cleanup_model():
             print(f"⚠️ Model cleanup warning: {e}")
             sentence_model = None
 
-# Initialize the Gemini model (for generation)
-print("Initializing Gemini model...")
-generation_model = genai.GenerativeModel('gemini-2.5-flash')  # Much higher free tier limits
+# --- RETRIEVAL HELPERS ---
+def embed_question(question: str) -> list:
+    """Embed a question and pad it to the 768 dimensions stored in TiDB"""
+    return embed_questions([question])[0]
 
-print("--- Gemini 2.5 Flash initialized successfully ---")
+def embed_questions(questions: list) -> list:
+    """Embed several questions in one batched encode (padded to 768 dimensions)"""
+    model = get_sentence_model()
+    with PIPELINE_STAGE_SECONDS.labels("encode").time():
+        embeddings = [vector.tolist() for vector in model.encode(questions)]
+    print(f"DEBUG: Generated {len(embeddings)} embedding(s) with {len(embeddings[0]) if embeddings else 0} dimensions")
+
+    # 🔧 DIMENSION COMPATIBILITY FIX
+    # Pad 384-dim vectors to 768-dim to match existing database vectors
+    for query_embedding in embeddings:
+        if len(query_embedding) == 384:
+            query_embedding.extend([0.0] * (768 - 384))
+    return embeddings
+
+KNOWLEDGE_SEARCH_SQL = text("""
+    SELECT 
+        content_chunk,
+        source_file,
+        VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(:query_vector)) as distance
+    FROM knowledgebase
+    ORDER BY distance ASC
+    LIMIT :limit;
+""")
+
+def _search_with_connection(connection, query_embedding: list, limit: int) -> list:
+    # Convert to proper vector format for TiDB
+    query_vector = f"[{','.join(map(str, query_embedding))}]"
+    rows = connection.execute(KNOWLEDGE_SEARCH_SQL, {"query_vector": query_vector, "limit": limit}).fetchall()
+    return [ContextChunk(content=row[0], source=row[1], distance=float(row[2] or 0.0)) for row in rows]
+
+@pipeline_stage("vector_search")
+def search_knowledge_base(query_embedding: list, limit: int = CANDIDATE_CHUNKS) -> list:
+    """Vector search in TiDB, returning ContextChunks ordered by cosine distance"""
+    with engine.connect() as connection:
+        return _search_with_connection(connection, query_embedding, limit)
+
+@pipeline_stage("vector_search")
+def search_knowledge_base_many(query_embeddings: list, limit: int = CANDIDATE_CHUNKS) -> list:
+    """One vector search per embedding over a single pooled connection"""
+    with engine.connect() as connection:
+        return [_search_with_connection(connection, embedding, limit) for embedding in query_embeddings]
+
+# Initialize the LLM provider chain (for generation)
+# Defaults to Gemini 2.5 Flash; LLM_PROVIDERS="gemini,stub" adds fallbacks,
+# LLM_PROVIDERS=stub gives a deterministic local backend for tests/benchmarks
+print("Initializing LLM providers...")
+llm_client = build_llm_client()
+if os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true":
+    # Send a second call when the first is slower than the recent p95 (capped share)
+    llm_client = build_hedged_client(llm_client)
+    print("--- LLM request hedging enabled ---")
+
+print(f"--- LLM chain initialized: {', '.join(p.name for p in llm_client.providers)} ---")
+
+@pipeline_stage("llm")
+def generate_with_llm(prompt: str):
+    """llm_client.generate, timed as the "llm" pipeline stage"""
+    return llm_client.generate(prompt)
+
+# --- SLACK DELIVERY ---
+# Handlers only queue Slack messages; background senders post them over a pooled
+# keep-alive session with retries (honouring Retry-After), per-webhook rate
+# limiting and batching, so API latency never includes Slack's round trip.
+slack_dispatcher = build_slack_dispatcher()
+startup_hooks.append(slack_dispatcher.start)
+shutdown_hooks.append(slack_dispatcher.stop)
+
+# Alert and agent notifications fan out to the configured sinks (Slack webhooks,
+# HTTP webhooks, JSONL file) by service/severity routes; each sink has its own
+# queue and workers. Without NOTIFICATION_SINKS everything goes to SLACK_WEBHOOK_URL.
+notification_router = build_notification_router(slack_dispatcher)
+startup_hooks.append(notification_router.start)
+shutdown_hooks.append(notification_router.stop)
+
+# Agent notifications are digested per sink + severity (critical ones go out
+# immediately) and capped per minute, so event storms can't flood the channel
+SLACK_DIGEST_ENABLED = os.getenv("SLACK_DIGEST_ENABLED", "true").lower() == "true"
+agent_digest = build_digest_aggregator(notification_router)
+if SLACK_DIGEST_ENABLED:
+    startup_hooks.append(agent_digest.start)
+    shutdown_hooks.append(agent_digest.stop)
+
+# --- DEADLINE-AWARE GENERATION ---
+# /process-input/ never waits on the LLM past its latency budget: when the
+# deadline passes, an extractive answer is built from the retrieved runbook
+# chunks and the LLM answer (if it lands later) is stored as an upgrade.
+ANSWER_DEADLINE_SECONDS = float(os.getenv("ANSWER_DEADLINE_SECONDS", "8"))
+ANSWER_UPGRADES_ENABLED = os.getenv("ANSWER_UPGRADES_ENABLED", "true").lower() == "true"
+llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                                  thread_name_prefix="llm")
+answer_upgrades = AnswerUpgradeStore()
+
+def request_deadline(request_data: dict) -> float:
+    """Latency budget for a request in seconds (payload `deadline_ms` overrides the default)"""
+    try:
+        if request_data.get("deadline_ms") is not None:
+            return min(max(float(request_data["deadline_ms"]) / 1000.0, 0.1), 120.0)
+    except (TypeError, ValueError):
+        print(f"⚠️ Ignoring invalid deadline_ms={request_data.get('deadline_ms')!r}")
+    return ANSWER_DEADLINE_SECONDS
+
+def generate_within_deadline(prompt: str, timeout: float):
+    """Start generation and wait at most `timeout` seconds; returns (response or None, future)"""
+    future = llm_executor.submit(generate_with_llm, prompt)
+    try:
+        return future.result(timeout=max(timeout, 0.0)), future
+    except FutureTimeoutError:
+        return None, future
+
+def schedule_answer_upgrade(future, question: str, alert_name: str = "", service_name: str = "") -> str:
+    """Record the late LLM answer when it lands; for alerts, also post it to Slack"""
+    answer_id = answer_upgrades.create(question=question)
+
+    def _on_done(done_future):
+        try:
+            upgraded_answer = done_future.result().text
+        except Exception as e:
+            print(f"DEBUG: Late LLM answer {answer_id} failed: {e}")
+            answer_upgrades.complete(answer_id, None, error=str(e))
+            return
+        answer_upgrades.complete(answer_id, upgraded_answer)
+        print(f"⬆️ LLM answer {answer_id} landed after the deadline")
+
+        if alert_name:
+            update_message = f"""🔄 **UPDATE: {alert_name}** 🔄
+
+📋 **Service:** {service_name}
+
+🤖 **DevOps Sentinel's AI Recommended Action:**
+{upgraded_answer}"""
+            try:
+                notification_router.publish(update_message, service=service_name, kind="alert")
+            except NotificationQueueFull as e:
+                print(f"DEBUG: Failed to queue upgraded answer notification: {e}")
+
+    future.add_done_callback(_on_done)
+    return answer_id
 
 
 # --- API DATA MODELS ---
@@ -231,6 +464,7 @@ class QueryResponse(BaseModel):
     answer: str
     source_context: str
     success: bool
+    prompt_tokens: Optional[int] = None
 
 class SlackRequest(BaseModel):
     message: str
@@ -254,15 +488,19 @@ class AlertRequest(BaseModel):
             }
         }
 
-# --- Global cache for health status ---
-# Store the status outside the function to remember it between calls
-health_cache = {
-    "status": "unhealthy",
-    "database": "unknown", 
-    "gemini": "unknown",
-    "last_check_time": 0  # Store the time of the last check
-}
-CACHE_DURATION_SECONDS = 60  # Check status only once per minute
+# --- SERVICE HEALTH ---
+# Component checks run in the background every HEALTH_REFRESH_SECONDS (see the
+# SERVICE HEALTH CHECKS section); the health endpoints only read the results.
+health_monitor = HealthMonitor(interval=float(os.getenv("HEALTH_REFRESH_SECONDS", "30")),
+                               timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "5")))
+
+# --- REQUEST COALESCING ---
+# Concurrent duplicates (Grafana firing the same alert from several instances,
+# several engineers asking the same question) wait on one in-flight pipeline run
+query_flight = SingleFlight("query-agent")
+grafana_flight = SingleFlight("grafana-alert")
+alert_trigger_flight = AsyncSingleFlight("alert-trigger")
+process_input_flight = AsyncSingleFlight("process-input")
 
 # --- API ENDPOINTS ---
 @app.get("/")
@@ -271,71 +509,47 @@ def root():
 
 @app.get("/health")
 async def health_check():
-    """Railway-compatible health check"""
-    try:
-        health_status = {
-            "status": "healthy",
-            "timestamp": time.time(),
-            "environment": "railway"
-        }
-        
-        # Test database connection
-        try:
-            if engine:
-                with engine.connect() as conn:
-                    conn.execute(text("SELECT 1"))
-                health_status["database"] = "connected"
-            else:
-                health_status["database"] = "not_configured"
-        except Exception as db_error:
-            health_status["database"] = f"error: {str(db_error)[:100]}"
-        
-        # Test Gemini API
-        google_api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
-        health_status["gemini"] = "configured" if google_api_key else "not_configured"
-        
-        return health_status
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
+    """Railway-compatible health check, served from the background-refreshed component status"""
+    snapshot = health_monitor.snapshot()
+    database = snapshot["components"].get("database", {})
+    health_status = {
+        "status": snapshot["status"],
+        "timestamp": time.time(),
+        "environment": "railway",
+        # Summary fields kept from the original response
+        "database": {"ok": "connected", "not_configured": "not_configured"}.get(
+            database.get("status"), f"error: {database.get('error', database.get('status', 'unknown'))}"),
+        "gemini": "configured" if os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY") else "not_configured",
+    }
+    return {**health_status, "checked_at": snapshot["checked_at"], "age_seconds": snapshot["age_seconds"],
+            "components": snapshot["components"]}
 
-@app.post("/query-agent/", response_model=QueryResponse)
-def query_agent(request: QueryRequest):
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the process and its event loop respond (no checks)"""
+    return health_monitor.live()
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: 503 while a critical component is down or the health results are stale"""
+    ready, snapshot = health_monitor.ready()
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, **snapshot})
+
+def run_query_agent(request: QueryRequest):
     """Query the knowledge base using vector similarity search and generate answer with Gemini"""
     
     try:
         print(f"DEBUG: Processing question: {request.question}")  # Added debug logging
         
         # 1. Create embedding for the incoming question
-        query_embedding = get_sentence_model().encode(request.question).tolist()
-        print(f"DEBUG: Generated embedding with {len(query_embedding)} dimensions")  # Added debug logging
+        query_embedding = embed_question(request.question)
         
-        # 🔧 DIMENSION COMPATIBILITY FIX
-        if len(query_embedding) == 384:
-            query_embedding.extend([0.0] * (768 - 384))
-            print(f"DEBUG: Padded embedding to {len(query_embedding)} dimensions")
+        # 2. Perform vector search in TiDB to get context
+        chunks = search_knowledge_base(query_embedding)
         
-        # 2. Convert to proper vector format for TiDB
-        query_vector = f"[{','.join(map(str, query_embedding))}]"
+        print(f"DEBUG: Found {len(chunks)} relevant documents")  # Added debug logging
         
-        # 3. Perform vector search in TiDB to get context
-        with engine.connect() as connection:
-            stmt = text("""
-                SELECT 
-                    content_chunk,
-                    source_file,
-                    VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(:query_vector)) as distance
-                FROM knowledgebase
-                ORDER BY distance ASC
-                LIMIT 3;
-            """)
-            
-            result = connection.execute(stmt, {"query_vector": query_vector})
-            rows = result.fetchall()
-        
-        print(f"DEBUG: Found {len(rows)} relevant documents")  # Added debug logging
-        
-        if not rows:
+        if not chunks:
             print("DEBUG: No relevant documents found in knowledge base")  # Added debug logging
             return {
                 "question": request.question,
@@ -345,66 +559,36 @@ def query_agent(request: QueryRequest):
             }
 
         # Get the best matching context (lowest distance = highest similarity)
-        best_context = rows[0][0]  # content_chunk
-        source_file = rows[0][1]   # source_file
+        best_context = chunks[0].content
+        source_file = chunks[0].source
         
-        # Combine multiple contexts for richer answers
-        all_contexts = "\n\n".join([row[0] for row in rows[:2]])  # Top 2 results
+        # 3. Fit as much de-duplicated context as the token budget allows
+        built_prompt = build_prompt("query", chunks, question=request.question)
+        prompt = built_prompt.text
         
-        # Create source context with multiple sources
-        source_contexts = []
-        for i, row in enumerate(rows[:3]):  # Show top 3 sources
-            source_contexts.append(f"Source {i+1}: {row[1]}\n\nContext: {row[0][:300]}...")
+        # Create source context with multiple sources (previews cut by tokens)
+        combined_source_context = format_source_context(built_prompt.chunks or chunks)
         
-        # Join with clear separators between sources
-        combined_source_context = ("\n\n" + "="*50 + "\n\n").join(source_contexts)
-        
-        print(f"DEBUG: Using context from: {source_file} (and {len(rows)-1} other sources)")  # Added debug logging
+        print(f"DEBUG: Using context from: {source_file} (and {len(built_prompt.chunks)-1} other sources)")  # Added debug logging
+        print(f"DEBUG: Prompt uses {built_prompt.prompt_tokens}/{built_prompt.budget} tokens "
+              f"({built_prompt.dropped_chunks} chunks dropped)")
         
         # --- STEP 4 - GENERATE AN ANSWER USING GEMINI ---
         try:
             print("DEBUG: Calling Gemini API...")
             
-            # Create a clean prompt for Gemini
-            prompt = f"""
-You are a helpful and knowledgeable DevOps assistant. Based on the context provided below, answer the user's question in a clear, practical, and actionable way.
-
-Context from knowledge base:
-{all_contexts}
-
-User Question: {request.question}
-
-Instructions:
-- Provide a direct, helpful answer based on the context
-- Include specific steps or recommendations when applicable
-- If the context doesn't fully answer the question, mention what information is available
-- Keep the response practical and actionable for DevOps scenarios
-"""
-            
-            # Try calling Gemini with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = generation_model.generate_content(prompt)
-                    llm_answer = response.text
-                    print("DEBUG: Successfully received response from Gemini")
-                    break
-                except Exception as retry_error:
-                    if "429" in str(retry_error) or "quota" in str(retry_error).lower():
-                        if attempt < max_retries - 1:
-                            # Wait with exponential backoff
-                            wait_time = (2 ** attempt) + random.uniform(0, 1)
-                            print(f"DEBUG: Rate limited, waiting {wait_time:.1f} seconds before retry {attempt + 1}/{max_retries}")
-                            time.sleep(wait_time)
-                            continue
-                    raise retry_error
+            # Provider chain handles rate-limit retries and the circuit breaker
+            response = generate_with_llm(prompt)
+            llm_answer = response.text
+            print(f"DEBUG: Successfully received response from {response.provider}")
             
             # Return the final, polished answer from Gemini
             return {
                 "question": request.question,
                 "answer": llm_answer,
                 "source_context": combined_source_context,
-                "success": True
+                "success": True,
+                "prompt_tokens": built_prompt.prompt_tokens
             }
             
         except Exception as e:
@@ -424,7 +608,8 @@ Instructions:
                 "question": request.question,
                 "answer": f"LLM service unavailable. Here's the relevant information from the knowledge base:\n\n{best_context}",
                 "source_context": combined_source_context,
-                "success": False
+                "success": False,
+                "prompt_tokens": built_prompt.prompt_tokens
             }
             
     except Exception as e:
@@ -432,6 +617,11 @@ Instructions:
         print(f"DEBUG: Error type: {type(e).__name__}")
         raise HTTPException(status_code=500, detail=f"Query processing failed: {str(e)}")
 
+@app.post("/query-agent/", response_model=QueryResponse)
+def query_agent(request: QueryRequest):
+    """Query the knowledge base; identical concurrent questions share one pipeline run"""
+    return query_flight.do(normalize_question(request.question), lambda: run_query_agent(request))
+
 @app.post("/notify-slack/")
 def notify_slack(request: SlackRequest):
     """Sends a message to a configured Slack channel."""
@@ -440,62 +630,32 @@ def notify_slack(request: SlackRequest):
         raise HTTPException(status_code=500, detail="Slack webhook URL is not configured.")
 
     try:
-        print(f"DEBUG: Sending message to Slack: {request.message[:100]}...")  # Added debug logging
+        print(f"DEBUG: Queueing message for Slack: {request.message[:100]}...")  # Added debug logging
         
-        # Format the message for Slack's API
-        payload = {"text": f"🤖 DevOps Sentinel Alert:\n\n{request.message}"}
-
-        # Send the request
-        response = requests.post(slack_webhook_url, json=payload, timeout=10)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-
-        print("DEBUG: Successfully sent message to Slack")  # Added debug logging
-        return {"success": True, "message": "Notification sent to Slack."}
+        # Delivered in the background (pooled connection, retries, rate limiting)
+        notification_id = slack_dispatcher.send(f"🤖 DevOps Sentinel Alert:\n\n{request.message}", slack_webhook_url)
+        return {"success": True, "message": "Notification queued for Slack.", "notification_id": notification_id,
+                "status_url": f"/notifications/{notification_id}"}
         
-    except requests.exceptions.RequestException as e:
-        print(f"DEBUG: Failed to send to Slack: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to send notification to Slack: {str(e)}")
+    except NotificationQueueFull as e:
+        print(f"DEBUG: Failed to queue for Slack: {e}")
+        raise HTTPException(status_code=503, detail=f"Failed to queue notification for Slack: {str(e)}")
 
-@app.post("/alert-trigger/")
-async def alert_trigger(request: AlertRequest):
-    """
-    Receives an alert, processes it through the full RAG pipeline, 
-    and sends a notification to Slack with AI-generated solution.
-    """
+def run_alert_trigger(request: AlertRequest):
+    """Blocking RAG + Slack pipeline behind /alert-trigger/"""
     print(f"DEBUG: Received alert: {request.title}")
     
     try:
         # --- 1. Run the RAG Process (Logic from /query-agent/) ---
         question = request.message
-        query_embedding = get_sentence_model().encode(question).tolist()
-        print(f"DEBUG: Generated embedding for alert with {len(query_embedding)} dimensions")
-        
-        # DIMENSION COMPATIBILITY FIX
-        if len(query_embedding) == 384:
-            query_embedding.extend([0.0] * (768 - 384))
-            print(f"DEBUG: Padded alert embedding to {len(query_embedding)} dimensions")
-        
-        # Convert to proper vector format for TiDB
-        query_vector = f"[{','.join(map(str, query_embedding))}]"
+        query_embedding = embed_question(question)
         
         # Perform vector search in TiDB to get context
-        with engine.connect() as connection:
-            stmt = text("""
-                SELECT 
-                    content_chunk,
-                    source_file,
-                    VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(:query_vector)) as distance
-                FROM knowledgebase
-                ORDER BY distance ASC
-                LIMIT 2;
-            """)
-            
-            result = connection.execute(stmt, {"query_vector": query_vector})
-            rows = result.fetchall()
+        chunks = search_knowledge_base(query_embedding)
         
-        print(f"DEBUG: Found {len(rows)} relevant documents for alert")
+        print(f"DEBUG: Found {len(chunks)} relevant documents for alert")
         
-        if not rows:
+        if not chunks:
             print("DEBUG: No relevant runbook found for this alert")
             return {
                 "error": "No relevant runbook documents found for this alert.",
@@ -504,68 +664,39 @@ async def alert_trigger(request: AlertRequest):
             }
 
         # Get the best matching context
-        retrieved_chunk = rows[0][0]  # content_chunk
-        source_file = rows[0][1]     # source_file
+        retrieved_chunk = chunks[0].content
+        source_file = chunks[0].source
         
-        # Combine multiple contexts if available
-        all_contexts = "\n\n".join([row[0] for row in rows])
+        # Combine as many de-duplicated contexts as the token budget allows
+        built_prompt = build_prompt("alert_trigger", chunks, title=request.title, message=request.message)
+        prompt = built_prompt.text
         
         print(f"DEBUG: Using runbook context from: {source_file}")
+        print(f"DEBUG: Prompt uses {built_prompt.prompt_tokens}/{built_prompt.budget} tokens")
 
         # --- 2. Generate Answer with Gemini ---
         try:
             print("DEBUG: Calling Gemini API for alert processing...")
             
-            prompt = f"""
-You are an expert DevOps incident response assistant. An alert has fired with the following details:
-
-**Alert Title:** {request.title}Invoke-RestMethod -Uri "http://127.0.0.1:8000/process-input/" -Method POST -ContentType "application/json" -Body '{"question": "What should I do about database connection timeouts?"}'Invoke-RestMethod -Uri "http://127.0.0.1:8000/process-input/" -Method POST -ContentType "application/json" -Body '{"question": "What should I do about database connection timeouts?"}'Invoke-RestMethod -Uri "http://127.0.0.1:8000/process-input/" -Method POST -ContentType "application/json" -Body '{"question": "What should I do about database connection timeouts?"}'
-**Alert Message:** {request.message}
-
-Based on the runbook context below, provide a concise, actionable solution:
-
-**Runbook Context:**
-{all_contexts}
-
-Instructions:
-- Provide immediate action steps to resolve this alert
-- Include specific commands or procedures if available in the context
-- Prioritize critical actions first
-- Keep the response focused and actionable for incident response
-- If the context doesn't fully cover the alert, mention what steps are available
-"""
-            
-            # Try calling Gemini with retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = generation_model.generate_content(prompt)
-                    llm_answer = response.text
-                    print("DEBUG: Successfully received alert response from Gemini")
-                    break
-                except Exception as retry_error:
-                    if "429" in str(retry_error) or "quota" in str(retry_error).lower():
-                        if attempt < max_retries - 1:
-                            wait_time = (2 ** attempt) + random.uniform(0, 1)
-                            print(f"DEBUG: Rate limited, waiting {wait_time:.1f} seconds before retry {attempt + 1}/{max_retries}")
-                            time.sleep(wait_time)
-                            continue
-                    raise retry_error
+            # Provider chain handles rate-limit retries and the circuit breaker
+            response = generate_with_llm(prompt)
+            llm_answer = response.text
+            print(f"DEBUG: Successfully received alert response from {response.provider}")
                     
         except Exception as e:
             print(f"DEBUG: Gemini failed on alert processing: {e}")
             # Fallback to context-only response
             llm_answer = f"Alert received but LLM service unavailable. Here's the relevant runbook information:\n\n{retrieved_chunk}"
 
-        # --- 3. Send the Final Answer to Slack ---
-        slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-        if not slack_webhook_url:
+        # --- 3. Send the Final Answer to Slack (and any other routed sinks) ---
+        if not notification_router.configured:
             print("DEBUG: Slack webhook URL not configured")
             return {
                 "error": "Slack webhook URL is not configured.",
                 "success": False,
                 "generated_solution": llm_answer,
-                "alert_title": request.title
+                "alert_title": request.title,
+                "prompt_tokens": built_prompt.prompt_tokens
             }
         
         # Format the final message for Slack
@@ -581,31 +712,40 @@ Instructions:
 ⏰ **Processed:** {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime())}"""
         
         try:
-            print("DEBUG: Sending alert resolution to Slack...")
-            payload = {"text": final_message}
-            slack_response = requests.post(slack_webhook_url, json=payload, timeout=10)
-            slack_response.raise_for_status()
-
-            print("DEBUG: Alert notification sent to Slack successfully")
+            print("DEBUG: Queueing alert resolution for Slack...")
+            notification_ids = notification_router.publish(final_message, kind="alert")
             return {
                 "success": True,
-                "message": "Alert processed and notification sent to Slack.",
-                "alert_title": request.title
+                "message": "Alert processed and notification queued for Slack.",
+                "notification_id": notification_ids[0] if notification_ids else None,
+                "alert_title": request.title,
+                "prompt_tokens": built_prompt.prompt_tokens
             }
             
-        except requests.exceptions.RequestException as e:
-            print(f"DEBUG: Failed to send alert notification to Slack: {e}")
+        except NotificationQueueFull as e:
+            print(f"DEBUG: Failed to queue alert notification for Slack: {e}")
             return {
                 "success": False,
-                "error": f"Alert processed but failed to send notification to Slack: {str(e)}",
+                "error": f"Alert processed but failed to queue notification for Slack: {str(e)}",
                 "generated_solution": llm_answer,
-                "alert_title": request.title
+                "alert_title": request.title,
+                "prompt_tokens": built_prompt.prompt_tokens
             }
         
     except Exception as e:
         print(f"DEBUG: General alert processing error: {e}")
         raise HTTPException(status_code=500, detail=f"Alert processing failed: {str(e)}")
 
+@app.post("/alert-trigger/")
+async def alert_trigger(request: AlertRequest):
+    """
+    Receives an alert, processes it through the full RAG pipeline, 
+    and sends a notification to Slack with AI-generated solution.
+    The same alert firing concurrently is processed (and posted) once.
+    """
+    key = payload_key({"title": request.title, "message": request.message})
+    return await alert_trigger_flight.do(key, lambda: asyncio.to_thread(run_alert_trigger, request))
+
 # --- Additional utility endpoints ---
 @app.get("/stats")
 def get_stats():
@@ -637,7 +777,8 @@ def get_stats():
                 "unique_sources": unique_sources,
                 "embedding_model": "all-MiniLM-L6-v2 (memory-optimized, padded to 768)",
                 "vector_dimensions": "384→768 (compatibility mode)",  # Updated for clarity
-                "llm_model": "gemini-2.5-flash",
+                "llm_model": llm_client.primary_name,
+                "llm_providers": llm_client.status(),
                 "memory_usage": memory_info,
                 "model_loaded": sentence_model is not None
             }
@@ -645,18 +786,30 @@ def get_stats():
         print(f"DEBUG: Stats endpoint error: {e}")  # Added debug logging
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
+@app.get("/llm/stats")
+def get_llm_stats():
+    """Provider circuit breakers plus hedged vs unhedged latency histograms"""
+    return {
+        "providers": llm_client.status(),
+        "hedging": llm_client.hedging_stats() if hasattr(llm_client, "hedging_stats") else {"enabled": False},
+    }
+
 @app.post("/test-gemini/")
 def test_gemini(request: QueryRequest):
     """Test Gemini API directly"""
     try:
         print(f"DEBUG: Testing Gemini with question: {request.question}")  # Added debug logging
-        response = generation_model.generate_content(f"Answer this DevOps question: {request.question}")
+        response = generate_with_llm(f"Answer this DevOps question: {request.question}")
         print("DEBUG: Gemini test successful")  # Added debug logging
         return {
             "question": request.question,
             "gemini_response": response.text,
+            "provider": response.provider,
             "success": True
         }
+    except LLMUnavailableError as e:
+        print(f"DEBUG: No LLM provider available: {e}")
+        raise HTTPException(status_code=503, detail=f"No LLM provider available: {str(e)}")
     except Exception as e:
         # --- DETAILED ERROR LOGGING FOR GEMINI TEST ---
         print(f"DEBUG: Gemini test failed: {e}")
@@ -664,13 +817,222 @@ def test_gemini(request: QueryRequest):
         print(f"DEBUG: Error details: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Gemini API failed: {str(e)}")
 
-@app.post("/grafana-alert/", response_model=QueryResponse)
-def grafana_alert(request_data: dict):
-    """
-    Receive a Grafana alert or a direct question, process it, 
-    and return the answer or send a notification to Slack.
-    """
-    is_alert = False
+# --- GROUPED ALERT PROCESSING ---
+# One webhook can carry many alerts. They are deduplicated by fingerprint and
+# grouped by (alertname, service); all groups share one batched encode and one
+# DB connection, and their LLM calls run concurrently on llm_executor.
+ALERT_MAX_GROUPS_PER_PAYLOAD = int(os.getenv("ALERT_MAX_GROUPS_PER_PAYLOAD", "10"))
+
+def learn_from_alert(alert_name: str, service_name: str, llm_answer: str, chunks: list, result: dict,
+                     count: int = 1, severity: str = "medium"):
+    """Store a processed alert in agent memory and trigger autonomous learning"""
+    agent_state.record_alert(AlertRecord(
+        alert_name, service_name, time.time(), severity=severity,
+        resolved="success" in result,
+        solution_found=len(chunks) > 0,
+        response_quality="high" if llm_answer and len(llm_answer) > 100 else "low",
+        count=count
+    ))
+    
+    # Trigger autonomous learning action
+    autonomous_action("grafana_alert_processed", {
+        "alert_name": alert_name,
+        "service": service_name,
+        "system": "grafana_monitoring",
+        "severity": "info",
+        "solution_provided": len(llm_answer) > 0,
+        "knowledge_base_hit": len(chunks) > 0,
+        "timestamp": time.time()
+    })
+    
+    print(f"🧠 Agent learned from alert: {alert_name} for {service_name}")
+
+def answer_alert_groups(groups: list, deadline_seconds: float, request_started: float) -> list:
+    """Batched embed + search, then concurrent generation; one result dict per group"""
+    questions = [group.question for group in groups]
+    embeddings = embed_questions(questions)
+    chunk_sets = search_knowledge_base_many(embeddings)
+
+    # Start every generation before waiting on any of them
+    pending = []
+    for group, chunks in zip(groups, chunk_sets):
+        if not chunks:
+            pending.append((group, chunks, None, None))
+            continue
+        built_prompt = build_prompt("process_alert", chunks, alert_name=group.alert_name,
+                                    service_name=group.service_name, question=group.question)
+        pending.append((group, chunks, built_prompt, llm_executor.submit(generate_with_llm, built_prompt.text)))
+
+    answers = []
+    for group, chunks, built_prompt, future in pending:
+        answer = {"group": group, "chunks": chunks, "prompt_tokens": 0, "answer_id": None}
+        if built_prompt is None:
+            answer["text"] = "Could not find relevant documents in the knowledge base for this alert."
+            answer["source"] = "none"
+            answers.append(answer)
+            continue
+        answer["prompt_tokens"] = built_prompt.prompt_tokens
+        remaining = deadline_seconds - (time.monotonic() - request_started)
+        try:
+            answer["text"] = future.result(timeout=max(remaining, 0.0)).text
+            answer["source"] = "llm"
+        except FutureTimeoutError:
+            print(f"⏱️ LLM missed the {deadline_seconds:.1f}s deadline for {group.alert_name}, answering from runbook steps")
+            answer["text"] = build_extractive_answer(group.question, chunks)
+            answer["source"] = "extractive"
+            if ANSWER_UPGRADES_ENABLED:
+                answer["answer_id"] = schedule_answer_upgrade(future, group.question, alert_name=group.alert_name,
+                                                              service_name=group.service_name)
+        except Exception as e:
+            print(f"DEBUG: Gemini failed for {group.alert_name}: {e}")
+            answer["text"] = build_extractive_answer(group.question, chunks, reason="LLM service unavailable")
+            answer["source"] = "extractive"
+        answers.append(answer)
+    return answers
+
+# Alert jobs wait for their notification to be delivered: a crash or a failed
+# delivery leaves the job to be retried (at-least-once, so a sink that already
+# got the message may get it again). A delivery still queued or retrying after
+# the timeout is left to its sink, which keeps sending it; retrying the job
+# would only queue a second post for the same alert.
+ALERT_DELIVERY_TIMEOUT_SECONDS = float(os.getenv("ALERT_DELIVERY_TIMEOUT_SECONDS", "60"))
+
+class NotificationDeliveryError(Exception):
+    """An alert notification failed after all of its sink's retries"""
+
+def publish_alert_notification(message: str, service, severity: str) -> Optional[str]:
+    """Publish an alert notification and wait for its delivery; raises only when a delivery failed"""
+    notification_ids = notification_router.publish(message, service=service, severity=severity, kind="alert")
+    statuses = notification_router.wait(notification_ids, ALERT_DELIVERY_TIMEOUT_SECONDS)
+    failed = [delivery_id for delivery_id, status in statuses.items() if status == "failed"]
+    if failed:
+        raise NotificationDeliveryError(f"notification delivery failed: {failed}")
+    pending = [delivery_id for delivery_id, status in statuses.items() if status not in ("sent", "unknown")]
+    if pending:
+        print(f"⏳ Alert notification still pending after {ALERT_DELIVERY_TIMEOUT_SECONDS:g}s, "
+              f"left to its sink: {pending}")
+    return notification_ids[0] if notification_ids else None
+
+def format_incident_members(group) -> str:
+    """Member alert groups of a correlated incident, one line each ("" for a plain group)"""
+    if not isinstance(group, IncidentGroup):
+        return ""
+    lines = [f"• {member.alert_name} [{member.severity}] — {member.service_name} "
+             f"({len(member.alerts)} alert(s): {', '.join(member.instances[:5])})" for member in group.groups]
+    return f"\n🔗 **Correlated incident {group.incident_id}:**\n" + "\n".join(lines)
+
+def format_alert_batch_message(answers: list, skipped_groups: list, resolved: list) -> str:
+    """Slack message for a whole notification: one section per alert group"""
+    sections = []
+    if len(answers) == 1 and not skipped_groups:
+        answer = answers[0]
+        group = answer["group"]
+        source_file = answer["chunks"][0].source if answer["chunks"] else "none"
+        sections.append(f"""🚨 **ALERT: {group.alert_name}** 🚨
+
+📋 **Service:** {group.service_name}
+⚠️ **Severity:** {group.severity}
+📝 **Details:** {group.question}{format_incident_members(group)}
+
+🤖 **DevOps Sentinel's Recommended Action:**
+{answer["text"]}
+
+📚 **Source:** {source_file}""")
+    elif answers:
+        firing = sum(len(answer["group"].alerts) for answer in answers) + sum(len(g.alerts) for g in skipped_groups)
+        sections.append(f"🚨 **{firing} ALERTS FIRING** ({len(answers) + len(skipped_groups)} groups) 🚨")
+        for answer in answers:
+            group = answer["group"]
+            source_file = answer["chunks"][0].source if answer["chunks"] else "none"
+            sections.append(f"""━━━━━━━━━━━━━━━━━━━━
+🚨 **{group.alert_name}** [{group.severity}] — {group.service_name} ({len(group.alerts)} alert(s): {", ".join(group.instances[:5])})
+
+🤖 **Recommended Action:**
+{answer["text"]}
+
+📚 **Source:** {source_file}""")
+        if skipped_groups:
+            names = ", ".join(f"{g.alert_name} ({g.service_name})" for g in skipped_groups)
+            sections.append(f"➕ **Not analysed (limit {ALERT_MAX_GROUPS_PER_PAYLOAD} groups per notification):** {names}")
+    if resolved:
+        names = ", ".join(f"{alert.alert_name} ({alert.service_name} on {alert.instance})" for alert in resolved[:20])
+        more = f" and {len(resolved) - 20} more" if len(resolved) > 20 else ""
+        sections.append(f"✅ **RESOLVED:** {names}{more}")
+    return "\n\n".join(sections)
+
+def run_alert_batch(request_data: dict) -> dict:
+    """Process every alert of a Grafana/Alertmanager notification in one batched pipeline run"""
+    request_started = time.monotonic()
+    deadline_seconds = request_deadline(request_data)
+    notification = parse_notification(request_data)
+    if not notification.firing and not notification.resolved:
+        raise HTTPException(status_code=400, detail="Invalid Grafana alert format: no alerts with labels")
+
+    groups = notification.groups()
+    incident_id = request_data.get("incident_id")
+    if incident_id and len(groups) > 1:
+        # One correlated incident: a single retrieval and analysis for every group in it
+        groups = [IncidentGroup(incident_id, groups)]
+    answered_groups = groups[:ALERT_MAX_GROUPS_PER_PAYLOAD]
+    skipped_groups = groups[ALERT_MAX_GROUPS_PER_PAYLOAD:]
+    print(f"DEBUG: Notification has {len(notification.firing)} firing / {len(notification.resolved)} resolved alerts "
+          f"({notification.duplicates} duplicates, {notification.invalid} invalid) in {len(groups)} groups")
+
+    try:
+        answers = answer_alert_groups(answered_groups, deadline_seconds, request_started) if answered_groups else []
+    except Exception as e:
+        print(f"DEBUG: Processing error: {e}")
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+    if notification_router.configured:
+        # Routed by every service in the notification and its most severe alert
+        services = sorted({alert.service_name for alert in notification.firing + notification.resolved})
+        severity = max((group.severity for group in groups), key=SEVERITY_PRIORITY.get, default="low")
+        # NotificationQueueFull / NotificationDeliveryError fail the job, which is then retried
+        notification_id = publish_alert_notification(
+            format_alert_batch_message(answers, skipped_groups, notification.resolved), services, severity)
+        result = {"status": "Alert processed and delivered to Slack.", "success": True,
+                  "notification_id": notification_id}
+    else:
+        result = {"status": "Alert processed but Slack not configured.", "success": False}
+
+    sources = {answer["source"] for answer in answers}
+    result.update({
+        "prompt_tokens": sum(answer["prompt_tokens"] for answer in answers),
+        "answer_source": sources.pop() if len(sources) == 1 else ("mixed" if sources else "none"),
+        "alerts_firing": len(notification.firing),
+        "alerts_resolved": len(notification.resolved),
+        "duplicates_dropped": notification.duplicates,
+        "groups": [{
+            "alert_name": answer["group"].alert_name,
+            "service": answer["group"].service_name,
+            "severity": answer["group"].severity,
+            "alerts": len(answer["group"].alerts),
+            "answer_source": answer["source"],
+            **({"answer_id": answer["answer_id"], "upgrade_url": f"/answers/{answer['answer_id']}"}
+               if answer["answer_id"] else {}),
+        } for answer in answers],
+        "groups_skipped": len(skipped_groups),
+    })
+    if len(answers) == 1 and answers[0]["answer_id"]:
+        result["answer_id"] = answers[0]["answer_id"]
+        result["upgrade_url"] = f"/answers/{answers[0]['answer_id']}"
+
+    if incident_id:
+        result["incident_id"] = incident_id
+
+    # 🧠 AUTONOMOUS LEARNING: one memory entry per alert group (each member of an incident)
+    for answer in answers:
+        for group in getattr(answer["group"], "groups", [answer["group"]]):
+            learn_from_alert(group.alert_name, group.service_name, answer["text"],
+                             answer["chunks"], result, count=len(group.alerts), severity=group.severity)
+    for alert in notification.resolved:
+        agent_state.record_alert(AlertRecord(alert.alert_name, alert.service_name, time.time(),
+                                             severity=alert.severity, resolved=True))
+    return result
+
+def run_grafana_alert(request_data: dict):
+    """Blocking RAG pipeline behind /grafana-alert/"""
     question = ""
 
     # --- 1.Check the input type and generate a question ---
@@ -679,77 +1041,51 @@ def grafana_alert(request_data: dict):
         print("DEBUG: Processing direct question.")
         question = request_data["question"]
 
-    elif request_data.get("status") == "firing" and "alerts" in request_data:
-        # It's a structured Grafana alert
+    elif "alerts" in request_data and request_data.get("status") in ("firing", "resolved"):
+        # It's a structured Grafana alert: answer every alert group in one batched run
         print("DEBUG: Processing structured Grafana alert.")
-        is_alert = True
-        try:
-            # Extract info from the first alert in the payload
-            alert_details = request_data["alerts"][0]["labels"]
-            alert_name = alert_details.get("alertname", "Unknown Alert")
-            service_name = alert_details.get("service", "an unknown service")
-            
-            # This is the "Reasoning" step: transform data into a question
-            question = f"What are the steps to resolve the '{alert_name}' for '{service_name}'?"
-            print(f"DEBUG: Transformed alert into question: '{question}'")
-
-        except (KeyError, IndexError) as e:
-            raise HTTPException(status_code=400, detail=f"Invalid Grafana alert format: {e}")
+        return run_alert_batch(request_data)
     else:
         raise HTTPException(status_code=400, detail="Invalid input format. Must be a direct question or a Grafana alert.")
 
     # --- 2. Run the RAG Pipeline (this logic is the same) ---
-    query_embedding = get_sentence_model().encode(question).tolist()
-    print(f"DEBUG: Generated grafana embedding with {len(query_embedding)} dimensions")
-    
-    # 🔧 DIMENSION COMPATIBILITY FIX
-    if len(query_embedding) == 384:
-        query_embedding.extend([0.0] * (768 - 384))
-        print(f"DEBUG: Padded grafana embedding to {len(query_embedding)} dimensions")
+    query_embedding = embed_question(question)
+    chunks = search_knowledge_base(query_embedding)
 
-    retrieved_chunk = None
-    with engine.connect() as connection:
-        # ... (Your TiDB vector search query remains the same here) ...
-        stmt = text("""
-            SELECT content_chunk
-            FROM knowledgebase
-            ORDER BY VEC_COS_SIM(embedding, CAST(:query_embedding AS JSON)) DESC
-            LIMIT 1;
-        """)
-        result = connection.execute(stmt, {"query_embedding": str(query_embedding)}).fetchone()
-        if result:
-            retrieved_chunk = result[0]
-
-    if not retrieved_chunk:
+    if not chunks:
         return {"answer": "Could not find relevant documents.", "success": False}
+    retrieved_chunk = chunks[0].content
 
     # --- 3. Generate Answer with Gemini (this logic is the same) ---
+    built_prompt = build_prompt("grafana", chunks, question=question)
+    print(f"DEBUG: Prompt uses {built_prompt.prompt_tokens}/{built_prompt.budget} tokens")
     try:
-        prompt = f"Context: {retrieved_chunk}\n\nQuestion: {question}"
-        # ... (Your Gemini call and prompt engineering remains the same here) ...
-        response = generation_model.generate_content(prompt)
+        response = generate_with_llm(built_prompt.text)
         llm_answer = response.text
     except Exception as e:
         return {"answer": f"LLM service unavailable: {e}", "success": False}
 
-    # --- 4. Send Response or Notification ---
-    if is_alert:
-        # If it was an alert, send the solution to Slack
-        final_message = f"🚨 **Alert: {alert_name}** 🚨\n\n**🤖 Sentinel's Recommended Action:**\n{llm_answer}"
-        # ... (Your Slack notification logic goes here) ...
-        requests.post(os.getenv("SLACK_WEBHOOK_URL"), json={"text": final_message})
-        print("DEBUG: Sent alert resolution to Slack.")
-        return {"status": "Alert processed and sent to Slack."}
-    else:
-        # If it was a direct question, return the answer to the UI
-        return {"question": question, "answer": llm_answer, "source_context": retrieved_chunk, "success": True}
+    # --- 4. Return the answer to the UI (alerts were sent to Slack by run_alert_batch) ---
+    return {"question": question, "answer": llm_answer, "source_context": built_prompt.context,
+            "success": True, "prompt_tokens": built_prompt.prompt_tokens}
 
-@app.post("/process-input/")
-async def process_input(request_data: dict):
+@app.post("/grafana-alert/", response_model=QueryResponse)
+def grafana_alert(request_data: dict):
     """
-    A single, smart endpoint that handles both direct questions (from UI)
-    and structured alerts (from Grafana).
+    Receive a Grafana alert or a direct question, process it, 
+    and return the answer or send a notification to Slack.
+    Concurrent duplicates (same question or alert fingerprints) share one run.
     """
+    result = grafana_flight.do(payload_key(request_data), lambda: run_grafana_alert(request_data))
+    if "answer" not in result:
+        # Alert summaries don't fit the question/answer model
+        return JSONResponse(content=result)
+    return result
+
+def run_process_input(request_data: dict):
+    """Blocking RAG pipeline behind /process-input/ (questions and alerts)"""
+    request_started = time.monotonic()
+    deadline_seconds = request_deadline(request_data)
     question = ""
     is_alert = False
     alert_name = ""
@@ -761,28 +1097,10 @@ async def process_input(request_data: dict):
         print("DEBUG: Processing direct question.")
         question = request_data["question"]
     
-    elif request_data.get("status") == "firing" and "alerts" in request_data:
-        # It's a structured Grafana alert
+    elif "alerts" in request_data and request_data.get("status") in ("firing", "resolved"):
+        # It's a structured Grafana/Alertmanager notification: handle every alert in it
         print("DEBUG: Processing structured Grafana alert.")
-        is_alert = True
-        try:
-            # Extract info from the first alert in the payload
-            alert_details = request_data["alerts"][0]["labels"]
-            alert_name = alert_details.get("alertname", "Unknown Alert")
-            service_name = alert_details.get("service", "an unknown service")
-            instance = alert_details.get("instance", "unknown instance")
-            
-            # Get summary from annotations if available
-            annotations = request_data["alerts"][0].get("annotations", {})
-            summary = annotations.get("summary", "No summary available")
-            
-            # This is the "Reasoning" step: transform data into a question
-            question = f"What are the steps to resolve the '{alert_name}' alert for '{service_name}' on instance '{instance}'? Alert details: {summary}"
-            print(f"DEBUG: Transformed alert into question: '{question}'")
-
-        except (KeyError, IndexError) as e:
-            print(f"DEBUG: Invalid Grafana alert format: {e}")
-            raise HTTPException(status_code=400, detail=f"Invalid Grafana alert format: {e}")
+        return run_alert_batch(request_data)
             
     elif "title" in request_data and "message" in request_data:
         # It's a legacy alert format (for backward compatibility)
@@ -790,6 +1108,7 @@ async def process_input(request_data: dict):
         is_alert = True
         alert_name = request_data["title"]
         question = request_data["message"]
+        service_name = alert_service(request_data)  # routes the notification to the service's sinks
         
     else:
         raise HTTPException(status_code=400, detail="Invalid input format. Must be a direct question or a Grafana alert.")
@@ -799,38 +1118,14 @@ async def process_input(request_data: dict):
     # Use the same RAG logic from your query-agent endpoint
     try:
         print("DEBUG: Creating embedding for the question...")
-        model = get_sentence_model()
-        query_embedding = model.encode(question).tolist()
-        print(f"DEBUG: Generated embedding with {len(query_embedding)} dimensions")
-        
-        # 🔧 DIMENSION COMPATIBILITY FIX
-        # Pad 384-dim vectors to 768-dim to match existing database vectors
-        if len(query_embedding) == 384:
-            # Pad with zeros to match 768 dimensions
-            query_embedding.extend([0.0] * (768 - 384))
-            print(f"DEBUG: Padded embedding to {len(query_embedding)} dimensions for database compatibility")
-        
-        # Convert to proper vector format for TiDB
-        query_vector = f"[{','.join(map(str, query_embedding))}]"
+        query_embedding = embed_question(question)
         
         # Perform vector search in TiDB to get context
-        with engine.connect() as connection:
-            stmt = text("""
-                SELECT 
-                    content_chunk,
-                    source_file,
-                    VEC_COSINE_DISTANCE(embedding, VEC_FROM_TEXT(:query_vector)) as distance
-                FROM knowledgebase
-                ORDER BY distance ASC
-                LIMIT 2;
-            """)
-            
-            result = connection.execute(stmt, {"query_vector": query_vector})
-            rows = result.fetchall()
+        chunks = search_knowledge_base(query_embedding)
         
-        print(f"DEBUG: Found {len(rows)} relevant documents")
+        print(f"DEBUG: Found {len(chunks)} relevant documents")
         
-        if not rows:
+        if not chunks:
             return {
                 "answer": "Could not find relevant documents in the knowledge base for this query.",
                 "success": False,
@@ -838,66 +1133,50 @@ async def process_input(request_data: dict):
             }
 
         # Get the best matching context
-        retrieved_chunk = rows[0][0]  # content_chunk
-        source_file = rows[0][1]     # source_file
+        retrieved_chunk = chunks[0].content
+        source_file = chunks[0].source
         
-        # Combine multiple contexts for richer answers
-        all_contexts = "\n\n".join([row[0] for row in rows])
+        # Combine as many de-duplicated contexts as the token budget allows
+        if is_alert:
+            built_prompt = build_prompt("process_alert", chunks, alert_name=alert_name,
+                                        service_name=service_name, question=question)
+        else:
+            built_prompt = build_prompt("query", chunks, question=question)
+        prompt = built_prompt.text
         
         print(f"DEBUG: Using context from: {source_file}")
+        print(f"DEBUG: Prompt uses {built_prompt.prompt_tokens}/{built_prompt.budget} tokens "
+              f"({built_prompt.dropped_chunks} chunks dropped)")
 
-        # Generate answer with Gemini (same logic as your existing endpoint)
+        # Generate answer with the LLM, but never wait past the request deadline
+        answer_source = "llm"
+        answer_id = None
         try:
             print("DEBUG: Calling Gemini API...")
             
-            if is_alert:
-                prompt = f"""
-You are an expert DevOps incident response assistant. An alert has fired with the following details:
-
-**Alert Name:** {alert_name}
-**Service:** {service_name}
-**Question:** {question}
-
-Based on the runbook context below, provide a concise, actionable solution:
-
-**Runbook Context:**
-{all_contexts}
-
-Instructions:
-- Provide immediate action steps to resolve this alert
-- Include specific commands or procedures if available in the context
-- Prioritize critical actions first
-- Keep the response focused and actionable for incident response
-"""
+            remaining = deadline_seconds - (time.monotonic() - request_started)
+            response, pending_generation = generate_within_deadline(prompt, remaining)
+            if response is not None:
+                llm_answer = response.text
+                print(f"DEBUG: Successfully received response from {response.provider}")
             else:
-                prompt = f"""
-You are a helpful and knowledgeable DevOps assistant. Based on the context provided below, answer the user's question in a clear, practical, and actionable way.
-
-Context from knowledge base:
-{all_contexts}
-
-User Question: {question}
-
-Instructions:
-- Provide a direct, helpful answer based on the context
-- Include specific steps or recommendations when applicable
-- If the context doesn't fully answer the question, mention what information is available
-- Keep the response practical and actionable for DevOps scenarios
-"""
-            
-            response = generation_model.generate_content(prompt)
-            llm_answer = response.text
-            print("DEBUG: Successfully received response from Gemini")
+                print(f"⏱️ LLM missed the {deadline_seconds:.1f}s deadline, answering from runbook steps")
+                llm_answer = build_extractive_answer(question, chunks)
+                answer_source = "extractive"
+                if ANSWER_UPGRADES_ENABLED:
+                    answer_id = schedule_answer_upgrade(pending_generation, question,
+                                                        alert_name=alert_name if is_alert else "",
+                                                        service_name=service_name)
                     
         except Exception as e:
             print(f"DEBUG: Gemini failed: {e}")
-            llm_answer = f"LLM service unavailable. Here's the relevant information from the knowledge base:\n\n{retrieved_chunk}"
+            llm_answer = build_extractive_answer(question, chunks, reason="LLM service unavailable")
+            answer_source = "extractive"
 
         # Return response based on input type
         if is_alert:
-            # Send to Slack for alerts
-            slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-            if slack_webhook_url:
+            # Send to Slack (and any other routed sinks) for alerts
+            if notification_router.configured:
                 final_message = f"""🚨 **ALERT: {alert_name}** 🚨
 
 📋 **Service:** {service_name}
@@ -908,11 +1187,11 @@ Instructions:
 
 📚 **Source:** {source_file}"""
                 
-                try:
-                    requests.post(slack_webhook_url, json={"text": final_message}, timeout=10)
-                    result = {"status": "Alert processed and sent to Slack.", "success": True}
-                except:
-                    result = {"status": "Alert processed but failed to send to Slack.", "success": False}
+                # NotificationQueueFull / NotificationDeliveryError fail the job, which is then retried
+                notification_id = publish_alert_notification(final_message, service_name,
+                                                              alert_severity(request_data))
+                result = {"status": "Alert processed and delivered to Slack.", "success": True,
+                          "notification_id": notification_id}
             else:
                 result = {"status": "Alert processed but Slack not configured.", "success": False}
         else:
@@ -923,37 +1202,16 @@ Instructions:
                 "source_context": f"Source: {source_file}\n\nContext: {retrieved_chunk}",
                 "success": True
             }
+        result["prompt_tokens"] = built_prompt.prompt_tokens
+        result["answer_source"] = answer_source
+        if answer_id:
+            result["answer_id"] = answer_id
+            result["upgrade_url"] = f"/answers/{answer_id}"
         
         # � AUTONOMOUS LEARNING: Store alert for pattern analysis
         if is_alert:
-            # Store alert in agent memory for learning
-            alert_info = {
-                "type": alert_name,
-                "service": service_name,
-                "timestamp": datetime.now().isoformat(),
-                "severity": "medium",  # Could be extracted from Grafana
-                "resolved": True if "success" in result else False,
-                "solution_found": len(rows) > 0,
-                "response_quality": "high" if llm_answer and len(llm_answer) > 100 else "low"
-            }
-            agent_state.alert_history.append(alert_info)
-            
-            # Keep only last 50 alerts for pattern analysis
-            if len(agent_state.alert_history) > 50:
-                agent_state.alert_history = agent_state.alert_history[-50:]
-            
-            # Trigger autonomous learning action
-            autonomous_action("grafana_alert_processed", {
-                "alert_name": alert_name,
-                "service": service_name,
-                "system": "grafana_monitoring",
-                "severity": "info",
-                "solution_provided": len(llm_answer) > 0,
-                "knowledge_base_hit": len(rows) > 0,
-                "timestamp": time.time()
-            })
-            
-            print(f"🧠 Agent learned from alert: {alert_name} for {service_name}")
+            learn_from_alert(alert_name, service_name, llm_answer, chunks, result,
+                             severity=alert_severity(request_data))
         
         # �🧹 MEMORY CLEANUP: Force cleanup after processing to prevent OOM
         try:
@@ -975,6 +1233,211 @@ Instructions:
             pass
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
+# --- ASYNCHRONOUS ALERT INTAKE ---
+# Alert webhooks are persisted to a local SQLite queue and acknowledged with
+# 202 + job id within milliseconds; a bounded worker pool (in this process, or
+# a separate `python main.py worker`) runs the RAG + Slack pipeline.
+ALERT_WORKERS_IN_PROCESS = os.getenv("ALERT_WORKERS_IN_PROCESS", "true").lower() == "true"
+
+alert_job_queue = SQLiteJobQueue(
+    os.getenv("JOB_QUEUE_PATH", "./data/alert_jobs.db"),
+    queue="alerts",
+    visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+    backoff_base=float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "5")),
+    aging_seconds=float(os.getenv("ALERT_PRIORITY_AGING_SECONDS", "60")),
+)
+alert_jobs = JobManager(
+    "alert-jobs",
+    handler=run_process_input,
+    job_queue=alert_job_queue,
+    workers=int(os.getenv("ALERT_WORKERS", "4")),
+    max_queue=int(os.getenv("ALERT_QUEUE_SIZE", "1000")),
+    poll_interval=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1")),
+    retention_seconds=float(os.getenv("JOB_RETENTION_HOURS", "24")) * 3600,
+    autostart=ALERT_WORKERS_IN_PROCESS,
+    reserved_workers=int(os.getenv("ALERT_CRITICAL_RESERVED_WORKERS", "1")),
+    reserved_min_priority=SEVERITY_PRIORITY["critical"],
+    priority_names=PRIORITY_SEVERITY,
+)
+if ALERT_WORKERS_IN_PROCESS:
+    startup_hooks.append(alert_jobs.start)
+    shutdown_hooks.append(alert_jobs.stop)
+
+# Repeat firings of a fingerprint are dropped for ALERT_DEDUP_WINDOW_SECONDS;
+# the rest is split per ALERT_GROUP_BY label and held for ALERT_GROUP_WAIT_SECONDS,
+# so everything arriving for one service in that window becomes one job.
+alert_dedup = AlertDedupWindow(float(os.getenv("ALERT_DEDUP_WINDOW_SECONDS", "300")))
+ALERT_GROUP_BY = os.getenv("ALERT_GROUP_BY", "service")
+ALERT_GROUP_WAIT_SECONDS = float(os.getenv("ALERT_GROUP_WAIT_SECONDS", "10"))
+
+# With correlation on, alerts are grouped per incident instead: alerts sharing
+# a host/instance label, dependent services or a learned co-occurrence join one
+# incident (alert_correlation.py), answered as one job with one root-cause analysis.
+# Open incidents are per worker process: with uvicorn --workers N, related alerts
+# that reach different workers are answered as separate incidents.
+ALERT_CORRELATION_ENABLED = os.getenv("ALERT_CORRELATION_ENABLED", "true").lower() == "true"
+alert_correlator = build_alert_correlator()
+
+def submit_grouped_alerts(request_data: dict):
+    """Dedup + group a Grafana/Alertmanager notification into jobs; returns (jobs, suppressed)"""
+    notification = parse_notification(request_data)
+    suppressed = alert_dedup.filter(notification)
+    if suppressed:
+        print(f"🔕 Suppressed {suppressed} repeat alert firing(s) within the dedup window")
+
+    if ALERT_CORRELATION_ENABLED:
+        payloads = split_by_incident(notification, alert_correlator, ALERT_GROUP_BY)
+    else:
+        payloads = {f"group:{ALERT_GROUP_BY}={group_value}": payload
+                    for group_value, payload in split_by_group(notification, ALERT_GROUP_BY).items()}
+    jobs = []
+    pending = list(payloads.items())
+    try:
+        while pending:
+            key, payload = pending[0]
+            if request_data.get("deadline_ms") is not None:
+                payload["deadline_ms"] = request_data["deadline_ms"]
+            priority = payload_priority(payload)
+            # Critical pages skip the grouping wait
+            delay = 0.0 if priority >= SEVERITY_PRIORITY["critical"] else ALERT_GROUP_WAIT_SECONDS
+            jobs.append(alert_jobs.submit(payload, key=key, merge=merge_alert_payloads, delay=delay, priority=priority))
+            # Only queued alerts start their dedup window; a rejected one is processed when the sender retries
+            alert_dedup.admit(firing_fingerprints(payload))
+            pending.pop(0)
+    except Exception:
+        if ALERT_CORRELATION_ENABLED:
+            alert_correlator.release([fingerprint for _, payload in pending for fingerprint in firing_fingerprints(payload)])
+        raise
+    return jobs, suppressed
+
+@app.get("/alerts/dedup")
+def get_alert_dedup_stats():
+    """Dedup window and grouping statistics"""
+    return {**alert_dedup.stats(), "group_by": ALERT_GROUP_BY, "group_wait_seconds": ALERT_GROUP_WAIT_SECONDS}
+
+@app.get("/alerts/incidents")
+def get_alert_incidents(limit: int = 50):
+    """Open correlated incidents, most recently active first"""
+    return {**alert_correlator.stats(), "enabled": ALERT_CORRELATION_ENABLED,
+            "incidents": alert_correlator.open_incidents(limit)}
+
+@app.get("/alerts/metrics")
+def get_alert_metrics(hours: float = 6.0, start: Optional[float] = None, end: Optional[float] = None,
+                      group_by: str = "", alert_type: Optional[str] = None, service: Optional[str] = None,
+                      severity: Optional[str] = None, resolution: str = "auto"):
+    """
+    Alert counts over a time range from pre-aggregated buckets.
+
+    The range is `start`..`end` (epoch seconds) or the last `hours`; `group_by`
+    is a comma-separated subset of alert_type, service, severity.
+    """
+    try:
+        return alert_metrics.query(
+            start=start if start is not None else time.time() - hours * 3600,
+            end=end,
+            group_by=[dimension.strip() for dimension in group_by.split(",") if dimension.strip()],
+            filters={"alert_type": alert_type, "service": service, "severity": severity},
+            resolution=resolution
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def is_alert_payload(request_data: dict) -> bool:
+    """True for Grafana/Alertmanager and legacy title+message alert payloads"""
+    if "question" in request_data:
+        return False
+    if request_data.get("status") in ("firing", "resolved") and "alerts" in request_data:
+        alerts = request_data["alerts"]
+        if not isinstance(alerts, list) or not any(isinstance(alert, dict) and isinstance(alert.get("labels"), dict)
+                                                   for alert in alerts):
+            raise HTTPException(status_code=400, detail="Invalid Grafana alert format: 'alerts' must be a non-empty list of alerts with labels")
+        return True
+    return "title" in request_data and "message" in request_data
+
+@app.post("/process-input/")
+async def process_input(request_data: dict):
+    """
+    A single, smart endpoint that handles both direct questions (from UI)
+    and structured alerts (from Grafana).
+
+    Alerts are deduplicated, grouped per incident (or service) and queued, and answered
+    with 202 Accepted plus a job id (poll /jobs/{job_id}); questions are
+    answered inline. Identical in-flight
+    questions and alerts (same normalized question or alert fingerprints)
+    are coalesced into a single embed+search+LLM run.
+    """
+    key = payload_key(request_data)
+
+    if is_alert_payload(request_data):
+        try:
+            # Intake writes to the SQLite queue (which may wait on other processes' locks): keep it off the event loop
+            if "alerts" in request_data:
+                jobs, suppressed = await asyncio.to_thread(submit_grouped_alerts, request_data)
+            else:
+                job = await asyncio.to_thread(alert_jobs.submit, request_data, key=key,
+                                              priority=SEVERITY_PRIORITY[alert_severity(request_data)])
+                jobs, suppressed = [job], 0
+        except JobQueueFull as e:
+            print(f"⚠️ Alert intake rejected: {e}")
+            return JSONResponse(status_code=503, headers={"Retry-After": "30"},
+                                content={"success": False, "status": "Alert queue is full, retry later."})
+        if not jobs:
+            return {"success": True, "status": "Alert suppressed: already notified within the dedup window.",
+                    "suppressed": suppressed}
+        return JSONResponse(status_code=202, content={
+            "success": True,
+            "status": "Alert accepted for processing.",
+            "job_id": jobs[0]["job_id"],
+            "job_status": jobs[0]["status"],
+            "status_url": f"/jobs/{jobs[0]['job_id']}",
+            "jobs": [{"job_id": job["job_id"], "status_url": f"/jobs/{job['job_id']}"} for job in jobs],
+            "suppressed": suppressed,
+        })
+
+    # Questions run inline, in a worker thread so they don't block the event loop
+    return await process_input_flight.do(key, lambda: asyncio.to_thread(run_process_input, request_data))
+
+@app.get("/jobs")
+def get_job_stats():
+    """Alert worker pool and queue statistics"""
+    return alert_jobs.stats()
+
+@app.get("/jobs/dead-letter")
+def get_dead_letter_jobs(limit: int = 50):
+    """Alert jobs that exhausted their retries"""
+    return {"jobs": alert_job_queue.dead_letters(limit)}
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """Status (and result, once finished) of a queued alert job"""
+    job = alert_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id")
+    return job
+
+@app.get("/notifications")
+def get_notification_stats():
+    """Slack outbound queue and agent digest statistics"""
+    return {**slack_dispatcher.stats(), "digest": agent_digest.stats() if SLACK_DIGEST_ENABLED else {"enabled": False},
+            "routing": notification_router.stats()}
+
+@app.get("/notifications/{notification_id}")
+def get_notification_status(notification_id: str):
+    """Delivery status of a queued Slack message ("sink:id" ids come from routed alert notifications)"""
+    delivery = notification_router.get(notification_id) if ":" in notification_id else slack_dispatcher.get(notification_id)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired notification id")
+    return delivery
+
+@app.get("/answers/{answer_id}")
+def get_upgraded_answer(answer_id: str):
+    """Fetch the LLM answer that replaced a deadline-driven extractive answer"""
+    entry = answer_upgrades.get(answer_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired answer id")
+    return {"answer_id": answer_id, **entry}
+
 def create_tidb_engine_with_ca(connection_string):
     """Create TiDB engine with proper CA certificate verification"""
     
@@ -1141,53 +1604,147 @@ debug_database_url()
 # New agent capabilities to main.py:
 
 # --- AGENT STATE MANAGEMENT ---
-class AgentState:
-    def __init__(self):
-        self.monitoring_active = False
-        self.last_health_check = None
-        self.alert_history = []
-        self.learned_patterns = {}
-        self.recent_predictions = {}  # Track recent predictions to prevent spam
-        self.last_slack_notification = {}  # Track last notification time per pattern
-        self.autonomous_actions_taken = []
-
-agent_state = AgentState()
+AGENT_ALERT_HISTORY_SIZE = int(os.getenv("AGENT_ALERT_HISTORY_SIZE", "100000"))
+AGENT_ACTION_HISTORY_SIZE = int(os.getenv("AGENT_ACTION_HISTORY_SIZE", "10000"))
+
+# Learned patterns, throttling state and history are persisted to an event
+# log with snapshots (agent_memory.py) and recovered on startup.
+AGENT_MEMORY_ENABLED = os.getenv("AGENT_MEMORY_ENABLED", "true").lower() == "true"
+agent_memory_store = AgentMemoryStore(
+    os.getenv("AGENT_MEMORY_PATH", "./data/agent_memory.db"),
+    flush_interval=float(os.getenv("AGENT_MEMORY_FLUSH_INTERVAL_SECONDS", "0.05"))
+) if AGENT_MEMORY_ENABLED else None
+
+# Streaming alert-rate aggregates for storm / pattern / trend detection (alert_analytics.py)
+alert_analytics = AlertRateAnalytics(
+    window_seconds=float(os.getenv("ALERT_ANALYTICS_WINDOW_SECONDS", "3600")),
+    storm_window_seconds=float(os.getenv("ALERT_STORM_WINDOW_SECONDS", "300")),
+    storm_threshold=int(os.getenv("ALERT_STORM_THRESHOLD", "5")),
+    trend_ratio=float(os.getenv("ALERT_TREND_RATIO", "3.0"))
+)
+
+# Per-minute / hour / day alert counts for range and group-by queries (alert_metrics.py)
+alert_metrics = AlertMetricsStore(
+    minute_retention=float(os.getenv("ALERT_METRICS_MINUTE_RETENTION_HOURS", "48")) * 3600,
+    hour_retention=float(os.getenv("ALERT_METRICS_HOUR_RETENTION_DAYS", "30")) * 86400,
+    day_retention=float(os.getenv("ALERT_METRICS_DAY_RETENTION_DAYS", "365")) * 86400,
+    max_series=int(os.getenv("ALERT_METRICS_MAX_SERIES", "10000"))
+)
+
+agent_state = AgentState(AGENT_ALERT_HISTORY_SIZE, AGENT_ACTION_HISTORY_SIZE, store=agent_memory_store,
+                         snapshot_every=int(os.getenv("AGENT_MEMORY_SNAPSHOT_EVENTS", "1000")),
+                         observers=[alert_analytics, alert_metrics, alert_correlator],
+                         pattern_half_life=float(os.getenv("AGENT_PATTERN_HALF_LIFE_HOURS", "168")) * 3600)
+# Learned patterns are only applied automatically once they have this many recorded attempts
+AGENT_PATTERN_MIN_ATTEMPTS = int(os.getenv("AGENT_PATTERN_MIN_ATTEMPTS", "3"))
+
+# With several workers (uvicorn --workers N) every process shares the store
+# and applies the others' events every AGENT_STATE_SYNC_SECONDS.
+AGENT_STATE_SYNC_SECONDS = float(os.getenv("AGENT_STATE_SYNC_SECONDS", "1"))
+
+def _open_agent_memory():
+    agent_state.recover()
+    agent_state.start_sync(AGENT_STATE_SYNC_SECONDS)
+
+def _close_agent_memory():
+    agent_state.stop_sync()
+    agent_state.checkpoint()
+    agent_memory_store.close()
+
+if agent_memory_store is not None:
+    startup_hooks.append(_open_agent_memory)
+    shutdown_hooks.append(_close_agent_memory)
+
+# Small values every worker must agree on (monitoring on/off, last health
+# check); kept in the shared store, or in this process without one.
+_local_settings = {}
+
+def get_shared_setting(key: str, default=None):
+    if agent_memory_store is None:
+        return _local_settings.get(key, default)
+    return agent_memory_store.get_setting(key, default)
+
+def set_shared_setting(key: str, value):
+    if agent_memory_store is None:
+        _local_settings[key] = value
+    else:
+        agent_memory_store.set_setting(key, value)
 
 # --- AUTONOMOUS MONITORING FUNCTIONS ---
+# The periodic jobs run on one asyncio scheduler owned by the app lifespan
+# (registered below, once the job functions exist). Only the worker holding
+# the leader lock runs it; the shared "monitoring_enabled" setting says
+# whether it should run at all, so start / stop work from any worker.
+AGENT_MONITORING_AUTOSTART = os.getenv("AGENT_MONITORING_AUTOSTART", "false").lower() == "true"
+agent_scheduler = AgentScheduler("agent-scheduler", jitter=float(os.getenv("AGENT_SCHEDULER_JITTER", "0.1")))
+
+def _monitoring_enabled() -> bool:
+    enabled = bool(get_shared_setting("monitoring_enabled", False))
+    agent_state.monitoring_active = enabled
+    return enabled
+
+def _set_monitoring_enabled(enabled: bool):
+    set_shared_setting("monitoring_enabled", enabled)
+    agent_state.monitoring_active = enabled
+
+def _on_probe_change(probe, transition: str):
+    """Probe went down / came back up: hand it to the agent as an autonomous action"""
+    context = {
+        "probe": probe.name,
+        "probe_type": probe.kind,
+        "target": probe.target,
+        "system": probe.system,
+        "severity": probe.severity if transition == "down" else "info",
+        "consecutive_failures": probe.consecutive_failures,
+        "error": probe.last_error,
+        "latency_p99_seconds": probe.latency.quantile(0.99),
+        "timestamp": time.time()
+    }
+    autonomous_action("external_system_unreachable" if transition == "down" else "external_system_recovered", context)
+
+# External systems probed concurrently (health_probes.py), configured with
+# HEALTH_PROBES / HEALTH_PROBES_FILE; the knowledge base database is always included.
+probe_engine = build_probe_engine(
+    on_change=_on_probe_change,
+    extra_probes=[SqlProbe("knowledge_base_db", engine=engine, system="knowledge_base", severity="critical",
+                           interval=float(os.getenv("HEALTH_PROBE_DATABASE_INTERVAL_SECONDS", "60")))]
+    if engine is not None else []
+)
+
+agent_leader = LeaderElectedScheduler(
+    agent_scheduler,
+    FileLeaderElection(os.getenv("AGENT_LEADER_LOCK_PATH", "./data/agent_leader.lock")),
+    should_run=_monitoring_enabled,
+    poll_interval=float(os.getenv("AGENT_LEADER_POLL_SECONDS", "2")),
+    companions=[probe_engine]
+)
+
 @app.post("/agent/start-monitoring/")
 async def start_autonomous_monitoring():
     """Start the autonomous monitoring agent"""
-    agent_state.monitoring_active = True
-    
-    # Start background monitoring tasks
-    threading.Thread(target=run_monitoring_scheduler, daemon=True).start()
+    already_enabled = _monitoring_enabled()
+    _set_monitoring_enabled(True)
+    await agent_leader.reconcile()
     
     return {
-        "status": "Autonomous monitoring started",
+        "status": "Autonomous monitoring already running" if already_enabled else "Autonomous monitoring started",
         "capabilities": [
             "System health monitoring",
             "Predictive alerting", 
             "Auto-remediation",
             "Pattern learning"
         ],
-        "monitoring_active": True
+        "monitoring_active": True,
+        "leader": agent_leader.stats(),
+        "scheduler": agent_scheduler.stats()
     }
 
 @app.post("/agent/stop-monitoring/")
 async def stop_autonomous_monitoring():
-    """Stop the autonomous monitoring agent"""
-    agent_state.monitoring_active = False
-    return {"status": "Autonomous monitoring stopped", "monitoring_active": False}
-
-def run_monitoring_scheduler():
-    """Background scheduler for autonomous monitoring"""
-    schedule.every(5).minutes.do(autonomous_health_check)  # Every 5 minutes instead of 30 seconds
-    schedule.every(60).minutes.do(predictive_analysis)     # Every 60 minutes (1 hour) to reduce spam
-    schedule.every(30).minutes.do(pattern_learning)       # Every 30 minutes instead of 15
-    
-    while agent_state.monitoring_active:
-        schedule.run_pending()
-        time.sleep(30)  # Check every 30 seconds instead of 10
+    """Stop the autonomous monitoring agent (the leader stops its scheduler on its next poll)"""
+    _set_monitoring_enabled(False)
+    await agent_leader.reconcile()
+    return {"status": "Autonomous monitoring stopped", "monitoring_active": False, "leader": agent_leader.stats()}
 
 def autonomous_health_check():
     """Agent monitors external DevOps systems for issues"""
@@ -1210,39 +1767,32 @@ def autonomous_health_check():
             })
         
         # 3. Check for recent alert patterns (DevOps monitoring)
-        recent_alerts = agent_state.alert_history[-5:] if len(agent_state.alert_history) >= 5 else []
-        if len(recent_alerts) >= 3:
-            # Check if too many alerts in short time (system instability)
-            recent_times = [alert.get("timestamp") for alert in recent_alerts]
-            if recent_times:
-                time_span = (datetime.fromisoformat(recent_times[-1]) - datetime.fromisoformat(recent_times[0])).total_seconds()
-                if time_span < 300:  # 5 minutes
-                    autonomous_action("alert_storm_detected", {
-                        "alert_count": len(recent_alerts),
-                        "time_span_minutes": time_span / 60,
-                        "severity": "warning",
-                        "system": "monitoring",
-                        "action": "analyze_patterns",
-                        "timestamp": time.time()
-                    })
-        
-        # 4. Monitor external DevOps systems (not self)
-        # Only check external systems, not our own API to avoid circular dependencies
-        print("🔍 Agent: Monitoring external systems health...")
+        # Too many alerts in a short time means system instability
+        storm = alert_analytics.storm()
+        if storm:
+            autonomous_action("alert_storm_detected", {
+                "alert_count": storm["alert_count"],
+                "time_span_minutes": storm["window_minutes"],
+                "severity": "warning",
+                "system": "monitoring",
+                "action": "analyze_patterns",
+                "timestamp": time.time()
+            })
         
-        # Example: You could add checks for actual external systems here:
-        # - Database connections
-        # - External APIs
-        # - Service dependencies
-        # - File system health
+        # 4. External systems (not self) are probed continuously by probe_engine;
+        # down / recovered transitions reach autonomous_action as they happen
+        probes = probe_engine.summary()
+        print(f"🔍 Agent: {probes['up']}/{probes['probes']} external systems up"
+              + (f", down: {', '.join(probes['down'])}" if probes["down"] else ""))
         
-        # For now, just monitor successful recent actions as a health indicator
-        recent_successful_actions = [action for action in agent_state.autonomous_actions_taken[-10:] 
-                                   if action.get("result", "").startswith("Success")]
+        # 5. Monitor successful recent actions as a health indicator
+        state = agent_state.snapshot()
+        recent_actions = state.recent_actions
+        recent_successful_actions = [action for action in recent_actions if action.succeeded]
         
-        if len(agent_state.autonomous_actions_taken) > 5 and len(recent_successful_actions) == 0:
+        if state.actions_held > 5 and len(recent_successful_actions) == 0:
             autonomous_action("low_success_rate", {
-                "total_recent_actions": len(agent_state.autonomous_actions_taken[-10:]),
+                "total_recent_actions": len(recent_actions),
                 "successful_actions": len(recent_successful_actions),
                 "severity": "warning",
                 "system": "agent_effectiveness",
@@ -1251,6 +1801,7 @@ def autonomous_health_check():
             })
         
         agent_state.last_health_check = datetime.now()
+        set_shared_setting("last_health_check", agent_state.last_health_check.isoformat())
         print("✅ Agent: DevOps systems monitoring completed")
         
     except Exception as e:
@@ -1267,44 +1818,48 @@ def autonomous_action(issue_type: str, context: dict):
     """Agent takes autonomous actions based on DevOps monitoring"""
     print(f"🚨 Agent: Taking autonomous action for {issue_type}")
     
-    action_taken = {
-        "issue_type": issue_type,
-        "context": context,
-        "timestamp": datetime.now().isoformat(),
-        "action_id": f"agent_{int(time.time())}",
-        "system": context.get("system", "unknown"),
-        "severity": context.get("severity", "medium")
-    }
+    now = time.time()
+    action_taken = ActionRecord(issue_type, context, now, f"agent_{int(now)}_{uuid.uuid4().hex[:8]}",
+                                system=context.get("system", "unknown"), severity=context.get("severity", "medium"))
     
     try:
         if issue_type == "knowledge_base_empty":
             # Critical DevOps issue: Knowledge base unavailable
-            send_agent_notification("🚨 CRITICAL: Knowledge base is empty - DevOps solutions unavailable!")
-            action_taken["result"] = "Success: Critical alert sent to operations team"
+            send_agent_notification("🚨 CRITICAL: Knowledge base is empty - DevOps solutions unavailable!", severity="critical")
+            action_taken.result = "Success: Critical alert sent to operations team"
             
         elif issue_type == "alert_storm_detected":
             # DevOps pattern: Too many alerts indicate system instability
             alert_count = context.get("alert_count", 0)
             time_span = context.get("time_span_minutes", 0)
-            send_agent_notification(f"⚠️ ALERT STORM: {alert_count} alerts in {time_span:.1f} minutes - System instability detected!")
-            action_taken["result"] = f"Success: Alert storm notification sent ({alert_count} alerts)"
+            send_agent_notification(f"⚠️ ALERT STORM: {alert_count} alerts in {time_span:.1f} minutes - System instability detected!",
+                                    severity="high")
+            action_taken.result = f"Success: Alert storm notification sent ({alert_count} alerts)"
             
         elif issue_type == "api_health_degraded":
             # DevOps monitoring: API health issues
             status_code = context.get("status_code", "unknown")
-            send_agent_notification(f"🔧 API HEALTH: Service returning {status_code} - Monitoring closely")
-            action_taken["result"] = f"Success: API health alert sent (status: {status_code})"
+            send_agent_notification(f"🔧 API HEALTH: Service returning {status_code} - Monitoring closely", severity="high")
+            action_taken.result = f"Success: API health alert sent (status: {status_code})"
             
         elif issue_type == "external_system_unreachable":
             # Critical DevOps issue: External system down
             error = context.get("error", "unknown")
-            send_agent_notification(f"🆘 SYSTEM DOWN: External system unreachable - {error}")
-            action_taken["result"] = "Success: System outage escalated to operations"
+            target = context.get("target", context.get("system", "unknown"))
+            send_agent_notification(f"🆘 SYSTEM DOWN: {target} unreachable - {error}",
+                                    severity=context.get("severity", "critical"))
+            action_taken.result = "Success: System outage escalated to operations"
+            
+        elif issue_type == "external_system_recovered":
+            target = context.get("target", context.get("system", "unknown"))
+            send_agent_notification(f"✅ SYSTEM RECOVERED: {target} is reachable again", severity="low")
+            action_taken.result = f"Success: Recovery of {target} reported"
             
         elif issue_type == "monitoring_system_failed":
             # Meta-monitoring: The monitoring itself failed
-            send_agent_notification("🔴 MONITORING FAILURE: DevOps agent monitoring system failed - Manual intervention required")
-            action_taken["result"] = "Success: Monitoring failure escalated"
+            send_agent_notification("🔴 MONITORING FAILURE: DevOps agent monitoring system failed - Manual intervention required",
+                                    severity="critical")
+            action_taken.result = "Success: Monitoring failure escalated"
             
         elif issue_type == "grafana_alert_processed":
             # Autonomous learning from Grafana alerts
@@ -1313,134 +1868,98 @@ def autonomous_action(issue_type: str, context: dict):
             solution_provided = context.get("solution_provided", False)
             
             if solution_provided:
-                action_taken["result"] = f"Success: Learned from {alert_name} alert for {service}"
+                action_taken.result = f"Success: Learned from {alert_name} alert for {service}"
                 print(f"🧠 Agent: Successfully processed and learned from {alert_name}")
             else:
-                action_taken["result"] = f"Learning: No solution found for {alert_name} - flagged for knowledge base improvement"
-                send_agent_notification(f"📚 KNOWLEDGE GAP: No solution found for '{alert_name}' on {service} - Consider updating knowledge base")
+                action_taken.result = f"Learning: No solution found for {alert_name} - flagged for knowledge base improvement"
+                send_agent_notification(f"📚 KNOWLEDGE GAP: No solution found for '{alert_name}' on {service} - Consider updating knowledge base",
+                                        severity="low")
         
         elif issue_type == "low_success_rate":
             # Agent effectiveness monitoring
             total_actions = context.get("total_recent_actions", 0)
             successful = context.get("successful_actions", 0)
             send_agent_notification(f"📊 AGENT PERFORMANCE: Low success rate - {successful}/{total_actions} recent actions successful")
-            action_taken["result"] = f"Success: Performance monitoring alert sent ({successful}/{total_actions})"
+            action_taken.result = f"Success: Performance monitoring alert sent ({successful}/{total_actions})"
             
         else:
             # Handle other DevOps events
-            action_taken["result"] = f"Success: Processed {issue_type}"
+            action_taken.result = f"Success: Processed {issue_type}"
             print(f"🤖 Agent: Processed {issue_type}")
             
     except Exception as e:
-        action_taken["result"] = f"Failed: {str(e)}"
+        action_taken.result = f"Failed: {str(e)}"
         print(f"❌ Agent action failed: {e}")
     
-    # Store action in agent memory
-    agent_state.autonomous_actions_taken.append(action_taken)
-    
-    # Learn pattern immediately if action was successful
-    if action_taken.get("result", "").startswith("Success"):
-        try:
-            issue_type = action_taken["issue_type"]
-            if issue_type not in agent_state.learned_patterns:
-                agent_state.learned_patterns[issue_type] = {
-                    "success_count": 0,
-                    "total_attempts": 0,
-                    "best_action": None
-                }
-            
-            agent_state.learned_patterns[issue_type]["success_count"] += 1
-            agent_state.learned_patterns[issue_type]["total_attempts"] += 1
-            agent_state.learned_patterns[issue_type]["best_action"] = action_taken.get("result")
-            
-            print(f"🧠 Agent: Immediately learned pattern for {issue_type}")
-        except Exception as e:
-            print(f"❌ Immediate pattern learning failed: {e}")
-    
-    # Keep only last 100 actions
-    if len(agent_state.autonomous_actions_taken) > 100:
-        agent_state.autonomous_actions_taken = agent_state.autonomous_actions_taken[-100:]
+    # Store action in agent memory; this also updates the pattern for its issue type
+    agent_state.record_action(action_taken)
+
+PREDICTION_THROTTLE_SECONDS = 7200  # one notification per pattern / trend every 2 hours
+
+def _notify_prediction(pattern_key: str, description: str, message: str, current_time: float):
+    """Send a prediction unless the same pattern was notified within the throttle window"""
+    last_notification = agent_state.last_slack_notification.get(pattern_key, 0)
+    time_since_last = current_time - last_notification
+    if time_since_last > PREDICTION_THROTTLE_SECONDS:
+        send_agent_notification(message, severity="low")
+        agent_state.mark_notified(pattern_key, current_time)
+        print(f"🎯 Agent: Detected pattern - {description}")
+    else:
+        print(f"🔕 Agent: {description} detected but notification throttled (last sent {time_since_last/60:.1f} min ago)")
 
 def predictive_analysis():
-    """Agent performs predictive analysis on patterns"""
+    """Agent performs predictive analysis on the streaming alert-rate aggregates"""
     print("🔮 Agent: Performing predictive analysis...")
     
     try:
-        # Analyze recent alert patterns
-        recent_alerts = agent_state.alert_history[-10:]  # Last 10 alerts
-        
-        if len(recent_alerts) >= 3:
-            # Look for patterns
-            alert_types = [alert.get("type", "unknown") for alert in recent_alerts]
-            most_common = max(set(alert_types), key=alert_types.count)
-            
-            if alert_types.count(most_common) >= 3:
-                # Pattern detected - check if we already notified recently
-                pattern_key = f"pattern_{most_common}"
-                current_time = time.time()
-                
-                # Only send notification if we haven't sent one for this pattern in the last 2 hours
-                last_notification = agent_state.last_slack_notification.get(pattern_key, 0)
-                time_since_last = current_time - last_notification
-                
-                if time_since_last > 7200:  # 2 hours = 7200 seconds
-                    prediction = {
-                        "pattern": f"Recurring {most_common} alerts",
-                        "confidence": alert_types.count(most_common) / len(alert_types),
-                        "recommendation": f"Investigate root cause of {most_common}",
-                        "timestamp": datetime.now().isoformat()
-                    }
-                    
-                    send_agent_notification(f"🔮 Agent Prediction: Pattern detected - {prediction['pattern']} (confidence: {prediction['confidence']:.1%})")
-                    
-                    # Update last notification time
-                    agent_state.last_slack_notification[pattern_key] = current_time
-                    
-                    print(f"🎯 Agent: Detected pattern - {prediction['pattern']}")
-                else:
-                    print(f"🔕 Agent: Pattern {most_common} detected but notification throttled (last sent {time_since_last/60:.1f} min ago)")
+        current_time = time.time()
+        
+        # Recurring pattern: the most frequent alert type over the analytics window
+        dominant = alert_analytics.dominant(current_time, min_count=3)
+        if dominant:
+            alert_type = dominant["alert_type"]
+            pattern = f"Recurring {alert_type} alerts"
+            _notify_prediction(f"pattern_{alert_type}", pattern,
+                               f"🔮 Agent Prediction: Pattern detected - {pattern} "
+                               f"({dominant['count']} in the last {dominant['window_minutes']:.0f} min, "
+                               f"confidence: {dominant['share']:.1%})", current_time)
+        
+        # Rising trend: short-horizon rate well above the type's own baseline
+        for trend in alert_analytics.trending(current_time):
+            alert_type = trend["alert_type"]
+            _notify_prediction(f"trend_{alert_type}", f"Rising {alert_type} alerts",
+                               f"📈 Agent Prediction: {alert_type} alerts are rising - "
+                               f"{trend['rate_per_hour']:.0f}/h vs a baseline of {trend['baseline_per_hour']:.0f}/h "
+                               f"(x{trend['ratio']:.1f})", current_time)
     
     except Exception as e:
         print(f"❌ Agent: Predictive analysis failed: {e}")
 
-def pattern_learning():
-    """Agent learns from historical data to improve responses"""
-    print("🧠 Agent: Learning from patterns...")
-    
-    try:
-        # Analyze successful resolutions
-        successful_actions = [action for action in agent_state.autonomous_actions_taken 
-                            if action.get("result", "").startswith("Success")]
-        
-        # Update learned patterns
-        for action in successful_actions[-5:]:  # Learn from last 5 successful actions
-            issue_type = action["issue_type"]
-            if issue_type not in agent_state.learned_patterns:
-                agent_state.learned_patterns[issue_type] = {
-                    "success_count": 0,
-                    "total_attempts": 0,
-                    "best_action": None
-                }
-            
-            agent_state.learned_patterns[issue_type]["success_count"] += 1
-            agent_state.learned_patterns[issue_type]["total_attempts"] += 1
-            agent_state.learned_patterns[issue_type]["best_action"] = action.get("result")
-        
-        print(f"🧠 Agent: Learned from {len(successful_actions)} successful actions")
-    
-    except Exception as e:
-        print(f"❌ Agent: Pattern learning failed: {e}")
-
-def send_agent_notification(message: str):
-    """Send autonomous agent notifications to Slack"""
-    slack_webhook_url = os.getenv("SLACK_WEBHOOK_URL")
-    if slack_webhook_url:
+agent_scheduler.add_job("health_check", autonomous_health_check,
+                        interval=float(os.getenv("AGENT_HEALTH_CHECK_INTERVAL_SECONDS", "300")))
+agent_scheduler.add_job("predictive_analysis", predictive_analysis,
+                        interval=float(os.getenv("AGENT_PREDICTION_INTERVAL_SECONDS", "3600")))
+
+async def _start_agent_monitoring():
+    if AGENT_MONITORING_AUTOSTART:
+        _set_monitoring_enabled(True)
+    await agent_leader.start()
+
+startup_hooks.append(_start_agent_monitoring)
+shutdown_hooks.append(agent_leader.stop)
+
+def send_agent_notification(message: str, severity: str = "medium"):
+    """Send autonomous agent notifications to the routed sinks (digested unless SLACK_DIGEST_ENABLED=false)"""
+    if SLACK_DIGEST_ENABLED:
+        for sink_name in notification_router.targets(severity=severity, kind="agent"):
+            agent_digest.add(message, severity=severity, channel=sink_name)
+            print(f"📤 Agent: Notification buffered for the {sink_name} digest ({severity})")
+    elif notification_router.configured:
         try:
-            payload = {
-                "text": f"🤖 **DevOps Sentinel Agent**\n{message}\n⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}"
-            }
-            requests.post(slack_webhook_url, json=payload, timeout=10)
-            print(f"📤 Agent: Notification sent to Slack")
+            notification_router.publish(
+                f"🤖 **DevOps Sentinel Agent**\n{message}\n⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}",
+                severity=severity, kind="agent")
+            print(f"📤 Agent: Notification queued for Slack")
         except Exception as e:
             print(f"❌ Agent: Failed to send notification: {e}")
 
@@ -1450,25 +1969,17 @@ async def agent_process_alert(request_data: dict):
     """Enhanced alert processing with autonomous agent capabilities"""
     
     # Store alert in agent memory
-    alert_info = {
-        "type": request_data.get("alertname", "unknown"),
-        "timestamp": datetime.now().isoformat(),
-        "severity": request_data.get("severity", "medium"),
-        "service": request_data.get("service", "unknown")
-    }
-    agent_state.alert_history.append(alert_info)
-    
-    # Keep only last 50 alerts
-    if len(agent_state.alert_history) > 50:
-        agent_state.alert_history = agent_state.alert_history[-50:]
+    alert_info = AlertRecord(request_data.get("alertname", "unknown"), request_data.get("service", "unknown"),
+                             time.time(), severity=request_data.get("severity", "medium"))
+    agent_state.record_alert(alert_info)
     
     # Check if agent has learned how to handle this alert type
-    alert_type = alert_info["type"]
+    alert_type = alert_info.alert_type
     if alert_type in agent_state.learned_patterns:
         pattern = agent_state.learned_patterns[alert_type]
-        success_rate = pattern["success_count"] / pattern["total_attempts"]
+        success_rate = pattern["success_rate"]  # time-decayed, failures included
         
-        if success_rate > 0.7:  # High confidence
+        if success_rate > 0.7 and pattern["total_attempts"] >= AGENT_PATTERN_MIN_ATTEMPTS:  # High confidence
             print(f"🤖 Agent: Using learned pattern for {alert_type} (success rate: {success_rate:.1%})")
             
             # Apply learned solution
@@ -1476,7 +1987,7 @@ async def agent_process_alert(request_data: dict):
             auto_response += f"Based on previous successful resolutions:\n{pattern['best_action']}\n\n"
             auto_response += "**Recommended Action:** " + pattern.get('best_action', 'Apply standard procedure')
             
-            send_agent_notification(f"🎯 Agent: Applied learned solution for {alert_type}")
+            send_agent_notification(f"🎯 Agent: Applied learned solution for {alert_type}", severity="low")
             
             return {
                 "agent_response": auto_response,
@@ -1495,12 +2006,22 @@ async def agent_process_alert(request_data: dict):
 @app.get("/agent/status")
 def get_agent_status():
     """Get current agent status and capabilities"""
+    state = agent_state.snapshot()  # one consistent, lock-free view
+    monitoring_active = _monitoring_enabled()
     return {
-        "monitoring_active": agent_state.monitoring_active,
-        "last_health_check": agent_state.last_health_check.isoformat() if agent_state.last_health_check else None,
-        "total_autonomous_actions": len(agent_state.autonomous_actions_taken),
-        "learned_patterns_count": len(agent_state.learned_patterns),
-        "recent_alerts_count": len(agent_state.alert_history),
+        "monitoring_active": monitoring_active,
+        "last_health_check": get_shared_setting("last_health_check"),
+        "total_autonomous_actions": state.actions_recorded,
+        "learned_patterns_count": len(state.learned_patterns),
+        "recent_alerts_count": state.alerts_held,
+        "state_version": state.version,
+        "memory": agent_memory_store.stats() if agent_memory_store is not None else None,
+        "alert_analytics": alert_analytics.stats(),
+        "alert_metrics": alert_metrics.stats(),
+        "history_capacity": agent_state.capacity,
+        "scheduler": agent_scheduler.stats(),
+        "leader": agent_leader.stats(),
+        "health_probes": probe_engine.summary(),
         "capabilities": {
             "autonomous_monitoring": True,
             "predictive_analysis": True,
@@ -1509,22 +2030,140 @@ def get_agent_status():
             "proactive_notifications": True
         },
         "agent_memory": {
-            "successful_actions": len([a for a in agent_state.autonomous_actions_taken if "Success" in a.get("result", "")]),
-            "patterns_learned": list(agent_state.learned_patterns.keys()),
-            "uptime": "Active" if agent_state.monitoring_active else "Stopped"
+            "successful_actions": state.successful_actions,
+            "patterns_learned": list(state.learned_patterns.keys()),
+            "uptime": "Active" if monitoring_active else "Stopped"
         }
     }
 
 @app.get("/agent/actions")
 def get_agent_actions():
     """Get recent autonomous actions taken by the agent"""
+    state = agent_state.snapshot()
     return {
-        "recent_actions": agent_state.autonomous_actions_taken[-10:],  # Last 10 actions
-        "total_actions": len(agent_state.autonomous_actions_taken),
-        "learned_patterns": agent_state.learned_patterns
+        "recent_actions": [action.to_dict() for action in state.recent_actions],  # Last 10 actions
+        "total_actions": state.actions_recorded,
+        "learned_patterns": {issue_type: dict(pattern) for issue_type, pattern in state.learned_patterns.items()}
     }
 
+@app.get("/agent/probes")
+def get_agent_probes():
+    """Up/down state and latency of every external health probe (tracked by the leader worker)"""
+    return {"leader": agent_leader.stats(), **probe_engine.stats()}
+
+# --- PROMETHEUS METRICS ---
+# Everything below is read from the components at scrape time; nothing here
+# adds work to the request path.
+def _db_pool_connections() -> dict:
+    pool = getattr(engine, "pool", None)
+    if pool is None or not hasattr(pool, "checkedout"):
+        return {}
+    return {("checked_out",): pool.checkedout(), ("idle",): pool.checkedin(),
+            ("overflow",): max(0, pool.overflow()), ("size",): pool.size()}
+
+def _request_coalescing() -> dict:
+    counts = {}
+    for flight in (query_flight, grafana_flight, alert_trigger_flight, process_input_flight):
+        stats = flight.stats()
+        counts[(flight.name, "executed")] = stats["executions"]
+        counts[(flight.name, "shared")] = stats["shared"]
+    counts[("alert-jobs", "executed")] = alert_jobs.completed
+    counts[("alert-jobs", "shared")] = alert_jobs.coalesced
+    dedup = alert_dedup.stats()
+    counts[("alert-dedup", "executed")] = dedup["passed"]
+    counts[("alert-dedup", "shared")] = dedup["suppressed"]
+    return counts
+
+PIPELINE_STAGE_SECONDS.attach(slack_dispatcher.latency, "slack")
+metrics_registry.gauge("sentinel_queue_depth", "Items waiting in each work queue", ("queue",),
+                       callback=lambda: {("alerts",): alert_job_queue.depth(),
+                                         ("slack",): slack_dispatcher.stats()["queued"]})
+metrics_registry.gauge("sentinel_queue_capacity", "Capacity of each work queue", ("queue",),
+                       callback=lambda: {("alerts",): alert_jobs.max_queue, ("slack",): slack_dispatcher.max_queue})
+metrics_registry.gauge("sentinel_db_pool_connections", "Database connection pool usage", ("state",),
+                       callback=_db_pool_connections)
+metrics_registry.gauge("sentinel_embedding_model_loaded", "1 once the embedding model is loaded",
+                       callback=lambda: 1 if sentence_model is not None else 0)
+# Coalescing is the app's cache: shared / (executed + shared) is the hit ratio
+metrics_registry.counter("sentinel_request_coalescing_total",
+                         "Work executed vs. answered from an in-flight or recent identical request",
+                         ("flight", "outcome"), callback=_request_coalescing)
+metrics_registry.gauge("sentinel_llm_circuit_open", "1 while an LLM provider's circuit breaker is open",
+                       ("provider",), callback=lambda: {(provider["provider"],): int(provider["state"] == "open")
+                                                        for provider in llm_client.status()})
+
+@app.get("/metrics")
+def get_prometheus_metrics():
+    """Prometheus text exposition of request, pipeline stage, queue, pool and model metrics"""
+    return Response(content=metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# --- SERVICE HEALTH CHECKS ---
+# Run by health_monitor in the background, never on the request path.
+def _check_database() -> dict:
+    if engine is None:
+        return {"status": NOT_CONFIGURED}
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {}
+
+def _check_vector_index() -> dict:
+    if engine is None:
+        return {"status": NOT_CONFIGURED}
+    with engine.connect() as conn:
+        chunks = conn.execute(text("SELECT COUNT(*) FROM knowledgebase")).scalar()
+    return {"chunks": chunks, **({"status": DEGRADED} if not chunks else {})}
+
+def _check_llm() -> dict:
+    providers = llm_client.status()
+    open_circuits = [provider["provider"] for provider in providers if provider["state"] == "open"]
+    status = DOWN if len(open_circuits) == len(providers) else (DEGRADED if open_circuits else "ok")
+    return {"status": status, "providers": providers}
+
+def _check_embedding_model() -> dict:
+    # Loaded lazily by the first request; a check must not pay for loading it
+    return {"status": "ok" if sentence_model is not None else IDLE, "loaded": sentence_model is not None}
+
+def _check_queues() -> dict:
+    jobs = alert_jobs.stats()
+    slack = slack_dispatcher.stats()
+    detail = {
+        "alert_queue_depth": jobs["queue_depth"],
+        "alert_queue_capacity": jobs["queue_capacity"],
+        "alert_dead_letter": jobs["dead_letter"],
+        "alert_workers_running": jobs["workers_running"],
+        "slack_queue_depth": slack["queued"],
+        "slack_queue_capacity": slack["queue_capacity"],
+    }
+    if ALERT_WORKERS_IN_PROCESS and not jobs["workers_running"]:
+        return {"status": DOWN, **detail}
+    if (jobs["queue_depth"] >= 0.9 * jobs["queue_capacity"]
+            or slack["queued"] >= 0.9 * slack["queue_capacity"]):
+        return {"status": DEGRADED, **detail}
+    return detail
+
+health_monitor.register("database", _check_database)
+health_monitor.register("vector_index", _check_vector_index)
+health_monitor.register("queues", _check_queues)
+# Answers fall back to extractive summaries and the model loads on demand
+health_monitor.register("llm", _check_llm, critical=False)
+health_monitor.register("embedding_model", _check_embedding_model, critical=False)
+# Registered last, so the first refresh sees the other components started
+startup_hooks.append(health_monitor.start)
+shutdown_hooks.append(health_monitor.stop)
+
 # Start the server
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        # Standalone alert worker; run the API with ALERT_WORKERS_IN_PROCESS=false
+        print("👷 Starting standalone alert worker...")
+        if agent_memory_store is not None:
+            _open_agent_memory()
+        try:
+            alert_jobs.run_forever()
+        finally:
+            if agent_memory_store is not None:
+                _close_agent_memory()
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,486 @@
+# notifier.py
+"""
+Asynchronous Slack delivery.
+
+Handlers hand messages to `SlackDispatcher.send()`, which only queues them;
+a small pool of worker threads posts them over one pooled keep-alive
+`requests.Session`. Deliveries are retried with exponential backoff (Slack's
+`Retry-After` wins on 429), each webhook has its own token bucket, and
+messages that pile up for the same webhook are batched into one post.
+
+Agent notifications go through `DigestAggregator` first: they are buffered
+per channel and severity and flushed as one compact summary per window,
+with critical messages skipping the window and a hard per-minute cap on
+outbound messages per channel.
+"""
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import STAGE_LATENCY_BUCKETS, Histogram
+
+BATCH_SEPARATOR = "\n\n━━━━━━━━━━━━━━━━━━━━\n\n"
+
+
+class NotificationQueueFull(Exception):
+    """The outbound queue is at capacity"""
+
+
+class TokenBucket:
+    """`rate` tokens per second with room for `burst`; `pause()` blocks it entirely (Retry-After)"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def take(self) -> float:
+        """Consume a token; returns 0, or the seconds to wait when none is available"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class Delivery:
+    __slots__ = ("id", "url", "text", "status", "attempts", "created_at", "sent_at", "error")
+
+    def __init__(self, url: str, text: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.url = url
+        self.text = text
+        self.status = "queued"
+        self.attempts = 0
+        self.created_at = time.time()
+        self.sent_at = None
+        self.error = None
+
+    def to_dict(self) -> dict:
+        return {
+            "notification_id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "created_at": self.created_at,
+            "sent_at": self.sent_at,
+            "error": self.error,
+        }
+
+
+class SlackDispatcher:
+    """Outbound queue + worker pool for Slack incoming webhooks"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 1000, max_attempts: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, rate_per_second: float = 1.0,
+                 burst: int = 3, timeout: float = 10.0, batch_max_chars: int = 3500, max_tracked: int = 1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.timeout = timeout
+        self.batch_max_chars = batch_max_chars
+        self.max_tracked = max_tracked
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(workers, 4))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._cond = threading.Condition()
+        self._heap = []                     # (ready_at monotonic, seq, Delivery)
+        self._seq = itertools.count()
+        self._buckets = {}                  # webhook url -> TokenBucket
+        self._deliveries = OrderedDict()    # recent deliveries by id (bounded)
+        self._threads = []
+        self._running = False
+        self.latency = Histogram("slack_post_seconds", STAGE_LATENCY_BUCKETS)
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batched = 0
+        self.throttled = 0
+
+    # --- lifecycle ---
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [threading.Thread(target=self._worker, name=f"slack-sender-{i}", daemon=True)
+                             for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        print(f"📤 Slack dispatcher: started {self.workers} senders")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the senders after flushing what is ready to go (up to `timeout`)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running and self._heap and self._heap[0][0] <= time.monotonic() < deadline:
+                self._cond.wait(0.1)
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout=max(deadline - time.monotonic(), 0.1))
+        print(f"📤 Slack dispatcher: stopped ({len(self._heap)} undelivered)")
+
+    # --- intake ---
+    def send(self, text: str, webhook_url: Optional[str] = None) -> Optional[str]:
+        """
+        Queue a message; returns its notification id, or None when no webhook is
+        configured. Never blocks on the network. Raises NotificationQueueFull.
+        """
+        url = webhook_url or os.getenv("SLACK_WEBHOOK_URL")
+        if not url:
+            return None
+        self.start()
+        delivery = Delivery(url, text)
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                raise NotificationQueueFull(f"Slack outbound queue is full ({self.max_queue} messages)")
+            self._track(delivery)
+            heapq.heappush(self._heap, (time.monotonic(), next(self._seq), delivery))
+            self._cond.notify()
+        return delivery.id
+
+    def get(self, notification_id: str) -> Optional[dict]:
+        with self._cond:
+            delivery = self._deliveries.get(notification_id)
+            return delivery.to_dict() if delivery is not None else None
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = len(self._heap)
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": queued,
+            "queue_capacity": self.max_queue,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batched": self.batched,
+            "throttled": self.throttled,
+            "rate_per_second": self.rate_per_second,
+            "post_latency": self.latency.snapshot(),
+        }
+
+    # --- workers ---
+    def _track(self, delivery: Delivery):
+        self._deliveries[delivery.id] = delivery
+        while len(self._deliveries) > self.max_tracked:
+            self._deliveries.popitem(last=False)
+
+    def _next_batch(self) -> Optional[list]:
+        """Wait for a ready delivery; returns it plus other ready ones for the same webhook"""
+        with self._cond:
+            while True:
+                if not self._running:
+                    return None
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+            first = heapq.heappop(self._heap)[2]
+            bucket = self._buckets.get(first.url)
+            if bucket is None:
+                bucket = self._buckets[first.url] = TokenBucket(self.rate_per_second, self.burst)
+            wait = bucket.take()
+            if wait > 0:
+                # Over the webhook's rate: push back instead of blocking the sender
+                self.throttled += 1
+                heapq.heappush(self._heap, (now + wait, next(self._seq), first))
+                return []
+
+            batch, size = [first], len(first.text)
+            for entry in sorted(self._heap):
+                ready_at, _, delivery = entry
+                if ready_at > now:
+                    break
+                if delivery.url != first.url or size + len(BATCH_SEPARATOR) + len(delivery.text) > self.batch_max_chars:
+                    continue
+                batch.append(delivery)
+                size += len(BATCH_SEPARATOR) + len(delivery.text)
+                self._heap.remove(entry)
+            if len(batch) > 1:
+                heapq.heapify(self._heap)
+                self.batched += len(batch) - 1
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                self._post(batch)
+
+    def _post(self, batch: list):
+        url = batch[0].url
+        text = BATCH_SEPARATOR.join(delivery.text for delivery in batch)
+        retry_after, error = None, None
+        started = time.monotonic()
+        try:
+            response = self.session.post(url, json={"text": text}, timeout=self.timeout)
+            self.latency.observe(time.monotonic() - started)
+            if response.status_code == 429:
+                retry_after = _retry_after_seconds(response, default=self.backoff_base)
+                error = f"rate limited by Slack (Retry-After {retry_after:.0f}s)"
+            elif response.status_code >= 500:
+                error = f"Slack returned {response.status_code}"
+            elif response.status_code >= 400:
+                # Bad webhook or payload: retrying will not help
+                self._finish(batch, "failed", f"Slack returned {response.status_code}: {response.text[:200]}")
+                return
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+
+        if error is None:
+            self._finish(batch, "sent")
+            return
+
+        with self._cond:
+            if retry_after is not None:
+                self._buckets[url].pause(retry_after)
+            for delivery in batch:
+                delivery.attempts += 1
+                delivery.error = error
+                if delivery.attempts >= self.max_attempts:
+                    delivery.status = "failed"
+                    self.failed += 1
+                    print(f"❌ Slack dispatcher: giving up on {delivery.id} after {delivery.attempts} attempts: {error}")
+                    continue
+                delay = retry_after if retry_after is not None else min(
+                    self.backoff_max, self.backoff_base * (2 ** (delivery.attempts - 1)) * random.uniform(0.8, 1.2))
+                delivery.status = "retrying"
+                self.retried += 1
+                heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), delivery))
+            self._cond.notify_all()
+        print(f"⚠️ Slack dispatcher: delivery failed, retrying: {error}")
+
+    def _finish(self, batch: list, status: str, error: Optional[str] = None):
+        now = time.time()
+        with self._cond:
+            for delivery in batch:
+                delivery.attempts += 1
+                delivery.status = status
+                delivery.error = error
+                if status == "sent":
+                    delivery.sent_at = now
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            self._cond.notify_all()
+        if error:
+            print(f"❌ Slack dispatcher: {error}")
+
+
+# --- DIGESTS ---
+DIGEST_SEVERITIES = ("critical", "high", "medium", "low")   # render order
+_SEVERITY_ICONS = {"critical": "🔴", "high": "🟠", "medium": "🟡", "low": "🔵"}
+
+
+class DigestAggregator:
+    """
+    Buffers notifications per (channel, severity) and sends compact digests.
+
+    A buffer is due when its oldest message is `window_seconds` old or it holds
+    `max_events` messages; critical buffers are due immediately. All due
+    buffers of a channel go out as one message, and at most `max_per_minute`
+    messages per channel are sent; anything beyond waits for the next slot.
+    `dispatcher` is anything with `send(text, channel)`: a SlackDispatcher
+    (channel = webhook URL) or a NotificationRouter (channel = sink name).
+    """
+
+    def __init__(self, dispatcher, window_seconds: float = 60.0, max_events: int = 20,
+                 max_per_minute: int = 6, max_lines: int = 15, tick_seconds: float = 1.0):
+        self.dispatcher = dispatcher
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.max_per_minute = max_per_minute
+        self.max_lines = max_lines
+        self.tick_seconds = tick_seconds
+        self._lock = threading.Lock()
+        self._buffers = {}                  # (channel, severity) -> list of (time, message)
+        self._sent_times = {}               # channel -> deque of send times (last minute)
+        self._stop = threading.Event()
+        self._thread = None
+        self.received = 0
+        self.digests_sent = 0
+
+    # --- lifecycle ---
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="slack-digest", daemon=True)
+        self._thread.start()
+        print(f"📰 Slack digest: flushing every {self.window_seconds:.0f}s, max {self.max_per_minute}/min per channel")
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=5.0)
+        self.flush(force=True)
+
+    # --- intake ---
+    def add(self, message: str, severity: str = "medium", channel: Optional[str] = None) -> bool:
+        """Buffer a message; returns False when no Slack channel is configured"""
+        channel = channel or os.getenv("SLACK_WEBHOOK_URL")
+        if not channel:
+            return False
+        severity = severity if severity in DIGEST_SEVERITIES else "medium"
+        self.start()
+        with self._lock:
+            self._buffers.setdefault((channel, severity), []).append((time.time(), message))
+            self.received += 1
+        if severity == "critical":
+            self.flush()
+        return True
+
+    def flush(self, force: bool = False):
+        """Send every due buffer (all buffers with `force`), one message per channel within the cap"""
+        now = time.time()
+        outgoing = []
+        with self._lock:
+            channels = {channel for channel, _ in self._buffers}
+            for channel in channels:
+                sent_times = self._sent_times.setdefault(channel, deque())
+                while sent_times and now - sent_times[0] > 60.0:
+                    sent_times.popleft()
+                if not force and len(sent_times) >= self.max_per_minute:
+                    continue
+                due = {}
+                for severity in DIGEST_SEVERITIES:
+                    events = self._buffers.get((channel, severity))
+                    if not events:
+                        continue
+                    if (force or severity == "critical" or len(events) >= self.max_events
+                            or now - events[0][0] >= self.window_seconds):
+                        due[severity] = events
+                if not due:
+                    continue
+                # Anything else pending for the channel rides along on the same message
+                for severity in DIGEST_SEVERITIES:
+                    events = self._buffers.pop((channel, severity), None)
+                    if events:
+                        due[severity] = events
+                sent_times.append(now)
+                outgoing.append((channel, due))
+        for channel, due in outgoing:
+            try:
+                self.dispatcher.send(self.render(due), channel)
+                self.digests_sent += 1
+            except NotificationQueueFull as e:
+                print(f"❌ Slack digest: dropped {sum(len(events) for events in due.values())} notifications: {e}")
+
+    def render(self, due: dict) -> str:
+        """Compact summary: identical messages collapsed with a count, most severe first"""
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')
+        total = sum(len(events) for events in due.values())
+        if total == 1:
+            message = next(iter(due.values()))[0][1]
+            return f"🤖 **DevOps Sentinel Agent**\n{message}\n⏰ {stamp}"
+
+        lines = [f"🤖 **DevOps Sentinel Agent — digest of {total} notifications**"]
+        shown = 0
+        for severity in DIGEST_SEVERITIES:
+            events = due.get(severity)
+            if not events:
+                continue
+            counts = OrderedDict()
+            for _, message in events:
+                counts[message] = counts.get(message, 0) + 1
+            lines.append(f"{_SEVERITY_ICONS[severity]} **{severity.upper()}** ({len(events)})")
+            for message, count in counts.items():
+                if shown >= self.max_lines:
+                    break
+                lines.append(f"• {message}" + (f" (×{count})" if count > 1 else ""))
+                shown += 1
+        distinct = sum(len({message for _, message in events}) for events in due.values())
+        if distinct > shown:
+            lines.append(f"…and {distinct - shown} more")
+        lines.append(f"⏰ {stamp}")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        with self._lock:
+            buffered = {severity: 0 for severity in DIGEST_SEVERITIES}
+            for (_, severity), events in self._buffers.items():
+                buffered[severity] += len(events)
+        return {
+            "window_seconds": self.window_seconds,
+            "max_events": self.max_events,
+            "max_per_minute": self.max_per_minute,
+            "received": self.received,
+            "digests_sent": self.digests_sent,
+            "buffered": buffered,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.tick_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Slack digest: flush failed: {e}")
+
+
+def _retry_after_seconds(response, default: float) -> float:
+    try:
+        return max(float(response.headers.get("Retry-After", default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_slack_dispatcher() -> SlackDispatcher:
+    """SlackDispatcher configured from SLACK_* environment variables"""
+    return SlackDispatcher(
+        workers=int(os.getenv("SLACK_SENDER_WORKERS", "2")),
+        max_queue=int(os.getenv("SLACK_QUEUE_SIZE", "1000")),
+        max_attempts=int(os.getenv("SLACK_MAX_ATTEMPTS", "5")),
+        backoff_base=float(os.getenv("SLACK_RETRY_BACKOFF_SECONDS", "1")),
+        rate_per_second=float(os.getenv("SLACK_RATE_PER_SECOND", "1")),
+        burst=int(os.getenv("SLACK_RATE_BURST", "3")),
+        batch_max_chars=int(os.getenv("SLACK_BATCH_MAX_CHARS", "3500")),
+    )
+
+
+def build_digest_aggregator(dispatcher) -> DigestAggregator:
+    """DigestAggregator configured from SLACK_DIGEST_* environment variables"""
+    return DigestAggregator(
+        dispatcher,
+        window_seconds=float(os.getenv("SLACK_DIGEST_WINDOW_SECONDS", "60")),
+        max_events=int(os.getenv("SLACK_DIGEST_MAX_EVENTS", "20")),
+        max_per_minute=int(os.getenv("SLACK_DIGEST_MAX_PER_MINUTE", "6")),
+    )
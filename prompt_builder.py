@@ -0,0 +1,324 @@
+# prompt_builder.py
+"""
+Token-budgeted prompt assembly for the RAG endpoints.
+
+Retrieved runbook chunks are ordered by similarity, de-duplicated (ingest.py
+splits with a 20 character overlap, so neighbouring chunks repeat text) and
+packed into a per-template token budget.
+"""
+
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# --- TOKEN COUNTING ---
+# Words and punctuation are counted separately; long words count as several
+# tokens (roughly one per 6 characters). This over-estimates Gemini's own
+# tokenizer slightly, which is the safe direction for a budget.
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_CHARS_PER_TOKEN = 6
+
+
+def _token_cost(piece: str) -> int:
+    return max(1, (len(piece) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN)
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in text"""
+    if not text:
+        return 0
+    return sum(_token_cost(m.group(0)) for m in _TOKEN_PATTERN.finditer(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Cut text at a token boundary so it (suffix included) fits in max_tokens"""
+    if not text or max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    limit = max_tokens - count_tokens(suffix)
+    used = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        used += _token_cost(match.group(0))
+        if used > limit:
+            return text[:match.start()].rstrip() + suffix
+    return text
+
+
+# --- PROMPT TEMPLATES ---
+# {context} is filled by the budgeter; every other field comes from the caller.
+PROMPT_TEMPLATES = {
+    "query": """
+You are a helpful and knowledgeable DevOps assistant. Based on the context provided below, answer the user's question in a clear, practical, and actionable way.
+
+Context from knowledge base:
+{context}
+
+User Question: {question}
+
+Instructions:
+- Provide a direct, helpful answer based on the context
+- Include specific steps or recommendations when applicable
+- If the context doesn't fully answer the question, mention what information is available
+- Keep the response practical and actionable for DevOps scenarios
+""",
+    "alert_trigger": """
+You are an expert DevOps incident response assistant. An alert has fired with the following details:
+
+**Alert Title:** {title}
+**Alert Message:** {message}
+
+Based on the runbook context below, provide a concise, actionable solution:
+
+**Runbook Context:**
+{context}
+
+Instructions:
+- Provide immediate action steps to resolve this alert
+- Include specific commands or procedures if available in the context
+- Prioritize critical actions first
+- Keep the response focused and actionable for incident response
+- If the context doesn't fully cover the alert, mention what steps are available
+""",
+    "process_alert": """
+You are an expert DevOps incident response assistant. An alert has fired with the following details:
+
+**Alert Name:** {alert_name}
+**Service:** {service_name}
+**Question:** {question}
+
+Based on the runbook context below, provide a concise, actionable solution:
+
+**Runbook Context:**
+{context}
+
+Instructions:
+- Provide immediate action steps to resolve this alert
+- Include specific commands or procedures if available in the context
+- Prioritize critical actions first
+- Keep the response focused and actionable for incident response
+""",
+    "grafana": "Context: {context}\n\nQuestion: {question}",
+}
+
+# Total prompt budget (template + fields + context) per template, in tokens.
+# Override with PROMPT_BUDGET_<TEMPLATE>, e.g. PROMPT_BUDGET_QUERY=1500
+DEFAULT_TOKEN_BUDGETS = {
+    "query": 1200,
+    "alert_trigger": 1000,
+    "process_alert": 1000,
+    "grafana": 600,
+}
+
+# How many candidate chunks the endpoints retrieve for the budgeter to choose from
+CANDIDATE_CHUNKS = int(os.getenv("PROMPT_CANDIDATE_CHUNKS", "5"))
+
+# Token length of each per-source preview in the `source_context` response field
+SOURCE_PREVIEW_TOKENS = int(os.getenv("SOURCE_PREVIEW_TOKENS", "75"))
+
+# Don't bother adding a truncated chunk with less room than this
+MIN_PARTIAL_CHUNK_TOKENS = 32
+
+# Two chunks sharing this fraction of word 3-grams are treated as duplicates
+DUPLICATE_SIMILARITY = 0.8
+
+CONTEXT_SEPARATOR = "\n\n"
+
+
+def get_token_budget(template_name: str) -> int:
+    """Token budget for a template, taking PROMPT_BUDGET_* overrides into account"""
+    env_value = os.getenv(f"PROMPT_BUDGET_{template_name.upper()}")
+    if env_value:
+        try:
+            return int(env_value)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid PROMPT_BUDGET_{template_name.upper()}={env_value!r}")
+    return DEFAULT_TOKEN_BUDGETS.get(template_name, 1000)
+
+
+# --- DATA STRUCTURES ---
+@dataclass
+class ContextChunk:
+    content: str
+    source: str
+    distance: float = 0.0
+
+    @property
+    def score(self) -> float:
+        """Cosine similarity (1 - cosine distance)"""
+        return 1.0 - float(self.distance)
+
+
+@dataclass
+class BuiltPrompt:
+    template: str
+    text: str
+    prompt_tokens: int
+    context_tokens: int
+    budget: int
+    chunks: List[ContextChunk] = field(default_factory=list)
+    dropped_chunks: int = 0
+
+    @property
+    def context(self) -> str:
+        return CONTEXT_SEPARATOR.join(chunk.content for chunk in self.chunks)
+
+
+# --- DE-DUPLICATION ---
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = text.lower().split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _strip_overlap(previous: str, candidate: str, min_overlap: int = 10) -> str:
+    """Remove a prefix of candidate that repeats the tail of previous"""
+    longest = min(len(previous), len(candidate))
+    for size in range(longest, min_overlap - 1, -1):
+        if previous.endswith(candidate[:size]):
+            return candidate[size:].lstrip()
+    return candidate
+
+
+def dedupe_chunks(chunks: List[ContextChunk]) -> List[ContextChunk]:
+    """
+    Order chunks by similarity and drop ones that repeat already-kept text.
+
+    Exact and contained duplicates are dropped, near-duplicates are detected
+    with word 3-gram overlap, and splitter overlap between neighbouring chunks
+    of the same source is trimmed off.
+    """
+    kept: List[ContextChunk] = []
+    kept_normalized: List[str] = []
+    kept_shingles: List[set] = []
+
+    for chunk in sorted(chunks, key=lambda c: c.distance):
+        content = (chunk.content or "").strip()
+        for previous in kept:
+            if content and previous.source == chunk.source:
+                content = _strip_overlap(previous.content, content)
+        normalized = _normalize(content)
+        if not normalized:
+            continue
+
+        if any(normalized in previous for previous in kept_normalized):
+            continue
+
+        shingles = _shingles(normalized)
+        is_duplicate = False
+        for previous_shingles in kept_shingles:
+            if not shingles or not previous_shingles:
+                continue
+            overlap = len(shingles & previous_shingles) / min(len(shingles), len(previous_shingles))
+            if overlap >= DUPLICATE_SIMILARITY:
+                is_duplicate = True
+                break
+        if is_duplicate:
+            continue
+
+        kept.append(ContextChunk(content=content, source=chunk.source, distance=chunk.distance))
+        kept_normalized.append(normalized)
+        kept_shingles.append(shingles)
+
+    return kept
+
+
+# --- PROMPT ASSEMBLY ---
+def _fit_fields(fields: dict, max_tokens: int) -> dict:
+    """Truncate fields so together they fit max_tokens; small fields keep their text, large ones share the rest"""
+    fitted = {}
+    remaining = max(max_tokens, 0)
+    by_size = sorted(fields.items(), key=lambda item: count_tokens(item[1]))
+    for i, (key, value) in enumerate(by_size):
+        share = remaining // (len(by_size) - i)
+        fitted[key] = truncate_to_tokens(value, share)
+        remaining -= count_tokens(fitted[key])
+    return {key: fitted[key] for key in fields}
+
+
+def build_prompt(template_name: str, chunks: List[ContextChunk],
+                 budget: Optional[int] = None, **fields) -> BuiltPrompt:
+    """
+    Fill a prompt template with as much retrieved context as fits the budget.
+
+    Chunks are taken best-first after de-duplication; the last chunk that only
+    partially fits is truncated at a token boundary. Caller supplied fields
+    (question, alert message, ...) share half of what the template leaves, so
+    huge fields cannot crowd out all of the context. The assembled prompt is
+    counted again and trimmed (context first, then fields) if it still runs
+    over the budget.
+    """
+    template = PROMPT_TEMPLATES[template_name]
+    budget = budget if budget is not None else get_token_budget(template_name)
+
+    fields = {key: str(value) for key, value in fields.items()}
+    template_tokens = count_tokens(template.format(context="", **{key: "" for key in fields}))
+    field_cap = (budget - template_tokens) // 2
+    fields = _fit_fields(fields, field_cap)
+
+    skeleton_tokens = count_tokens(template.format(context="", **fields))
+    remaining = budget - skeleton_tokens
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+
+    candidates = dedupe_chunks(chunks)
+    selected: List[ContextChunk] = []
+    for chunk in candidates:
+        cost = count_tokens(chunk.content) + (separator_tokens if selected else 0)
+        if cost <= remaining:
+            selected.append(chunk)
+            remaining -= cost
+            continue
+        room = remaining - (separator_tokens if selected else 0)
+        if room >= MIN_PARTIAL_CHUNK_TOKENS:
+            truncated = truncate_to_tokens(chunk.content, room)
+            selected.append(ContextChunk(content=truncated, source=chunk.source, distance=chunk.distance))
+        break
+
+    context = CONTEXT_SEPARATOR.join(chunk.content for chunk in selected)
+    text = template.format(context=context, **fields)
+    prompt_tokens = count_tokens(text)
+
+    # Pieces counted apart can come out a little different once joined; enforce the budget on the result
+    while prompt_tokens > budget:
+        overshoot = prompt_tokens - budget
+        if selected:
+            last = selected.pop()
+            keep = count_tokens(last.content) - overshoot
+            if keep >= MIN_PARTIAL_CHUNK_TOKENS:
+                selected.append(ContextChunk(content=truncate_to_tokens(last.content, keep),
+                                             source=last.source, distance=last.distance))
+        else:
+            field_tokens = sum(count_tokens(value) for value in fields.values())
+            if not field_tokens:
+                break  # the template alone is over the budget
+            fields = _fit_fields(fields, field_tokens - overshoot)
+        context = CONTEXT_SEPARATOR.join(chunk.content for chunk in selected)
+        text = template.format(context=context, **fields)
+        prompt_tokens = count_tokens(text)
+
+    return BuiltPrompt(
+        template=template_name,
+        text=text,
+        prompt_tokens=prompt_tokens,
+        context_tokens=count_tokens(context),
+        budget=budget,
+        chunks=selected,
+        dropped_chunks=len(chunks) - len(selected),
+    )
+
+
+def format_source_context(chunks: List[ContextChunk], max_sources: int = 3,
+                          preview_tokens: Optional[int] = None) -> str:
+    """Human readable list of the sources behind an answer, previews cut by tokens"""
+    preview_tokens = preview_tokens if preview_tokens is not None else SOURCE_PREVIEW_TOKENS
+    source_contexts = []
+    for i, chunk in enumerate(chunks[:max_sources]):
+        preview = truncate_to_tokens(chunk.content, preview_tokens)
+        source_contexts.append(f"Source {i+1}: {chunk.source}\n\nContext: {preview}")
+    return ("\n\n" + "=" * 50 + "\n\n").join(source_contexts)
@@ -0,0 +1,133 @@
+# singleflight.py
+"""
+Request coalescing ("single flight") for the RAG pipeline.
+
+Concurrent callers with the same key share one in-flight computation: the
+first caller runs it, everyone else waits for that result. Nothing is cached
+once the call finishes, so a later request always gets a fresh answer.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce duplicate calls made from worker threads (sync endpoints)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: str, fn):
+        """Run fn() for key, or wait for the identical call already running"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                is_leader = True
+
+        if not is_leader:
+            print(f"🔗 {self.name}: joined in-flight request ({call.waiters} waiting)")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"executions": self.executions, "shared": self.shared, "in_flight": in_flight}
+
+
+class AsyncSingleFlight:
+    """Coalesce duplicate calls made from async endpoints on the event loop"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: str, coro_fn):
+        """Await coro_fn() for key, or join the identical call already running"""
+        task = self._tasks.get(key)
+        if task is None:
+            # The work runs as its own task so a disconnecting first caller
+            # does not cancel it for everyone else who joined
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+        else:
+            self.shared += 1
+            print(f"🔗 {self.name}: joined in-flight request")
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "shared": self.shared, "in_flight": len(self._tasks)}
+
+
+# --- COALESCING KEYS ---
+_PUNCTUATION_TAIL = re.compile(r"[\s?!.]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace/trailing-punctuation insensitive form of a question"""
+    normalized = " ".join(str(question).lower().split())
+    return _PUNCTUATION_TAIL.sub("", normalized)
+
+
+def alert_fingerprint(alert: dict) -> str:
+    """Grafana/Alertmanager fingerprint, or a stable hash of the label set"""
+    if alert.get("fingerprint"):
+        return str(alert["fingerprint"])
+    labels = alert.get("labels", {}) or {}
+    encoded = json.dumps(labels, sort_keys=True, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def payload_key(request_data: dict) -> str:
+    """Coalescing key for a /process-input/ style payload"""
+    if "question" in request_data:
+        return "question:" + normalize_question(request_data["question"])
+    if "alerts" in request_data:
+        fingerprints = sorted(alert_fingerprint(alert) for alert in request_data.get("alerts") or []
+                              if isinstance(alert, dict))
+        return f"alerts:{request_data.get('status', '')}:" + ",".join(fingerprints)
+    if "title" in request_data and "message" in request_data:
+        return "legacy:" + normalize_question(request_data["title"]) + "|" + normalize_question(request_data["message"])
+    encoded = json.dumps(request_data, sort_keys=True, default=str)
+    return "raw:" + hashlib.sha1(encoded.encode("utf-8")).hexdigest()
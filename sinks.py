@@ -0,0 +1,415 @@
+# sinks.py
+"""
+Outbound notification fan-out.
+
+A registry of named sinks (Slack webhooks, generic HTTP webhooks, a local
+JSONL file) plus routing rules by service / severity / kind. Every sink has
+its own bounded queue and workers, so a slow or failing sink only backs up
+itself; `publish()` only enqueues and never waits on the network.
+
+Configuration is JSON, from NOTIFICATION_SINKS (inline) or
+NOTIFICATION_SINKS_FILE (path):
+
+    {
+      "sinks": [
+        {"name": "slack-main", "type": "slack", "url_env": "SLACK_WEBHOOK_URL"},
+        {"name": "payments", "type": "slack", "url": "https://hooks.slack.com/..."},
+        {"name": "pager", "type": "webhook", "url": "https://example.com/hook", "headers": {}},
+        {"name": "audit", "type": "file", "path": "./data/notifications.jsonl"}
+      ],
+      "routes": [
+        {"sinks": ["payments"], "services": ["payments", "billing"]},
+        {"sinks": ["pager"], "min_severity": "critical", "kinds": ["alert"]},
+        {"sinks": ["audit"]}
+      ],
+      "default": ["slack-main"]
+    }
+
+A notification goes to the sinks of every matching route, or to `default`
+when no route matches. Without configuration there is a single Slack sink
+on SLACK_WEBHOOK_URL that receives everything.
+"""
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from alerts import SEVERITY_PRIORITY, normalize_severity
+from notifier import NotificationQueueFull, SlackDispatcher, build_slack_dispatcher
+
+
+# --- SINKS ---
+class Sink:
+    """A named notification destination with its own queue and workers"""
+
+    kind = "sink"
+
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def submit(self, event: dict) -> Optional[str]:
+        """Queue an event; returns a delivery id. Raises NotificationQueueFull."""
+        raise NotImplementedError
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        return None
+
+    def stats(self) -> dict:
+        return {}
+
+
+class SlackSink(Sink):
+    """Slack incoming webhook, delivered by a dedicated SlackDispatcher (pool, retries, rate limit, batching)"""
+
+    kind = "slack"
+
+    def __init__(self, name: str, url: Optional[str] = None, url_env: Optional[str] = None,
+                 dispatcher: Optional[SlackDispatcher] = None):
+        super().__init__(name)
+        self._url = url
+        self.url_env = url_env
+        self.dispatcher = dispatcher or build_slack_dispatcher()
+
+    @property
+    def url(self) -> Optional[str]:
+        # Environment lookups stay lazy so rotated webhooks are picked up
+        return self._url or (os.getenv(self.url_env) if self.url_env else None)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.url)
+
+    def start(self):
+        self.dispatcher.start()
+
+    def stop(self):
+        self.dispatcher.stop()
+
+    def submit(self, event: dict) -> Optional[str]:
+        return self.dispatcher.send(event["text"], self.url)
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        return self.dispatcher.get(delivery_id)
+
+    def stats(self) -> dict:
+        return self.dispatcher.stats()
+
+
+class QueuedSink(Sink):
+    """Bounded queue + worker threads + retry with backoff; subclasses implement `_deliver`"""
+
+    def __init__(self, name: str, workers: int = 1, max_queue: int = 1000, max_attempts: int = 3,
+                 backoff_base: float = 1.0, max_tracked: int = 500):
+        super().__init__(name)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.max_tracked = max_tracked
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._deliveries = OrderedDict()    # delivery id -> status dict (bounded)
+        self._threads = []
+        self._running = False
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [threading.Thread(target=self._worker, name=f"sink-{self.name}-{i}", daemon=True)
+                             for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            threads = list(self._threads)
+        for _ in threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+    def submit(self, event: dict) -> Optional[str]:
+        self.start()
+        delivery_id = uuid.uuid4().hex[:12]
+        try:
+            self._queue.put_nowait((delivery_id, event))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            raise NotificationQueueFull(f"sink {self.name} queue is full ({self._queue.maxsize} events)")
+        self._set_status(delivery_id, {"status": "queued", "attempts": 0})
+        return delivery_id
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        with self._lock:
+            status = self._deliveries.get(delivery_id)
+            return dict(status, notification_id=delivery_id) if status is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "type": self.kind,
+            "workers": self.workers,
+            "running": self._running,
+            "queued": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    def _set_status(self, delivery_id: str, status: dict):
+        with self._lock:
+            self._deliveries[delivery_id] = status
+            while len(self._deliveries) > self.max_tracked:
+                self._deliveries.popitem(last=False)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if not self._running:
+                    return
+                continue
+            delivery_id, event = item
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    self._deliver(event)
+                    self._set_status(delivery_id, {"status": "sent", "attempts": attempt, "sent_at": time.time()})
+                    with self._lock:
+                        self.delivered += 1
+                    break
+                except Exception as e:
+                    if attempt == self.max_attempts:
+                        self._set_status(delivery_id, {"status": "failed", "attempts": attempt, "error": str(e)})
+                        with self._lock:
+                            self.failed += 1
+                        print(f"❌ Sink {self.name}: giving up after {attempt} attempts: {e}")
+                    else:
+                        # Sleeping only holds up this sink's own worker
+                        self._set_status(delivery_id, {"status": "retrying", "attempts": attempt, "error": str(e)})
+                        time.sleep(self.backoff_base * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2))
+            if not self._running and self._queue.empty():
+                return
+
+    def _deliver(self, event: dict):
+        raise NotImplementedError
+
+
+class WebhookSink(QueuedSink):
+    """Generic HTTP webhook receiving the event as JSON"""
+
+    kind = "webhook"
+
+    def __init__(self, name: str, url: str, headers: Optional[dict] = None, timeout: float = 5.0, **options):
+        super().__init__(name, **options)
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.workers, 2))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _deliver(self, event: dict):
+        response = self.session.post(self.url, json=event, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FileSink(QueuedSink):
+    """Appends events as JSON lines to a local file (single writer thread)"""
+
+    kind = "file"
+
+    def __init__(self, name: str, path: str, **options):
+        options["workers"] = 1
+        super().__init__(name, **options)
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _deliver(self, event: dict):
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(event, default=str) + "\n")
+
+
+# --- ROUTING ---
+class Route:
+    """Matches notifications by service, minimum severity and kind (unset fields match everything)"""
+
+    __slots__ = ("sinks", "services", "min_severity", "kinds")
+
+    def __init__(self, sinks: List[str], services: Optional[List[str]] = None,
+                 min_severity: Optional[str] = None, kinds: Optional[List[str]] = None):
+        self.sinks = list(sinks)
+        self.services = set(services) if services else None
+        self.min_severity = normalize_severity(min_severity) if min_severity else None
+        self.kinds = set(kinds) if kinds else None
+
+    def matches(self, services: set, severity: str, kind: str) -> bool:
+        if self.services is not None and not (self.services & services):
+            return False
+        if self.min_severity is not None and SEVERITY_PRIORITY[severity] < SEVERITY_PRIORITY[self.min_severity]:
+            return False
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        return True
+
+
+class NotificationRouter:
+    """Sink registry + routing rules; fans each notification out to its sinks' queues"""
+
+    def __init__(self, sinks: List[Sink], routes: Optional[List[Route]] = None,
+                 default: Optional[List[str]] = None):
+        self.sinks = OrderedDict((sink.name, sink) for sink in sinks)
+        self.routes = routes or []
+        self.default = default if default is not None else list(self.sinks)
+        for name in [n for route in self.routes for n in route.sinks] + self.default:
+            if name not in self.sinks:
+                raise ValueError(f"Notification route refers to unknown sink '{name}'")
+        self.published = 0
+        self.unrouted = 0
+
+    @property
+    def configured(self) -> bool:
+        return any(sink.configured for sink in self.sinks.values())
+
+    def start(self):
+        for sink in self.sinks.values():
+            if sink.configured:
+                sink.start()
+
+    def stop(self):
+        for sink in self.sinks.values():
+            sink.stop()
+
+    def targets(self, service=None, severity: str = "medium", kind: str = "alert") -> List[str]:
+        """Sink names for a notification; `service` may be one service or a list of them"""
+        severity = normalize_severity(severity)
+        services = {service} if isinstance(service, str) else set(service or [])
+        names = []
+        for route in self.routes:
+            if route.matches(services, severity, kind):
+                names.extend(name for name in route.sinks if name not in names)
+        return [name for name in (names or self.default) if self.sinks[name].configured]
+
+    def publish(self, text: str, service=None, severity: str = "medium", kind: str = "alert") -> List[str]:
+        """
+        Queue a notification on every routed sink; returns "sink:delivery" ids.
+        Raises NotificationQueueFull only when every target sink rejected it.
+        """
+        event = {"text": text, "service": service, "severity": normalize_severity(severity),
+                 "kind": kind, "timestamp": time.time()}
+        targets = self.targets(service, severity, kind)
+        if not targets:
+            self.unrouted += 1
+            return []
+        delivery_ids, errors = [], []
+        for name in targets:
+            try:
+                delivery_id = self.sinks[name].submit(event)
+                if delivery_id:
+                    delivery_ids.append(f"{name}:{delivery_id}")
+            except NotificationQueueFull as e:
+                errors.append(str(e))
+                print(f"⚠️ Notification not queued on sink {name}: {e}")
+        self.published += 1
+        if errors and not delivery_ids:
+            raise NotificationQueueFull("; ".join(errors))
+        return delivery_ids
+
+    def send(self, text: str, channel: str) -> Optional[str]:
+        """Deliver pre-rendered text to one sink by name (used by the agent digest)"""
+        delivery_id = self.sinks[channel].submit({"text": text, "kind": "digest", "timestamp": time.time()})
+        return f"{channel}:{delivery_id}" if delivery_id else None
+
+    def wait(self, delivery_ids: List[str], timeout: float, poll_interval: float = 0.1) -> dict:
+        """
+        Block until every delivery is sent or failed, or `timeout` passes;
+        returns delivery id -> last known status ("unknown" once no longer tracked)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            statuses = {delivery_id: (self.get(delivery_id) or {}).get("status", "unknown")
+                        for delivery_id in delivery_ids}
+            if all(status in ("sent", "failed", "unknown") for status in statuses.values()) \
+                    or time.monotonic() >= deadline:
+                return statuses
+            time.sleep(poll_interval)
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        name, _, sink_delivery_id = delivery_id.partition(":")
+        sink = self.sinks.get(name)
+        if sink is None or not sink_delivery_id:
+            return None
+        status = sink.get(sink_delivery_id)
+        return dict(status, notification_id=delivery_id, sink=name) if status is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "unrouted": self.unrouted,
+            "routes": len(self.routes),
+            "default": self.default,
+            "sinks": {name: {"type": sink.kind, "configured": sink.configured, **sink.stats()}
+                      for name, sink in self.sinks.items()},
+        }
+
+
+def build_notification_router(default_slack: SlackDispatcher) -> NotificationRouter:
+    """Router from NOTIFICATION_SINKS / NOTIFICATION_SINKS_FILE, or a single Slack sink on SLACK_WEBHOOK_URL"""
+    raw = os.getenv("NOTIFICATION_SINKS")
+    path = os.getenv("NOTIFICATION_SINKS_FILE")
+    if not raw and path:
+        with open(path, encoding="utf-8") as handle:
+            raw = handle.read()
+    if not raw:
+        return NotificationRouter([SlackSink("slack", url_env="SLACK_WEBHOOK_URL", dispatcher=default_slack)])
+
+    config = json.loads(raw)
+    sinks = []
+    for spec in config.get("sinks", []):
+        spec = dict(spec)
+        name, sink_type = spec.pop("name"), spec.pop("type")
+        if sink_type == "slack":
+            # The primary webhook shares the dispatcher used by /notify-slack/
+            shared = spec.get("url_env") == "SLACK_WEBHOOK_URL" and not spec.get("url")
+            sinks.append(SlackSink(name, url=spec.get("url"), url_env=spec.get("url_env"),
+                                   dispatcher=default_slack if shared else None))
+        elif sink_type == "webhook":
+            sinks.append(WebhookSink(name, **spec))
+        elif sink_type == "file":
+            sinks.append(FileSink(name, **spec))
+        else:
+            raise ValueError(f"Unknown notification sink type '{sink_type}' for sink '{name}'")
+    routes = [Route(**route) for route in config.get("routes", [])]
+    router = NotificationRouter(sinks, routes, config.get("default"))
+    print(f"📡 Notification sinks: {', '.join(f'{s.name} ({s.kind})' for s in sinks)}; {len(routes)} routes")
+    return router
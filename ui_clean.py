@@ -341,6 +341,42 @@ def get_agent_status():
     except:
         return False
 
+ALERT_METRICS_ENDPOINT = f"{API_BASE_URL}/alerts/metrics"
+TREND_RANGES = {"Last 6 hours": 6, "Last 24 hours": 24, "Last 7 days": 24 * 7, "Last 30 days": 24 * 30}
+
+def render_alert_trends():
+    """Alert counts over time from /alerts/metrics (bucketed server-side, no raw records)"""
+    st.subheader("📈 Alert Trends")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        range_label = st.selectbox("Time range", list(TREND_RANGES), key="trend_range")
+    with col2:
+        group_by = st.selectbox("Group by", ["alert_type", "service", "severity"], key="trend_group_by")
+
+    try:
+        response = requests.get(ALERT_METRICS_ENDPOINT,
+                                params={"hours": TREND_RANGES[range_label], "group_by": group_by}, timeout=10)
+        if response.status_code != 200:
+            st.warning(f"⚠️ Alert metrics unavailable ({response.status_code})")
+            return
+        metrics = response.json()
+    except Exception as e:
+        st.warning(f"⚠️ Alert metrics unavailable: {str(e)}")
+        return
+
+    if not metrics.get("total"):
+        st.info("📭 No alerts in this time range")
+        return
+
+    st.metric("Alerts", metrics["total"])
+    # Top series only, so the chart stays readable
+    chart = {"time": [time.strftime("%Y-%m-%d %H:%M", time.localtime(t)) for t in metrics["timestamps"]]}
+    for series in metrics["series"][:8]:
+        chart[series["group"].get(group_by, "all")] = series["counts"]
+    st.caption(f"Per {metrics['resolution']} buckets")
+    st.bar_chart(chart, x="time")
+
 def render_agent_dashboard():
     """Render agent dashboard page"""
     
@@ -358,6 +394,10 @@ def render_agent_dashboard():
     with col3:
         st.metric("Patterns Learned", len(agent_data.get("learned_patterns", {})))
     
+    # Alert volume, rendered from the API's pre-aggregated buckets (the only
+    # alert panel; the others show agent actions and learned patterns)
+    render_alert_trends()
+
     # Recent autonomous actions
     st.subheader("🔄 Recent Autonomous Actions")
     